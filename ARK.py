@@ -14,22 +14,33 @@ from discord.ext import commands, tasks
 from discord import app_commands
 import aiohttp
 import aiosqlite
+import asyncio
 import os
 import sys
+import time
 import json
 import random
 import io
-from datetime import datetime, timezone, timedelta
+import functools
+import itertools
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from typing import List, Optional, Dict
 from dotenv import load_dotenv
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-import matplotlib.dates as mdates
 
 # Ensure repo root is on sys.path so 'data' and 'cogs' packages resolve
 # when running as `python ARK.py` from the repo root directory.
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from cogs.server_snapshot import ServerSnapshot, SnapshotDiff, merge_snapshot_events
+from cogs.event_bus import EventBus
+from cogs.official_feed import OfficialFeed
+from cogs.fleet_history import FleetHistory
+from cogs.chart_render import ChartRenderer, ChartQueueFull, RenderCache, render_popgraph
+from cogs.rest_scheduler import RateLimitTrace, RestScheduler, channel_route
+from cogs.vc_renamer import VoiceRenameManager
+from cogs.pop_alerts import PopAlertIndex, pack_alert_messages
+
 load_dotenv()
 
 # --- CONFIGURATION ---
@@ -42,117 +53,910 @@ class Config:
     FAVORITES_FILE = os.path.join(BASE_DIR, "favorites.json")
     
     OFFICIAL_API = "https://cdn2.arkdedicated.com/servers/asa/officialserverlist.json"
+    # Adaptive poll interval for OFFICIAL_API (see cogs/official_feed.py)
+    OFFICIAL_POLL_BASE = 60.0
+    OFFICIAL_POLL_MAX = 180.0
+    # An unchanged snapshot is republished this often, so monitor samples and fleet
+    # history rows keep coming. Plus one OFFICIAL_POLL_MAX it must stay under
+    # DatabaseEngine.RUN_MAX_GAP, or a quiet list would read as bot downtime.
+    SNAPSHOT_HEARTBEAT = 300.0
     EVO_API = "https://cdn2.arkdedicated.com/asa/dynamicconfig.ini"
     ALERT_THRESHOLD = 8
+    ALERT_SEND_ATTEMPTS = 3            # per pop-alert message, on 5xx / network errors (429s always retry)
     POP_ALERTS_FILE = os.path.join(BASE_DIR, "pop_alerts.json")
+    STATE_FLUSH_DELAY = 2.0            # seconds triggered-flag flips wait to be written together
+
+    # Population of every official server, one row per published snapshot (see cogs/fleet_history.py)
+    FLEET_HISTORY_DIR = os.path.join(BASE_DIR, "fleet_history")
+    FLEET_HISTORY_DAYS = 30
+
+    # server_stats retention (see DatabaseEngine.maintain_stats): runs for STATS_RAW_DAYS,
+    # 15-minute rollups for STATS_15M_DAYS, hourly and daily rollups forever.
+    STATS_RAW_DAYS = 14
+    STATS_15M_DAYS = 180
+    STATS_MAINTENANCE_HOURS = 6
+
+    # How often report_metrics logs event-bus subscriber timings
+    METRICS_LOG_MINUTES = 30
+
+    # SQLite connection pool / tuning (see DatabaseEngine)
+    DB_READ_POOL_SIZE = 3
+    DB_CACHE_KIB = 4096                # page cache per connection
+    DB_MMAP_BYTES = 64 * 1024 * 1024   # shared via the OS page cache, not per-connection heap
+
+    # /popgraph render pool (see cogs/chart_render.py)
+    CHART_WORKERS = int(os.getenv("CHART_WORKERS", "1"))
+    CHART_QUEUE_SIZE = 4               # renders queued or running before /popgraph says "busy"
+    CHART_CACHE_BYTES = 8 * 1024 * 1024  # rendered PNGs kept in memory (pod limit is 256Mi)
+
+    # Voice counter renames (see cogs/vc_renamer.py): Discord allows ~2 per 10 min per channel
+    VC_RENAME_BUDGET = 2
+    VC_RENAME_WINDOW = 600.0
 
 # --- DATABASE ENGINE ---
 class DatabaseEngine:
-    def __init__(self, db_path):
+    """
+    Owns one long-lived writer connection and a small pool of reader
+    connections. Opening a connection spawns a thread and re-reads the file
+    header, which dominated /serverstats and autocomplete latency on the Pi,
+    so connections are opened once in initialize() and closed in close().
+    WAL lets the readers run while the writer is mid-transaction.
+    """
+
+    # Per-connection tuning, applied once when the connection is opened.
+    _CONNECTION_PRAGMAS = (
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        f"PRAGMA cache_size=-{Config.DB_CACHE_KIB}",
+        f"PRAGMA mmap_size={Config.DB_MMAP_BYTES}",
+    )
+
+    def __init__(self, db_path, read_pool_size: int = Config.DB_READ_POOL_SIZE):
         self.db_path = db_path
+        self._read_pool_size = max(1, read_pool_size)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: list[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        # Serialises multi-statement write transactions on the shared writer.
+        self._write_lock = asyncio.Lock()
+        self._server_id_cache: dict[str, int] = {}
+        # server_id → [ts, last_ts, player_count, max_players] of its newest run.
+        self._open_runs: dict[int, list[int]] = {}
+        # Newest sample ts per server name — lets callers check freshness without a query.
+        self._latest_ts: dict[str, int] = {}
+        # Write-behind triggered flags: (user_id, server_name) → triggered, see queue_pop_alerts_triggered.
+        self._pending_triggered: dict[tuple[int, str], bool] = {}
+        self._flush_timer: Optional[asyncio.Task] = None
+
+    async def _open(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in self._CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    @asynccontextmanager
+    async def _write(self):
+        """Exclusive use of the writer; rolls back if the block raises."""
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                # Ids handed out (and runs extended) inside the rolled-back transaction are gone too.
+                self._server_id_cache.clear()
+                self._open_runs.clear()
+                raise
+
+    @asynccontextmanager
+    async def _read(self):
+        """Borrow a reader connection from the pool for the duration of the block."""
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        """Write pending state, then close every pooled connection. Safe to call more than once."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._writer is not None:
+            await self.flush_state()
+        readers, self._readers, self._idle = self._readers, [], None
+        for conn in readers:
+            await conn.close()
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            await writer.close()
 
     async def initialize(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            # --- population-stats table (existing) ---
-            await db.execute('''CREATE TABLE IF NOT EXISTS server_stats
-                                (id INTEGER PRIMARY KEY AUTOINCREMENT, server_name TEXT,
-                                player_count INTEGER, max_players INTEGER,
-                                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            await db.execute('CREATE INDEX IF NOT EXISTS idx_server_time ON server_stats(server_name, timestamp)')
-
-            # --- player identity / tagging tables ---
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS tracked_players (
-                    player_id       TEXT PRIMARY KEY,
-                    display_name    TEXT NOT NULL,
-                    main_server     TEXT,
-                    tribe_tag       TEXT,
-                    custom_note     TEXT,
-                    tagged_by       TEXT,
-                    first_tagged_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    last_updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    tag_count       INTEGER  DEFAULT 1
+        self._writer = db = await self._open()
+        # journal_mode and auto_vacuum are persistent in the file; the rest were
+        # set by _open(). auto_vacuum only takes effect here on a new file (an
+        # existing one is converted by the VACUUM below).
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("PRAGMA journal_mode=WAL")
+
+        # --- population-stats tables ---
+        vacuum = await self._migrate_stats_schema(db)
+
+        # --- player identity / tagging tables ---
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS tracked_players (
+                player_id       TEXT PRIMARY KEY,
+                display_name    TEXT NOT NULL,
+                main_server     TEXT,
+                tribe_tag       TEXT,
+                custom_note     TEXT,
+                tagged_by       TEXT,
+                first_tagged_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                tag_count       INTEGER  DEFAULT 1
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_player_name ON tracked_players(display_name)')
+
+        # Append-only history — every /tag-player call writes a row so
+        # /player-info can show a real change log (tribe/server/name updates).
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS tag_history (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                player_id    TEXT    NOT NULL,
+                display_name TEXT    NOT NULL,
+                main_server  TEXT,
+                tribe_tag    TEXT,
+                custom_note  TEXT,
+                tagged_by    TEXT,
+                tagged_at    DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_history_player ON tag_history(player_id, tagged_at)')
+
+        # --- user state (formerly monitors.json / favorites.json / pop_alerts.json) ---
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS monitors (
+                server_name TEXT    PRIMARY KEY,
+                channel_id  INTEGER NOT NULL,
+                message_id  INTEGER NOT NULL,
+                vc_id       INTEGER
+            )
+        ''')
+        # rowid order is insertion order, which /fav_list preserves.
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS favorites (
+                user_id     INTEGER NOT NULL,
+                server_name TEXT    NOT NULL,
+                UNIQUE (user_id, server_name)
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_favorites_server ON favorites(server_name)')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS pop_alerts (
+                user_id     INTEGER NOT NULL,
+                server_name TEXT    NOT NULL,
+                threshold   INTEGER NOT NULL,
+                channel_id  INTEGER NOT NULL,
+                triggered   INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, server_name)
+            )
+        ''')
+        # Alerts are looked up per server (get_pop_alerts) in threshold order.
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_pop_alerts_server ON pop_alerts(server_name, threshold)')
+
+        await db.commit()
+        if vacuum:
+            # One rewrite for however many migration steps freed pages (or
+            # need the auto_vacuum change), instead of one per step.
+            await db.execute("VACUUM")
+
+        # Readers are opened after the schema exists so none of them start
+        # with a stale schema cookie.
+        self._idle = asyncio.Queue()
+        for _ in range(self._read_pool_size):
+            conn = await self._open()
+            await conn.execute("PRAGMA query_only=1")
+            self._readers.append(conn)
+            self._idle.put_nowait(conn)
+
+    # --- POPULATION STATS (schema v5) ---
+    #
+    #   servers          — dimension table, one integer server_id per name.
+    #   server_stats     — run-length samples, WITHOUT ROWID, clustered on
+    #                      (server_id, ts) with ts in integer epoch seconds. A row
+    #                      is a run of consecutive samples with the same
+    #                      player_count / max_players: first sample at ts, newest
+    #                      at last_ts, `samples` folded in, and `seconds` — how
+    #                      long the count stood, [ts, ts + seconds). A sample
+    #                      stands until the next one, at most RUN_MAX_GAP (a
+    #                      longer silence means the bot was down). Runs never
+    #                      cross an hour boundary, so each lies in one hourly bucket.
+    #   server_stats_15m — per server per 15 min / hour / day rollups
+    #   server_stats_1h    (samples, total, low, peak, seconds, weighted), upserted
+    #   server_stats_1d    by the same transaction that writes the runs. weighted
+    #                      is player-seconds, so averages are time-weighted:
+    #                      SUM(weighted) / SUM(seconds).
+    #
+    # Retention (maintain_stats): runs are kept for STATS_RAW_DAYS and 15-minute
+    # rows for STATS_15M_DAYS; hourly and daily rows are kept forever. Rollups
+    # are written at ingest, so expiring a tier only deletes rows. A window
+    # starting before the raw horizon loses at most its partial first hour.
+    #
+    # Off-peak populations sit still for long stretches, so most ticks extend a
+    # run in place instead of inserting a row.
+    #
+    # Analytics over a window read whole days and hours from the rollups and
+    # only touch runs for the partial hour at the start of the window, so
+    # cost is O(days + hours) no matter how long a server has been monitored.
+    #
+    # v1 stored the server name and a CURRENT_TIMESTAMP string on every row,
+    # plus an AUTOINCREMENT id and a (server_name, timestamp) index. v2 and v3
+    # stored one row per sample.
+
+    STATS_SCHEMA_VERSION = 5
+    MIGRATION_BATCH = 5000
+    # v3/v4 migrate only the hourly and daily tables; v5 adds the 15-minute one.
+    HOURLY_DAILY = (("server_stats_1h", 3600), ("server_stats_1d", 86400))
+    ROLLUPS = (("server_stats_15m", 900), *HOURLY_DAILY)
+    RUN_MAX_GAP = 600
+    # maintain_stats: rows per DELETE and pages per incremental_vacuum, each its own short transaction.
+    MAINTENANCE_BATCH = 2000
+    VACUUM_PAGES = 1000
+    # get_timeseries reads the coarsest level that still yields this many points.
+    TIMESERIES_POINTS = 500
+
+    async def _migrate_stats_schema(self, db: aiosqlite.Connection) -> bool:
+        """
+        Bring the population-stats tables up to STATS_SCHEMA_VERSION, one step
+        at a time. Returns True when a step left the file needing a VACUUM,
+        which initialize() runs once at the end.
+        """
+        async with db.execute("PRAGMA user_version") as cur:
+            version = (await cur.fetchone())[0]
+        vacuum = False
+        if version < 2:
+            vacuum |= await self._migrate_to_v2(db)
+        if version < 3:
+            await self._migrate_to_v3(db)
+        if version < 4:
+            vacuum |= await self._migrate_to_v4(db)
+        if version < 5:
+            vacuum |= await self._migrate_to_v5(db)
+        return vacuum
+
+    async def _migrate_to_v2(self, db: aiosqlite.Connection) -> bool:
+        """Create the v2 tables, converting a v1 server_stats table in place if present."""
+        async with db.execute("SELECT name FROM pragma_table_info('server_stats')") as cur:
+            columns = {r[0] for r in await cur.fetchall()}
+        if "server_name" in columns:
+            await db.execute("DROP INDEX IF EXISTS idx_server_time")
+            await db.execute("ALTER TABLE server_stats RENAME TO server_stats_v1")
+            await db.commit()
+
+        await db.execute('''CREATE TABLE IF NOT EXISTS servers
+                            (server_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)''')
+        await db.execute('''CREATE TABLE IF NOT EXISTS server_stats
+                            (server_id    INTEGER NOT NULL,
+                             ts           INTEGER NOT NULL,
+                             player_count INTEGER NOT NULL,
+                             max_players  INTEGER NOT NULL,
+                             PRIMARY KEY (server_id, ts)) WITHOUT ROWID''')
+        await db.commit()
+
+        # A v1 table left behind by an interrupted migration is picked up again
+        # here; the copy is idempotent, so restarting from the top is safe.
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='server_stats_v1'") as cur:
+            legacy = await cur.fetchone() is not None
+        if legacy:
+            await db.execute("INSERT OR IGNORE INTO servers (name) "
+                             "SELECT DISTINCT server_name FROM server_stats_v1 WHERE server_name IS NOT NULL")
+            async with db.execute("SELECT COALESCE(MAX(id), 0) FROM server_stats_v1") as cur:
+                last_id = (await cur.fetchone())[0]
+            # Small committed batches keep the write lock short and the WAL bounded.
+            for lo in range(0, last_id, self.MIGRATION_BATCH):
+                await db.execute(
+                    """
+                    INSERT OR REPLACE INTO server_stats (server_id, ts, player_count, max_players)
+                    SELECT s.server_id, CAST(strftime('%s', v.timestamp) AS INTEGER),
+                           COALESCE(v.player_count, 0), COALESCE(v.max_players, 0)
+                    FROM   server_stats_v1 v JOIN servers s ON s.name = v.server_name
+                    WHERE  v.id > ? AND v.id <= ? AND v.timestamp IS NOT NULL
+                    """,
+                    (lo, lo + self.MIGRATION_BATCH)
                 )
-            ''')
-            await db.execute('CREATE INDEX IF NOT EXISTS idx_player_name ON tracked_players(display_name)')
-
-            # Append-only history — every /tag-player call writes a row so
-            # /player-info can show a real change log (tribe/server/name updates).
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS tag_history (
-                    id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                    player_id    TEXT    NOT NULL,
-                    display_name TEXT    NOT NULL,
-                    main_server  TEXT,
-                    tribe_tag    TEXT,
-                    custom_note  TEXT,
-                    tagged_by    TEXT,
-                    tagged_at    DATETIME DEFAULT CURRENT_TIMESTAMP
+                await db.commit()
+                await asyncio.sleep(0)
+            await db.execute("DROP TABLE server_stats_v1")
+
+        await db.execute("PRAGMA user_version=2")
+        await db.commit()
+        # The pages of the v1 table and its index are free.
+        return legacy
+
+    async def _migrate_to_v3(self, db: aiosqlite.Connection):
+        """Create the hourly/daily rollup tables and backfill them from raw samples."""
+        for table, width in self.HOURLY_DAILY:
+            await db.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                                (server_id INTEGER NOT NULL,
+                                 bucket    INTEGER NOT NULL,
+                                 samples   INTEGER NOT NULL,
+                                 total     INTEGER NOT NULL,
+                                 low       INTEGER NOT NULL,
+                                 peak      INTEGER NOT NULL,
+                                 PRIMARY KEY (server_id, bucket)) WITHOUT ROWID''')
+            await db.execute(
+                f"""
+                INSERT OR REPLACE INTO {table} (server_id, bucket, samples, total, low, peak)
+                SELECT server_id, (ts / {width}) * {width}, COUNT(*),
+                       SUM(player_count), MIN(player_count), MAX(player_count)
+                FROM   server_stats
+                GROUP  BY server_id, ts / {width}
+                """
+            )
+        await db.execute("PRAGMA user_version=3")
+        await db.commit()
+
+    async def _migrate_to_v4(self, db: aiosqlite.Connection) -> bool:
+        """Fold per-sample rows into runs and add the time-weighted rollup columns."""
+        async def columns(table):
+            async with db.execute(f"SELECT name FROM pragma_table_info('{table}')") as cur:
+                return {r[0] for r in await cur.fetchall()}
+
+        if "last_ts" not in await columns("server_stats"):
+            await db.execute("ALTER TABLE server_stats RENAME TO server_stats_v3")
+            await db.commit()
+        await db.execute('''CREATE TABLE IF NOT EXISTS server_stats
+                            (server_id    INTEGER NOT NULL,
+                             ts           INTEGER NOT NULL,
+                             last_ts      INTEGER NOT NULL,
+                             player_count INTEGER NOT NULL,
+                             max_players  INTEGER NOT NULL,
+                             samples      INTEGER NOT NULL,
+                             seconds      INTEGER NOT NULL,
+                             PRIMARY KEY (server_id, ts)) WITHOUT ROWID''')
+        for table, _ in self.HOURLY_DAILY:
+            if "seconds" not in await columns(table):
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN seconds  INTEGER NOT NULL DEFAULT 0")
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN weighted INTEGER NOT NULL DEFAULT 0")
+        await db.commit()
+
+        # As in v2, an interrupted conversion starts over from the top: runs and
+        # rollups are rebuilt with INSERT OR REPLACE, one committed server at a time.
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='server_stats_v3'") as cur:
+            legacy = await cur.fetchone() is not None
+        if legacy:
+            async with db.execute("SELECT DISTINCT server_id FROM server_stats_v3") as cur:
+                server_ids = [r[0] for r in await cur.fetchall()]
+            for sid in server_ids:
+                # Gaps and islands: a new run starts wherever the count, the cap
+                # or the hour changes, or the previous sample is too old.
+                await db.execute(
+                    """
+                    WITH s AS (
+                        SELECT server_id, ts, player_count, max_players,
+                               LAG(ts)           OVER w AS prev_ts,
+                               LAG(player_count) OVER w AS prev_count,
+                               LAG(max_players)  OVER w AS prev_max,
+                               MIN(COALESCE(LEAD(ts) OVER w - ts, 0), :gap) AS held
+                        FROM   server_stats_v3
+                        WHERE  server_id = :sid
+                        WINDOW w AS (ORDER BY ts)
+                    ),
+                    r AS (
+                        SELECT *, SUM(CASE WHEN player_count = prev_count AND max_players = prev_max
+                                            AND ts - prev_ts <= :gap AND ts / 3600 = prev_ts / 3600
+                                           THEN 0 ELSE 1 END) OVER (ORDER BY ts) AS run
+                        FROM   s
+                    )
+                    INSERT OR REPLACE INTO server_stats
+                           (server_id, ts, last_ts, player_count, max_players, samples, seconds)
+                    SELECT server_id, MIN(ts), MAX(ts), player_count, max_players, COUNT(*), SUM(held)
+                    FROM   r
+                    GROUP  BY run
+                    """,
+                    {"sid": sid, "gap": self.RUN_MAX_GAP}
                 )
-            ''')
-            await db.execute('CREATE INDEX IF NOT EXISTS idx_history_player ON tag_history(player_id, tagged_at)')
+                for table, width in self.HOURLY_DAILY:
+                    await db.execute(
+                        f"""
+                        INSERT OR REPLACE INTO {table}
+                               (server_id, bucket, samples, total, low, peak, seconds, weighted)
+                        SELECT server_id, (ts / {width}) * {width}, SUM(samples), SUM(samples * player_count),
+                               MIN(player_count), MAX(player_count), SUM(seconds), SUM(seconds * player_count)
+                        FROM   server_stats
+                        WHERE  server_id = ?
+                        GROUP  BY ts / {width}
+                        """,
+                        (sid,)
+                    )
+                await db.commit()
+                await asyncio.sleep(0)
+            await db.execute("DROP TABLE server_stats_v3")
+
+        await db.execute("PRAGMA user_version=4")
+        await db.commit()
+        # The pages of the per-sample table are free.
+        return legacy
+
+    async def _migrate_to_v5(self, db: aiosqlite.Connection) -> bool:
+        """Add the 15-minute rollup and switch the file to incremental auto-vacuum."""
+        await db.execute('''CREATE TABLE IF NOT EXISTS server_stats_15m
+                            (server_id INTEGER NOT NULL,
+                             bucket    INTEGER NOT NULL,
+                             samples   INTEGER NOT NULL,
+                             total     INTEGER NOT NULL,
+                             low       INTEGER NOT NULL,
+                             peak      INTEGER NOT NULL,
+                             seconds   INTEGER NOT NULL DEFAULT 0,
+                             weighted  INTEGER NOT NULL DEFAULT 0,
+                             PRIMARY KEY (server_id, bucket)) WITHOUT ROWID''')
+        # Backfilled from existing runs by the quarter each run starts in, so a
+        # run's samples and time are not spread over the quarters it spans;
+        # runs written from now on are split at ingest.
+        await db.execute(
+            """
+            INSERT OR REPLACE INTO server_stats_15m
+                   (server_id, bucket, samples, total, low, peak, seconds, weighted)
+            SELECT server_id, (ts / 900) * 900, SUM(samples), SUM(samples * player_count),
+                   MIN(player_count), MAX(player_count), SUM(seconds), SUM(seconds * player_count)
+            FROM   server_stats
+            GROUP  BY server_id, ts / 900
+            """
+        )
+        await db.execute("PRAGMA user_version=5")
+        await db.commit()
+
+        # Files created before v5 have auto_vacuum=NONE; the INCREMENTAL mode
+        # set by initialize() only takes effect through a full VACUUM.
+        async with db.execute("PRAGMA auto_vacuum") as cur:
+            return (await cur.fetchone())[0] != 2
 
+    async def maintain_stats(self, raw_days: int = Config.STATS_RAW_DAYS,
+                             quarter_days: int = Config.STATS_15M_DAYS, now: int | None = None) -> dict:
+        """
+        Apply the retention tiers: delete runs older than raw_days and
+        15-minute rows older than quarter_days (hourly and daily rows are
+        kept forever), then return free pages to the filesystem and refresh
+        the planner statistics.
+
+        Every DELETE removes at most MAINTENANCE_BATCH rows of one server in
+        its own transaction, and every incremental_vacuum step at most
+        VACUUM_PAGES pages, yielding in between, so ingest never waits on
+        the write lock for more than one small batch.
+        """
+        now = int(time.time()) if now is None else int(now)
+        tiers = (
+            ("server_stats",     "ts",     now - raw_days * 86400),
+            ("server_stats_15m", "bucket", now - quarter_days * 86400),
+        )
+        deleted = {table: 0 for table, _, _ in tiers}
+
+        async with self._read() as db:
+            async with db.execute("SELECT server_id FROM servers") as cur:
+                server_ids = [r[0] for r in await cur.fetchall()]
+
+        for table, col, cutoff in tiers:
+            for sid in server_ids:
+                while True:
+                    async with self._write() as db:
+                        cur = await db.execute(
+                            f"""
+                            DELETE FROM {table}
+                            WHERE  server_id = :sid AND {col} IN (
+                                SELECT {col} FROM {table}
+                                WHERE  server_id = :sid AND {col} < :cutoff
+                                ORDER  BY {col} LIMIT :batch)
+                            """,
+                            {"sid": sid, "cutoff": cutoff, "batch": self.MAINTENANCE_BATCH}
+                        )
+                        n = cur.rowcount
+                        await db.commit()
+                        run = self._open_runs.get(sid)
+                        if table == "server_stats" and run is not None and run[0] < cutoff:
+                            # Its row is gone; the next sample starts a fresh run.
+                            del self._open_runs[sid]
+                    deleted[table] += n
+                    await asyncio.sleep(0)
+                    if n < self.MAINTENANCE_BATCH:
+                        break
+
+        freed: list[int] = []
+        while True:
+            async with self._write() as db:
+                async with db.execute("PRAGMA freelist_count") as cur:
+                    free = (await cur.fetchone())[0]
+                # Stop once nothing is left, or nothing moved (auto_vacuum not incremental).
+                if not free or (freed and free == freed[-1]):
+                    break
+                # Stepped once through execute(), the pragma frees a single page;
+                # executescript runs it to completion (and commits).
+                await db.executescript(f"PRAGMA incremental_vacuum({self.VACUUM_PAGES});")
+            freed.append(free)
+            await asyncio.sleep(0)
+        vacuumed = freed[0] - free if freed else 0
+
+        async with self._write() as db:
+            # analysis_limit bounds the rows ANALYZE reads per index.
+            await db.execute("PRAGMA analysis_limit=1000")
+            await db.execute("ANALYZE")
             await db.commit()
+            await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        return {"runs": deleted["server_stats"], "quarters": deleted["server_stats_15m"], "pages": vacuumed}
+
+    async def _server_ids(self, db: aiosqlite.Connection, names) -> dict[str, int]:
+        """Resolve (and create, on the writer) server_id for each name, via an in-memory map."""
+        missing = [n for n in set(names) if n not in self._server_id_cache]
+        if missing:
+            await db.executemany("INSERT OR IGNORE INTO servers (name) VALUES (?)", [(n,) for n in missing])
+            for n in missing:
+                async with db.execute("SELECT server_id FROM servers WHERE name = ?", (n,)) as cur:
+                    self._server_id_cache[n] = (await cur.fetchone())[0]
+        return self._server_id_cache
+
+    async def _load_open_runs(self, db: aiosqlite.Connection, server_ids):
+        """Cache the newest run of each server not seen since startup."""
+        for sid in set(server_ids) - self._open_runs.keys():
+            async with db.execute(
+                "SELECT ts, last_ts, player_count, max_players FROM server_stats "
+                "WHERE server_id = ? ORDER BY ts DESC LIMIT 1",
+                (sid,)
+            ) as cur:
+                row = await cur.fetchone()
+            if row:
+                self._open_runs[sid] = list(row)
 
-    async def record_stats(self, name: str, current: int, limit: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO server_stats (server_name, player_count, max_players) VALUES (?, ?, ?)",
-                             (name, current, limit))
+    async def record_stats(self, name: str, current: int, limit: int, ts: int | None = None):
+        await self.record_stats_many([(name, current, limit)], ts)
+
+    async def record_stats_many(self, rows: list[tuple[str, int, int]], ts: int | None = None):
+        """
+        Write one tick's (server_name, player_count, max_players) samples in a
+        single transaction — one COMMIT (and one fsync) per tick instead of one
+        per monitored server. ts is epoch seconds, defaulting to now; a sample
+        not newer than the server's previous one is ignored.
+
+        A sample equal to the server's open run extends that row in place;
+        otherwise it starts a new run. Either way the previous sample is
+        credited with the time it stood, up to RUN_MAX_GAP.
+        """
+        if not rows:
+            return
+        ts = int(time.time()) if ts is None else int(ts)
+        async with self._write() as db:
+            ids = await self._server_ids(db, (r[0] for r in rows))
+            await self._load_open_runs(db, (ids[r[0]] for r in rows))
+
+            extend, start = [], []
+            # (table, server_id, bucket) → [samples, total, low, peak, seconds, weighted]
+            deltas: dict[tuple[str, int, int], list[int]] = {}
+
+            def credit(sid, at, count, samples, seconds):
+                for table, width in self.ROLLUPS:
+                    d = deltas.setdefault((table, sid, at - at % width), [0, 0, count, count, 0, 0])
+                    d[0] += samples
+                    d[1] += samples * count
+                    d[2] = min(d[2], count)
+                    d[3] = max(d[3], count)
+                    d[4] += seconds
+                    d[5] += seconds * count
+
+            for name, current, limit in rows:
+                sid = ids[name]
+                run = self._open_runs.get(sid)
+                if run is not None and ts <= run[1]:
+                    continue
+                credit(sid, ts, current, 1, 0)
+                if run is not None:
+                    run_ts, last_ts, count, max_players = run
+                    held = min(ts - last_ts, self.RUN_MAX_GAP)
+                    # The previous sample stood from last_ts; the 15-minute bucket
+                    # may differ from run_ts's, the hour and day never do.
+                    credit(sid, last_ts, count, 0, held)
+                    if ((current, limit) == (count, max_players) and ts - last_ts <= self.RUN_MAX_GAP
+                            and ts // 3600 == run_ts // 3600):
+                        extend.append((ts, 1, held, sid, run_ts))
+                        run[1] = ts
+                        continue
+                    extend.append((last_ts, 0, held, sid, run_ts))
+                start.append((sid, ts, ts, current, limit))
+                self._open_runs[sid] = [ts, ts, current, limit]
+
+            await db.executemany(
+                "UPDATE server_stats SET last_ts = ?, samples = samples + ?, seconds = seconds + ? "
+                "WHERE server_id = ? AND ts = ?",
+                extend
+            )
+            await db.executemany(
+                "INSERT OR IGNORE INTO server_stats "
+                "(server_id, ts, last_ts, player_count, max_players, samples, seconds) "
+                "VALUES (?, ?, ?, ?, ?, 1, 0)",
+                start
+            )
+            for table, _ in self.ROLLUPS:
+                await db.executemany(
+                    f"""
+                    INSERT INTO {table} (server_id, bucket, samples, total, low, peak, seconds, weighted)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (server_id, bucket) DO UPDATE SET
+                        samples  = samples + excluded.samples,
+                        total    = total + excluded.total,
+                        low      = MIN(low, excluded.low),
+                        peak     = MAX(peak, excluded.peak),
+                        seconds  = seconds + excluded.seconds,
+                        weighted = weighted + excluded.weighted
+                    """,
+                    [(sid, bucket, *d) for (t, sid, bucket), d in deltas.items() if t == table]
+                )
             await db.commit()
+        for name, _, _ in rows:
+            self._note_latest(name, ts)
+
+    def _note_latest(self, name: str, ts: int):
+        if ts > self._latest_ts.get(name, 0):
+            self._latest_ts[name] = ts
+
+    def latest_sample(self, name: str) -> int | None:
+        """
+        Epoch seconds of the newest sample known for name, from memory only.
+        None until the server has been written or read since startup.
+        """
+        return self._latest_ts.get(name)
+
+    # Time-weighted mean over bucket rows; falls back to the sample mean while
+    # the only sample in range is a newest one that has not been credited yet.
+    @staticmethod
+    def _avg_sql(alias: str = "") -> str:
+        a = f"{alias}." if alias else ""
+        return (f"COALESCE(SUM({a}weighted) * 1.0 / NULLIF(SUM({a}seconds), 0), "
+                f"SUM({a}total) * 1.0 / NULLIF(SUM({a}samples), 0))")
+
+    @classmethod
+    def _window_buckets(cls, cutoff: int, server_filter: str, daily: bool = True) -> tuple[str, dict]:
+        """
+        SQL producing (server_id, bucket, samples, total, low, peak, seconds,
+        weighted) rows that together cover exactly the time after cutoff:
+
+          runs         (cutoff, hour_edge)      cut at cutoff, grouped into hourly buckets
+          hourly rows  [hour_edge, day_edge)
+          daily rows   [day_edge, now]          (hourly rows instead when daily=False)
+
+        A run straddling cutoff contributes the seconds it stood after cutoff
+        and an estimate of its samples after cutoff (they are evenly spaced
+        in the run). Pass daily=False when grouping by hour-of-day, which daily
+        rows lose. server_filter restricts server_id, e.g. "server_id = :sid".
+        """
+        hour_edge = -(-cutoff // 3600) * 3600
+        day_edge  = -(-cutoff // 86400) * 86400 if daily else None
+        hourly_hi = "AND bucket < :day_edge" if daily else ""
+        sql = f"""
+            SELECT server_id, (ts / 3600) * 3600 AS bucket, SUM(n) AS samples, SUM(n * player_count) AS total,
+                   MIN(player_count) AS low, MAX(player_count) AS peak,
+                   SUM(held) AS seconds, SUM(held * player_count) AS weighted
+            FROM (
+                SELECT server_id, ts, player_count,
+                       CASE WHEN ts > :cutoff       THEN samples
+                            WHEN last_ts <= :cutoff THEN 0
+                            ELSE CAST(ROUND(samples * (last_ts - :cutoff) * 1.0 / (last_ts - ts)) AS INTEGER)
+                       END AS n,
+                       MAX(0, MIN(seconds, ts + seconds - :cutoff)) AS held
+                FROM   server_stats
+                WHERE  {server_filter} AND ts >= :hour_edge - 3600 - :max_gap AND ts < :hour_edge
+            )
+            WHERE  n > 0 OR held > 0
+            GROUP  BY server_id, ts / 3600
+            UNION ALL
+            SELECT server_id, bucket, samples, total, low, peak, seconds, weighted
+            FROM   server_stats_1h
+            WHERE  {server_filter} AND bucket >= :hour_edge {hourly_hi}
+        """
+        if daily:
+            sql += f"""
+            UNION ALL
+            SELECT server_id, bucket, samples, total, low, peak, seconds, weighted
+            FROM   server_stats_1d
+            WHERE  {server_filter} AND bucket >= :day_edge
+            """
+        return sql, {"cutoff": cutoff, "hour_edge": hour_edge, "day_edge": day_edge, "max_gap": cls.RUN_MAX_GAP}
 
     async def get_stats(self, name: str, hours: int = 24):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
-            async with db.execute("SELECT player_count FROM server_stats WHERE server_name = ? AND timestamp > ? ORDER BY timestamp", (name, cutoff)) as cursor:
+        cutoff = int(time.time()) - hours * 3600
+        buckets, params = self._window_buckets(cutoff, "server_id = :sid")
+        async with self._read() as db:
+            async with db.execute("SELECT server_id FROM servers WHERE name = ?", (name,)) as cursor:
+                row = await cursor.fetchone()
+            if not row: return None
+            params["sid"] = row['server_id']
+            async with db.execute(
+                f"""
+                SELECT SUM(samples) AS samples, {self._avg_sql()} AS avg,
+                       MAX(peak) AS peak, MIN(low) AS low
+                FROM   ({buckets})
+                """,
+                params
+            ) as cursor:
+                row = await cursor.fetchone()
+            if not row or not row['samples']: return None
+            async with db.execute(
+                "SELECT player_count FROM server_stats WHERE server_id = ? ORDER BY ts DESC LIMIT 1",
+                (params["sid"],)
+            ) as cursor:
+                current = (await cursor.fetchone())['player_count']
+            return {
+                "current": current, "avg": round(row['avg'], 1),
+                "peak": row['peak'], "low": row['low'], "samples": row['samples']
+            }
+
+    @classmethod
+    def _series_level(cls, hours: int, points: int) -> tuple[str, int] | None:
+        """The coarsest rollup giving at least points buckets over hours, or None for runs."""
+        for table, width in sorted(cls.ROLLUPS, key=lambda r: -r[1]):
+            if hours * 3600 // width >= points:
+                return table, width
+        return None
+
+    async def get_timeseries(self, name: str, hours: int = 24, points: int = TIMESERIES_POINTS):
+        """
+        Oldest-first [(epoch_seconds, player_count), ...] for the window, or None.
+
+        Short windows come from the runs: each becomes its first and newest
+        sample, so a flat stretch is drawn as a flat line without storing (or
+        returning) every sample in it. A window long enough to give points
+        buckets at 15 minutes, an hour or a day is read from the coarsest such
+        rollup instead, one (bucket start, time-weighted average, low, peak)
+        per bucket, so a month costs about as much as a day and a drop the
+        average smooths over survives in low. Retention never expires a tier
+        before windows stop selecting it.
+        """
+        cutoff = int(time.time()) - hours * 3600
+        level = self._series_level(hours, points)
+        if level:
+            return await self._rollup_series(name, cutoff, *level)
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT p.ts, p.last_ts, p.player_count FROM servers s "
+                "JOIN server_stats p ON p.server_id = s.server_id "
+                "WHERE s.name = ? AND p.ts > ? AND p.last_ts > ? "
+                "ORDER BY p.ts",
+                # Runs stay within one hour, so none that reaches the window starts before cutoff - 1h.
+                (name, cutoff - 3600, cutoff)
+            ) as cursor:
                 rows = await cursor.fetchall()
-                if not rows: return None
-                counts = [r['player_count'] for r in rows]
-                return {
-                    "current": counts[-1], "avg": round(sum(counts)/len(counts), 1),
-                    "peak": max(counts), "low": min(counts), "samples": len(counts)
-                }
-
-    async def get_timeseries(self, name: str, hours: int = 24):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        if not rows:
+            return None
+        self._note_latest(name, rows[-1]['last_ts'])
+        points = []
+        for r in rows:
+            if r['ts'] > cutoff:
+                points.append((r['ts'], r['player_count']))
+            if r['last_ts'] != r['ts']:
+                points.append((r['last_ts'], r['player_count']))
+        return points
+
+    async def _rollup_series(self, name: str, cutoff: int, table: str, width: int):
+        async with self._read() as db:
+            async with db.execute("SELECT server_id FROM servers WHERE name = ?", (name,)) as cursor:
+                row = await cursor.fetchone()
+            if not row: return None
+            sid = row['server_id']
             async with db.execute(
-                "SELECT player_count, timestamp FROM server_stats "
-                "WHERE server_name = ? AND timestamp > datetime('now', ?) "
-                "ORDER BY timestamp",
-                (name, f'-{hours} hours')
+                f"SELECT bucket, ROUND({self._avg_sql()}, 1) AS avg, MIN(low) AS low, MAX(peak) AS peak "
+                f"FROM {table} "
+                "WHERE server_id = ? AND bucket > ? GROUP BY bucket ORDER BY bucket",
+                (sid, cutoff - width)
             ) as cursor:
                 rows = await cursor.fetchall()
-                if not rows:
-                    return None
-                return [(r['timestamp'], r['player_count']) for r in rows]
+            if not rows: return None
+            async with db.execute(
+                "SELECT last_ts FROM server_stats WHERE server_id = ? ORDER BY ts DESC LIMIT 1", (sid,)
+            ) as cursor:
+                newest = await cursor.fetchone()
+        if newest:
+            self._note_latest(name, newest['last_ts'])
+        return [(r['bucket'], r['avg'], r['low'], r['peak']) for r in rows]
 
     async def get_scout_targets(self, min_avg: float = 3.0, min_samples: int = 24, days: int = 7) -> list:
         """
         Return servers whose weekly average population exceeds min_avg.
         Only servers that have been actively monitored via /monitor will appear —
-        record_stats is only called from update_monitors.
+        record_stats is only called from update_monitors. /raidwindow ranks the
+        whole fleet from FleetHistory.scout_targets first and only falls back
+        to this ranking (get_scout_targets_with_windows) when fleet history
+        yields no target.
         Results capped at 10, ordered by weekly avg descending.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        buckets, params = self._window_buckets(
+            int(time.time()) - days * 86400, "server_id IN (SELECT server_id FROM servers)"
+        )
+        params.update(min_avg=min_avg, min_samples=min_samples)
+        async with self._read() as db:
             async with db.execute(
-                """
-                SELECT server_name,
-                       ROUND(AVG(player_count), 1) AS weekly_avg,
-                       COUNT(*)                    AS total_samples
-                FROM   server_stats
-                WHERE  timestamp > datetime('now', ?)
-                GROUP  BY server_name
-                HAVING weekly_avg > ? AND total_samples >= ?
+                f"""
+                SELECT s.name                          AS server_name,
+                       ROUND({self._avg_sql('b')}, 1) AS weekly_avg,
+                       SUM(b.samples)                  AS total_samples
+                FROM   ({buckets}) b JOIN servers s ON s.server_id = b.server_id
+                GROUP  BY b.server_id
+                HAVING weekly_avg > :min_avg AND total_samples >= :min_samples
                 ORDER  BY weekly_avg DESC
                 LIMIT  10
                 """,
-                (f'-{days} days', min_avg, min_samples)
+                params
             ) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(r) for r in rows]
 
+    async def get_scout_targets_with_windows(
+        self, min_avg: float = 3.0, min_samples: int = 24, days: int = 7,
+        min_hour_samples: int = 3, limit: int = 10
+    ) -> list:
+        """
+        get_scout_targets() and get_quiet_window() for every target in one query.
+        Each entry carries a "window" key: dict(hour_utc, avg_pop, samples) or None.
+        The hourly buckets are shared by both aggregations, so raising limit
+        (e.g. top 50) adds rows to the result, not round-trips.
+        """
+        buckets, params = self._window_buckets(
+            int(time.time()) - days * 86400,
+            "server_id IN (SELECT server_id FROM servers)",
+            daily=False,
+        )
+        params.update(min_avg=min_avg, min_samples=min_samples,
+                      min_hour_samples=min_hour_samples, limit=limit)
+        async with self._read() as db:
+            async with db.execute(
+                f"""
+                WITH b AS ({buckets}),
+                targets AS (
+                    SELECT server_id,
+                           ROUND({self._avg_sql()}, 1) AS weekly_avg,
+                           SUM(samples)                 AS total_samples
+                    FROM   b
+                    GROUP  BY server_id
+                    HAVING weekly_avg > :min_avg AND total_samples >= :min_samples
+                    ORDER  BY weekly_avg DESC
+                    LIMIT  :limit
+                ),
+                hours AS (
+                    SELECT b.server_id,
+                           (b.bucket / 3600) % 24         AS hour_utc,
+                           ROUND({self._avg_sql('b')}, 1) AS avg_pop,
+                           SUM(b.samples)                 AS samples
+                    FROM   b JOIN targets t ON t.server_id = b.server_id
+                    GROUP  BY b.server_id, hour_utc
+                    HAVING samples >= :min_hour_samples
+                ),
+                ranked AS (
+                    SELECT *, ROW_NUMBER() OVER (
+                               PARTITION BY server_id ORDER BY avg_pop ASC, samples DESC
+                           ) AS rn
+                    FROM   hours
+                )
+                SELECT s.name AS server_name, t.weekly_avg, t.total_samples,
+                       r.hour_utc, r.avg_pop, r.samples
+                FROM   targets t
+                JOIN   servers s ON s.server_id = t.server_id
+                LEFT   JOIN ranked r ON r.server_id = t.server_id AND r.rn = 1
+                ORDER  BY t.weekly_avg DESC
+                """,
+                params
+            ) as cursor:
+                rows = await cursor.fetchall()
+        return [
+            {
+                "server_name": r['server_name'],
+                "weekly_avg": r['weekly_avg'],
+                "total_samples": r['total_samples'],
+                "window": (
+                    {"hour_utc": r['hour_utc'], "avg_pop": r['avg_pop'], "samples": r['samples']}
+                    if r['hour_utc'] is not None else None
+                ),
+            }
+            for r in rows
+        ]
+
     async def get_quiet_window(self, name: str, min_hour_samples: int = 3, days: int = 7) -> dict | None:
         """
         Find the UTC hour-of-day with the lowest average population for a server.
@@ -160,21 +964,25 @@ class DatabaseEngine:
         stray 0-pop sample would otherwise win as a false raid window.
         Returns dict(hour_utc, avg_pop, samples) or None.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        buckets, params = self._window_buckets(
+            int(time.time()) - days * 86400,
+            "server_id = (SELECT server_id FROM servers WHERE name = :name)",
+            daily=False,
+        )
+        params.update(name=name, min_hour_samples=min_hour_samples)
+        async with self._read() as db:
             async with db.execute(
-                """
-                SELECT CAST(strftime('%H', timestamp) AS INTEGER) AS hour_utc,
-                       ROUND(AVG(player_count), 1)                AS avg_pop,
-                       COUNT(*)                                   AS samples
-                FROM   server_stats
-                WHERE  server_name = ? AND timestamp > datetime('now', ?)
+                f"""
+                SELECT (bucket / 3600) % 24        AS hour_utc,
+                       ROUND({self._avg_sql()}, 1) AS avg_pop,
+                       SUM(samples)                AS samples
+                FROM   ({buckets})
                 GROUP  BY hour_utc
-                HAVING samples >= ?
+                HAVING samples >= :min_hour_samples
                 ORDER  BY avg_pop ASC, samples DESC
                 LIMIT  1
                 """,
-                (name, f'-{days} days', min_hour_samples)
+                params
             ) as cursor:
                 row = await cursor.fetchone()
                 return dict(row) if row else None
@@ -191,7 +999,7 @@ class DatabaseEngine:
         False if an existing one was updated. Also appends a row to tag_history
         so /player-info can show a real change log over time.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             async with db.execute(
                 "SELECT tag_count FROM tracked_players WHERE player_id = ?", (player_id,)
             ) as cur:
@@ -228,8 +1036,7 @@ class DatabaseEngine:
 
     async def get_player(self, player_id: str) -> dict | None:
         """Exact lookup by player_id."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(
                 "SELECT * FROM tracked_players WHERE player_id = ?", (player_id,)
             ) as cur:
@@ -238,8 +1045,7 @@ class DatabaseEngine:
 
     async def search_players(self, query: str, limit: int = 25) -> list:
         """Search by player_id (prefix) or display_name (substring), for autocomplete."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             q = query.strip()
             async with db.execute(
                 """SELECT player_id, display_name, tribe_tag, main_server
@@ -254,8 +1060,7 @@ class DatabaseEngine:
 
     async def get_tag_history(self, player_id: str, limit: int = 5) -> list:
         """Most recent tag_history entries for a player."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(
                 """SELECT display_name, main_server, tribe_tag, custom_note, tagged_by, tagged_at
                    FROM tag_history WHERE player_id = ?
@@ -265,6 +1070,200 @@ class DatabaseEngine:
                 rows = await cur.fetchall()
                 return [dict(r) for r in rows]
 
+    # --- USER STATE ---
+    #
+    # Monitors, favorites and pop alerts used to be whole JSON files held in
+    # memory and rewritten on every change. Each mutation is now one row.
+
+    async def import_json_state(self, monitors_path: str, favorites_path: str, pop_alerts_path: str):
+        """
+        One-time import of the legacy JSON files. Each file is renamed to
+        <name>.imported once its rows are committed, so this is a no-op afterwards.
+        """
+        def load(path):
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[IMPORT] {path} unreadable, left in place: {e}")
+                return None
+
+        monitors = load(monitors_path)
+        if monitors is not None:
+            async with self._write() as db:
+                await db.executemany(
+                    """INSERT OR REPLACE INTO monitors (server_name, channel_id, message_id, vc_id)
+                       VALUES (?,?,?,?)""",
+                    [(srv, m["channel_id"], m["message_id"], m.get("vc_id")) for srv, m in monitors.items()]
+                )
+                await db.commit()
+            os.replace(monitors_path, monitors_path + ".imported")
+
+        favorites = load(favorites_path)
+        if favorites is not None:
+            async with self._write() as db:
+                await db.executemany(
+                    "INSERT OR IGNORE INTO favorites (user_id, server_name) VALUES (?,?)",
+                    [(int(uid), srv) for uid, servers in favorites.items() for srv in servers]
+                )
+                await db.commit()
+            os.replace(favorites_path, favorites_path + ".imported")
+
+        pop_alerts = load(pop_alerts_path)
+        if pop_alerts is not None:
+            async with self._write() as db:
+                await db.executemany(
+                    """INSERT OR REPLACE INTO pop_alerts
+                       (user_id, server_name, threshold, channel_id, triggered)
+                       VALUES (?,?,?,?,?)""",
+                    [(int(uid), a["server"], a["threshold"], a["channel_id"], int(bool(a.get("triggered"))))
+                     for uid, alerts in pop_alerts.items() for a in alerts]
+                )
+                await db.commit()
+            os.replace(pop_alerts_path, pop_alerts_path + ".imported")
+
+    async def get_monitors(self) -> dict[str, dict]:
+        """server_name → {message_id, channel_id, vc_id} for every live monitor."""
+        async with self._read() as db:
+            async with db.execute("SELECT server_name, channel_id, message_id, vc_id FROM monitors") as cur:
+                rows = await cur.fetchall()
+        return {r["server_name"]: {"message_id": r["message_id"], "channel_id": r["channel_id"], "vc_id": r["vc_id"]}
+                for r in rows}
+
+    async def set_monitor(self, name: str, channel_id: int, message_id: int, vc_id: int | None):
+        async with self._write() as db:
+            await db.execute(
+                """INSERT INTO monitors (server_name, channel_id, message_id, vc_id) VALUES (?,?,?,?)
+                   ON CONFLICT (server_name) DO UPDATE SET
+                       channel_id = excluded.channel_id,
+                       message_id = excluded.message_id,
+                       vc_id      = excluded.vc_id""",
+                (name, channel_id, message_id, vc_id)
+            )
+            await db.commit()
+
+    async def remove_monitor(self, name: str):
+        async with self._write() as db:
+            await db.execute("DELETE FROM monitors WHERE server_name = ?", (name,))
+            await db.commit()
+
+    async def get_favorites(self, user_id: int) -> list[str]:
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT server_name FROM favorites WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ) as cur:
+                return [r[0] for r in await cur.fetchall()]
+
+    async def add_favorite(self, user_id: int, name: str) -> bool:
+        """False if the server was already a favorite."""
+        async with self._write() as db:
+            cur = await db.execute(
+                "INSERT OR IGNORE INTO favorites (user_id, server_name) VALUES (?,?)", (user_id, name)
+            )
+            await db.commit()
+            return cur.rowcount > 0
+
+    async def remove_favorite(self, user_id: int, name: str) -> bool:
+        async with self._write() as db:
+            cur = await db.execute(
+                "DELETE FROM favorites WHERE user_id = ? AND server_name = ?", (user_id, name)
+            )
+            await db.commit()
+            return cur.rowcount > 0
+
+    async def set_pop_alert(self, user_id: int, name: str, threshold: int, channel_id: int) -> bool:
+        """
+        Create or re-arm an alert. Returns True if it is new; an existing alert
+        keeps its channel and gets the new threshold, untriggered.
+        """
+        # A queued flip would otherwise overwrite the re-armed flag.
+        self._pending_triggered.pop((user_id, name), None)
+        async with self._write() as db:
+            async with db.execute(
+                "SELECT 1 FROM pop_alerts WHERE user_id = ? AND server_name = ?", (user_id, name)
+            ) as cur:
+                exists = await cur.fetchone() is not None
+            await db.execute(
+                """INSERT INTO pop_alerts (user_id, server_name, threshold, channel_id) VALUES (?,?,?,?)
+                   ON CONFLICT (user_id, server_name) DO UPDATE SET
+                       threshold = excluded.threshold,
+                       triggered = 0""",
+                (user_id, name, threshold, channel_id)
+            )
+            await db.commit()
+        return not exists
+
+    async def remove_pop_alert(self, user_id: int, name: str) -> bool:
+        self._pending_triggered.pop((user_id, name), None)
+        async with self._write() as db:
+            cur = await db.execute(
+                "DELETE FROM pop_alerts WHERE user_id = ? AND server_name = ?", (user_id, name)
+            )
+            await db.commit()
+            return cur.rowcount > 0
+
+    async def get_pop_alerts(self, name: str) -> list[dict]:
+        """Every alert on one server."""
+        async with self._read() as db:
+            async with db.execute(
+                """SELECT user_id, server_name, threshold, channel_id, triggered
+                   FROM pop_alerts WHERE server_name = ? ORDER BY threshold""",
+                (name,)
+            ) as cur:
+                return [dict(r) for r in await cur.fetchall()]
+
+    async def get_all_pop_alerts(self) -> list[dict]:
+        """Every alert, for building the in-memory PopAlertIndex at startup."""
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT user_id, server_name, threshold, channel_id, triggered FROM pop_alerts"
+            ) as cur:
+                return [dict(r) for r in await cur.fetchall()]
+
+    async def set_pop_alerts_triggered(self, changes: list[tuple[bool, int, str]]):
+        """Persist (triggered, user_id, server_name) flips from one alert tick in one transaction."""
+        if not changes:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE pop_alerts SET triggered = ? WHERE user_id = ? AND server_name = ?",
+                [(int(t), uid, name) for t, uid, name in changes]
+            )
+            await db.commit()
+
+    def queue_pop_alerts_triggered(self, changes: list[tuple[bool, int, str]],
+                                   delay: float = Config.STATE_FLUSH_DELAY):
+        """
+        Write-behind set_pop_alerts_triggered for check_pop_alerts. Flips are
+        merged per alert (only the newest state is kept) and written together
+        in one transaction delay seconds after the first; close() writes
+        whatever is still pending. PopAlertIndex is authoritative while the
+        bot runs, so nothing reads the table in between.
+        """
+        for t, uid, name in changes:
+            self._pending_triggered[(uid, name)] = bool(t)
+        if self._pending_triggered and (self._flush_timer is None or self._flush_timer.done()):
+            self._flush_timer = asyncio.get_running_loop().create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_timer = None  # flips from here on schedule the next write
+        # shield: a cancelled timer must not abandon a write in progress.
+        await asyncio.shield(self.flush_state())
+
+    async def flush_state(self):
+        """Write every queued triggered flag now."""
+        pending, self._pending_triggered = self._pending_triggered, {}
+        try:
+            await self.set_pop_alerts_triggered([(t, uid, name) for (uid, name), t in pending.items()])
+        except Exception as e:
+            # Keep them for the next flush, unless a newer flip has replaced them.
+            for key, t in pending.items():
+                self._pending_triggered.setdefault(key, t)
+            print(f"[ERROR] Flushing pop alert flags: {e}")
+
 # --- UI UTILITIES ---
 class EmbedFactory:
     @staticmethod
@@ -297,75 +1296,129 @@ class EmbedFactory:
 
 async def server_autocomplete(itxn: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
     cog = itxn.client.get_cog("ARKCog")
-    cache = cog.cache if cog else []
-    return [app_commands.Choice(name=s['Name'], value=s['Name']) 
-            for s in cache if current.lower() in s['Name'].lower()][:25]
+    if not cog:
+        return []
+    return [app_commands.Choice(name=s['Name'], value=s['Name'])
+            for s in cog.snapshot.search(current, limit=25)]
 
 # --- MAIN LOGIC ---
 class ARKCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = DatabaseEngine(Config.STATS_DB)
-        self.cache = []
-        self.monitors = self._load_json(Config.MONITORS_FILE)
-        self.favorites = self._load_json(Config.FAVORITES_FILE)
-        self.pop_alerts = self._load_json(Config.POP_ALERTS_FILE)
+        # Immutable, indexed server list — rebuilt wholesale by sync_cache, which
+        # then publishes (snapshot, diff vs. the previous one) on the "snapshot" topic.
+        self.snapshot = ServerSnapshot()
+        self.feed = OfficialFeed(Config.OFFICIAL_API, Config.OFFICIAL_POLL_BASE, Config.OFFICIAL_POLL_MAX)
+        self._published_at = 0.0  # time.time() of the newest snapshot event
+        self.bus = EventBus()
+        self.history = FleetHistory(Config.FLEET_HISTORY_DIR, Config.FLEET_HISTORY_DAYS)
+        # Live monitors, mirrored from the monitors table by cog_load (read every tick).
+        # Favorites are queried from the database when needed.
+        self.monitors: dict[str, dict] = {}
+        # Pop alerts by server and threshold, mirrored from the pop_alerts table by cog_load.
+        self.alerts = PopAlertIndex()
+        self._alert_seq = itertools.count()  # unique scheduler keys: alert messages never coalesce
         self.current_rates = "1.0"
         self.last_rates = None
+        self.charts = ChartRenderer(Config.CHART_WORKERS, Config.CHART_QUEUE_SIZE)
+        self.chart_cache = RenderCache(Config.CHART_CACHE_BYTES)
 
         # Rate-limit mitigations:
         #   _monitor_state  — fingerprint of last-patched embed data per server.
         #                     PATCH is skipped entirely when nothing meaningful changed.
-        #   _patch_backoff  — per-server datetime after which PATCHes may resume.
-        #                     Populated when Discord returns 429 on a message edit.
+        #   rest            — paced, coalescing queue for every embed edit and VC rename.
+        #   _message_handles — PartialMessage per monitor, edited directly so a PATCH
+        #                     costs one request instead of fetch_message + edit.
         self._monitor_state: dict[str, tuple] = {}
-        self._patch_backoff: dict[str, datetime] = {}
+        self._message_handles: dict[str, discord.PartialMessage] = {}
+        self.rest = RestScheduler()
+        # Buckets learn from the headers of every response (Bot passes the trace to discord.py).
+        self._rest_trace = getattr(bot, "rest_trace", None)
+        if self._rest_trace:
+            self._rest_trace.attach(self.rest)
+        self.vc_renames = VoiceRenameManager(Config.VC_RENAME_BUDGET, Config.VC_RENAME_WINDOW)
+
+    async def cog_load(self):
+        # Runs after setup_hook's db.initialize(), so the loops never see an unopened database.
+        await self.db.import_json_state(Config.MONITORS_FILE, Config.FAVORITES_FILE, Config.POP_ALERTS_FILE)
+        self.monitors = await self.db.get_monitors()
+        self.alerts = PopAlertIndex(await self.db.get_all_pop_alerts())
+        await self.history.run(self.history.open)
+
+        # Monitors, pop alerts and fleet history run the moment a new snapshot is
+        # published. An event still queued when the next arrives is folded into it (diffs merged).
+        for handler in (self.update_monitors, self.check_pop_alerts, self.record_history):
+            self.bus.subscribe("snapshot", handler, merge=merge_snapshot_events)
 
         self.sync_cache.start()
-        self.update_monitors.start()
         self.check_evo.start()
-        self.check_pop_alerts.start()
-
-    def _load_json(self, path):
-        if not os.path.exists(path): return {}
-        try:
-            with open(path, 'r') as f: return json.load(f)
-        except: return {}
-
-    def _save_json(self, path, data):
-        with open(path, 'w') as f: json.dump(data, f, indent=4)
-
-    @tasks.loop(seconds=60)
+        self.maintain_stats.start()
+        self.report_metrics.start()
+
+    async def cog_unload(self):
+        self.sync_cache.cancel()
+        self.check_evo.cancel()
+        self.maintain_stats.cancel()
+        self.report_metrics.cancel()
+        await self.bus.close()
+        await self.feed.close()
+        # Joins the history thread after its queued appends; not on the event loop.
+        await asyncio.to_thread(self.history.shutdown)
+        if self._rest_trace:
+            self._rest_trace.detach(self.rest)
+        self.rest.close()
+        self.charts.close()
+        await self.db.close()
+
+    @tasks.loop(seconds=Config.OFFICIAL_POLL_BASE)
     async def sync_cache(self):
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(Config.OFFICIAL_API, timeout=10) as r:
-                    if r.status == 200: self.cache = await r.json()
-            except: pass
-
-    @tasks.loop(seconds=90)
-    async def update_monitors(self):
+        # 304s and identical bodies come back as None: nothing to rebuild.
+        records = await self.feed.fetch()
+        if records is not None:
+            snapshot = ServerSnapshot(records)
+            diff, self.snapshot = snapshot.diff(self.snapshot), snapshot
+            self.bus.publish("snapshot", snapshot, diff)
+            self._published_at = time.time()
+        elif self.snapshot and self.feed.confirmed_at - self._published_at >= Config.SNAPSHOT_HEARTBEAT:
+            # Confirmed unchanged for a while (not merely unreachable): republish it
+            # with an empty diff so samples keep their cadence. Nothing is re-sent
+            # to Discord, since monitors and alerts only act on changes.
+            self.bus.publish("snapshot", self.snapshot, SnapshotDiff())
+            self._published_at = self.feed.confirmed_at
+        # Back off while the list is unchanged; return to the base cadence once it changes.
+        if self.feed.interval != self.sync_cache.seconds:
+            self.sync_cache.change_interval(seconds=self.feed.interval)
+
+    async def update_monitors(self, snapshot: ServerSnapshot, diff: SnapshotDiff):
         """
-        Refreshes live monitor embeds and voice-channel counters.
+        Snapshot subscriber: refreshes live monitor embeds and voice-channel counters.
 
         Rate-limit mitigations applied here:
-        - Interval raised from 60 s → 90 s to reduce PATCH frequency by ~33 %.
         - Dirty-check: embed is only PATCHed when the meaningful data fingerprint
           (player count, max players, in-game day, EVO rate) has changed since the
           last successful edit.  The footer timestamp is intentionally excluded from
           the fingerprint — it must not force a PATCH every tick.
-        - Per-server backoff: a 429 response sets self._patch_backoff[srv_id] to
-          Discord's retry_after time; that server is skipped until the window clears.
+        - Edits are not sent inline: they are queued on self.rest, which paces each
+          channel and the bot as a whole with token buckets, keeps only the newest
+          embed per message, and retries 429s once the bucket allows.
         - 404/403: the monitor entry is removed so the bot stops calling a deleted
           or inaccessible message forever.
         """
-        if not self.monitors or not self.cache:
+        if not self.monitors or not snapshot:
             return
 
-        now = datetime.now(timezone.utc)
+        # Map / IP / Port are not in the fingerprint; force a PATCH when they change.
+        if diff.relocated:
+            for srv_id in self.monitors:
+                node = snapshot.get(srv_id)
+                if node and node["Name"] in diff.relocated:
+                    self._monitor_state.pop(srv_id, None)
+
+        samples: list[tuple[str, int, int]] = []
 
         for srv_id, meta in list(self.monitors.items()):
-            node = next((s for s in self.cache if srv_id in s.get("Name", "")), None)
+            node = snapshot.get(srv_id)
             if not node:
                 continue
 
@@ -373,69 +1426,113 @@ class ARKCog(commands.Cog):
             max_pop  = node.get('MaxPlayers', 70)
             day_time = node.get('DayTime', '')
 
-            # Always record to DB — this is cheap and keeps analytics accurate.
-            await self.db.record_stats(srv_id, pop, max_pop)
+            # Always record to DB — collected here, flushed once after the loop.
+            samples.append((srv_id, pop, max_pop))
 
             # --- dirty-check: skip the PATCH if nothing meaningful has changed ---
             fingerprint = (pop, max_pop, day_time, self.current_rates)
-            if self._monitor_state.get(srv_id) == fingerprint:
-                # Data identical — skip the Discord PATCH entirely.
-                # Voice counter is still checked below (it has its own guard).
-                pass
-            else:
-                # --- per-server rate-limit backoff check ---
-                backoff_until = self._patch_backoff.get(srv_id)
-                if backoff_until and now < backoff_until:
-                    # Still in backoff window — defer this edit.
-                    pass
-                else:
-                    chan = self.bot.get_channel(meta["channel_id"])
-                    if chan:
-                        embed = EmbedFactory.create_monitor(node, self.current_rates)
-                        try:
-                            msg = await chan.fetch_message(meta["message_id"])
-                            await msg.edit(embed=embed)
-                            # Commit new fingerprint only after a confirmed successful edit.
-                            self._monitor_state[srv_id] = fingerprint
-                            self._patch_backoff.pop(srv_id, None)
-
-                        except discord.HTTPException as e:
-                            if e.status == 429:
-                                retry_after = getattr(e, 'retry_after', 5.0) or 5.0
-                                self._patch_backoff[srv_id] = now + timedelta(seconds=retry_after + 1)
-                                print(f"[RATE LIMIT] {srv_id}: backing off {retry_after:.1f}s")
-                            elif e.status == 404:
-                                # Message was deleted — clean up this monitor silently.
-                                self.monitors.pop(srv_id, None)
-                                self._monitor_state.pop(srv_id, None)
-                                self._save_json(Config.MONITORS_FILE, self.monitors)
-                            elif e.status == 403:
-                                # Bot lost channel access — stop hammering it.
-                                print(f"[ACCESS DENIED] {srv_id}: missing permissions, skipping")
-                            # Any other HTTP error is logged but does not crash the loop.
-                            else:
-                                print(f"[HTTP {e.status}] {srv_id}: {e.text}")
-                        except Exception as e:
-                            # Network error, timeout, etc. — non-fatal, try again next tick.
-                            print(f"[ERROR] update_monitors {srv_id}: {e}")
-
-            # --- voice-channel counter (already has its own dirty-check) ---
+            if self._monitor_state.get(srv_id) != fingerprint:
+                embed = EmbedFactory.create_monitor(node, self.current_rates)
+                self.rest.submit(
+                    channel_route("PATCH", meta['channel_id'], messages=True), f"msg:{meta['message_id']}",
+                    functools.partial(self._patch_monitor, srv_id, meta, embed),
+                    # Commit new fingerprint only after a confirmed successful edit.
+                    on_success=lambda _, s=srv_id, f=fingerprint: self._monitor_state.__setitem__(s, f),
+                    on_error=functools.partial(self._monitor_edit_failed, srv_id),
+                )
+
+            # --- voice-channel counter: only the latest name is kept per channel ---
             vc_id = meta.get("vc_id")
             if vc_id:
                 vc = self.bot.get_channel(vc_id)
                 if vc:
-                    new_name = f"{pop}/{max_pop} | {srv_id}"
-                    if vc.name != new_name:
-                        try:
-                            await vc.edit(name=new_name)
-                        except discord.HTTPException as e:
-                            if e.status == 429:
-                                retry_after = getattr(e, 'retry_after', 5.0) or 5.0
-                                print(f"[RATE LIMIT] VC {srv_id}: backing off {retry_after:.1f}s")
-                            elif e.status in (403, 404):
-                                pass  # VC deleted or access lost — harmless skip
-                        except Exception:
-                            pass
+                    self.vc_renames.request(vc_id, f"{pop}/{max_pop} | {srv_id}", vc.name)
+
+        # Renames go out only while the channel has rename budget, stalest first.
+        for vc_id, name in self.vc_renames.take_due():
+            vc = self.bot.get_channel(vc_id)
+            if vc is None:
+                self.vc_renames.forget(vc_id)
+                continue
+            self.rest.submit(
+                channel_route("PATCH", vc_id), f"vc:{vc_id}",
+                functools.partial(vc.edit, name=name),
+                on_success=lambda _, c=vc_id, n=name: self.vc_renames.done(c, n),
+                on_error=functools.partial(self._vc_rename_failed, vc_id),
+                on_rate_limited=functools.partial(self.vc_renames.rate_limited, vc_id),
+            )
+
+        # One transaction for the whole tick keeps analytics accurate at one fsync.
+        await self.db.record_stats_many(samples)
+
+    async def record_history(self, snapshot: ServerSnapshot, diff: SnapshotDiff):
+        """Snapshot subscriber: one fleet-wide population row per published snapshot."""
+        if snapshot:
+            counts = [(r["Name"], r.get("NumPlayers")) for r in snapshot.records]
+            await self.history.run(self.history.append, int(time.time()), counts)
+
+    def _history_name(self, server_number: str) -> str:
+        """FleetHistory is keyed by full server Name; resolve numbers through the snapshot."""
+        node = self.snapshot.get(server_number)
+        return node["Name"] if node else server_number
+
+    def _chart_version(self, server_number: str, from_db: bool) -> tuple:
+        """
+        Render-cache version of a /popgraph series: the newest sample of the
+        source that fed it. A fleet-history render also depends on SQLite
+        having too little for the window, so any new monitored sample
+        invalidates it too.
+        """
+        latest = self.db.latest_sample(server_number)
+        return ("db", latest) if from_db else ("fleet", self.history.last_ts, latest)
+
+    def _monitor_handle(self, srv_id: str, meta: dict) -> discord.PartialMessage:
+        """Editable handle for a monitor's message, built from its stored ids without a fetch."""
+        handle = self._message_handles.get(srv_id)
+        if handle is None or handle.id != meta["message_id"]:
+            channel = self.bot.get_partial_messageable(meta["channel_id"])
+            handle  = channel.get_partial_message(meta["message_id"])
+            self._message_handles[srv_id] = handle
+        return handle
+
+    async def _patch_monitor(self, srv_id: str, meta: dict, embed: discord.Embed):
+        try:
+            await self._monitor_handle(srv_id, meta).edit(embed=embed)
+        except discord.NotFound:
+            # The handle was never verified, so reconcile before giving up on the
+            # monitor: fetch_message raises NotFound again only if it is really gone.
+            self._message_handles.pop(srv_id, None)
+            chan = self.bot.get_channel(meta["channel_id"])
+            if chan is None:
+                raise
+            msg = await chan.fetch_message(meta["message_id"])
+            await msg.edit(embed=embed)
+            self._message_handles[srv_id] = msg
+
+    async def _monitor_edit_failed(self, srv_id: str, e: Exception):
+        if isinstance(e, discord.HTTPException):
+            if e.status == 404:
+                # Message was deleted — clean up this monitor silently.
+                self.monitors.pop(srv_id, None)
+                self._monitor_state.pop(srv_id, None)
+                self._message_handles.pop(srv_id, None)
+                await self.db.remove_monitor(srv_id)
+            elif e.status == 403:
+                # Bot lost channel access — stop hammering it.
+                print(f"[ACCESS DENIED] {srv_id}: missing permissions, skipping")
+            # Any other HTTP error is logged but does not crash the loop.
+            else:
+                print(f"[HTTP {e.status}] {srv_id}: {e.text}")
+        else:
+            # Network error, timeout, etc. — non-fatal, try again next tick.
+            print(f"[ERROR] update_monitors {srv_id}: {e}")
+
+    def _vc_rename_failed(self, vc_id: int, e: Exception):
+        if isinstance(e, discord.HTTPException) and e.status in (403, 404):
+            self.vc_renames.forget(vc_id)  # VC deleted or access lost — stop renaming it
+            return
+        self.vc_renames.failed(vc_id)
+        print(f"[ERROR] VC rename {vc_id}: {e}")
 
     @tasks.loop(minutes=10)
     async def check_evo(self):
@@ -452,38 +1549,74 @@ class ARKCog(commands.Cog):
                     self.last_rates = rate
             except: pass
 
-    @tasks.loop(seconds=60)
-    async def check_pop_alerts(self):
-        if not self.pop_alerts or not self.cache:
+    @tasks.loop(hours=Config.STATS_MAINTENANCE_HOURS)
+    async def maintain_stats(self):
+        """Expire population stats past their retention tier and reclaim the space."""
+        try:
+            started = time.perf_counter()
+            done = await self.db.maintain_stats()
+            print(f"[DB] Maintenance: {done['runs']} runs, {done['quarters']} 15m rows deleted, "
+                  f"{done['pages']} pages freed in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            print(f"[ERROR] Stats maintenance: {e}")
+
+    @tasks.loop(minutes=Config.METRICS_LOG_MINUTES)
+    async def report_metrics(self):
+        """Log feed traffic and per-subscriber timings, so a slow consumer shows up in the pod log."""
+        if self.report_metrics.current_loop == 0:
+            return  # nothing has been measured yet
+        print(f"[FEED] {self.feed.format_metrics()}")
+        for line in self.bus.format_metrics():
+            print(f"[BUS] {line}")
+
+    async def check_pop_alerts(self, snapshot: ServerSnapshot, diff: SnapshotDiff):
+        """Snapshot subscriber: re-checks only alerts on servers the diff touched."""
+        if not self.alerts:
             return
 
-        save_needed = False
-        for uid, alerts in self.pop_alerts.items():
-            for alert in alerts:
-                node = next((s for s in self.cache if alert["server"] in s.get("Name", "")), None)
-                if not node:
-                    continue
-                pop = node.get('NumPlayers') or 0
-                below = pop < alert["threshold"]
-
-                if below and not alert.get("triggered"):
-                    alert["triggered"] = True
-                    save_needed = True
-                    chan = self.bot.get_channel(alert["channel_id"])
-                    if chan:
-                        try:
-                            await chan.send(
-                                f"<@{uid}> **[POP ALERT]** **{alert['server']}** has dropped below "
-                                f"**{alert['threshold']}** players -- currently **{pop}** online."
-                            )
-                        except:
-                            pass
-                elif not below and alert.get("triggered"):
-                    alert["triggered"] = False
-                    save_needed = True
-
-        if save_needed:
-            self._save_json(Config.POP_ALERTS_FILE, self.pop_alerts)
+        # New / re-armed alert keys are evaluated in full and bound to the Name they
+        # resolve to; after that a key is only visited when its Name is in the diff.
+        # PopAlertIndex then bisects straight to the thresholds that were crossed.
+        flipped = []
+        due = set(self.alerts.unevaluated())
+        for name in diff.touched():
+            due.update(self.alerts.keys_for(name))
+        for srv in due:
+            node = snapshot.get(srv)
+            if not node:
+                continue
+            self.alerts.bind(node["Name"], srv)
+            pop = node.get('NumPlayers') or 0
+            flipped.extend((alert, pop) for alert in self.alerts.update(srv, pop))
+        if not flipped:
+            return
+
+        self.db.queue_pop_alerts_triggered([(a.triggered, a.user_id, a.server) for a, _ in flipped])
+
+        # One message per channel per tick (split only at the length limit), so a
+        # server crash that trips dozens of alerts in one channel is one send.
+        by_channel: dict[int, list] = {}
+        for alert, pop in flipped:
+            if alert.triggered:
+                by_channel.setdefault(alert.channel_id, []).append((alert, pop))
+        for channel_id, triggered in by_channel.items():
+            chan = self.bot.get_channel(channel_id)
+            if chan:
+                for content in pack_alert_messages(triggered):
+                    self._send_alert(chan, content)
+
+    def _send_alert(self, chan, content: str, attempt: int = 1):
+        """Queue an alert message; transient failures are re-queued up to ALERT_SEND_ATTEMPTS."""
+        def failed(e: Exception):
+            if isinstance(e, discord.HTTPException) and e.status < 500:
+                print(f"[HTTP {e.status}] pop alert to {chan.id}: {e.text}")
+            elif attempt < Config.ALERT_SEND_ATTEMPTS:
+                self._send_alert(chan, content, attempt + 1)
+            else:
+                print(f"[ERROR] pop alert to {chan.id} dropped after {attempt} attempts: {e}")
+
+        self.rest.submit(channel_route("POST", chan.id, messages=True), ("alert", next(self._alert_seq)),
+                         functools.partial(chan.send, content), on_error=failed)
 
     # --- COMMANDS ---
 
@@ -517,7 +1650,7 @@ class ARKCog(commands.Cog):
     async def monitor(self, itxn: discord.Interaction, server_number: str):
         await itxn.response.defer()
 
-        node = next((s for s in self.cache if server_number in s['Name']), None)
+        node = self.snapshot.get(server_number)
         if not node: return await itxn.followup.send("Server not found in API cache.")
 
         pop     = node.get('NumPlayers', 0)
@@ -545,14 +1678,16 @@ class ARKCog(commands.Cog):
                     await itxn.followup.send("Failed to create Voice Channel (check permissions).", ephemeral=True)
 
         self.monitors[server_number] = {"message_id": msg.id, "channel_id": itxn.channel_id, "vc_id": vc_id}
-        self._save_json(Config.MONITORS_FILE, self.monitors)
+        self._monitor_state.pop(server_number, None)
+        self._message_handles.pop(server_number, None)
+        await self.db.set_monitor(server_number, itxn.channel_id, msg.id, vc_id)
 
     @app_commands.command(name="serverpop", description="Check current status (One-time snapshot)")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def serverpop(self, itxn: discord.Interaction, server_number: str):
         await itxn.response.defer()
         
-        node = next((s for s in self.cache if server_number in s['Name']), None)
+        node = self.snapshot.get(server_number)
         if not node: return await itxn.followup.send("Server not found in API cache.")
 
         embed = EmbedFactory.create_monitor(node, self.current_rates)
@@ -563,10 +1698,15 @@ class ARKCog(commands.Cog):
     async def stopmonitor(self, itxn: discord.Interaction, server_number: str):
         if server_number in self.monitors:
             data = self.monitors.pop(server_number)
-            self._save_json(Config.MONITORS_FILE, self.monitors)
+            await self.db.remove_monitor(server_number)
+            self._monitor_state.pop(server_number, None)
+            handle = self._message_handles.pop(server_number, None)
+            if data.get("vc_id"): self.vc_renames.forget(data["vc_id"])
             try: 
                 if data.get("vc_id"): await self.bot.get_channel(data["vc_id"]).delete()
-                await (await self.bot.get_channel(data["channel_id"]).fetch_message(data["message_id"])).delete()
+                if handle is None or handle.id != data["message_id"]:
+                    handle = self.bot.get_partial_messageable(data["channel_id"]).get_partial_message(data["message_id"])
+                await handle.delete()
             except: pass
             await itxn.response.send_message(f"Stopped monitoring **{server_number}**.")
         else:
@@ -576,39 +1716,20 @@ class ARKCog(commands.Cog):
     @app_commands.describe(server_number="Server to watch", threshold="Alert when population drops below this number")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def popwatch(self, itxn: discord.Interaction, server_number: str, threshold: int):
-        uid = str(itxn.user.id)
-        if uid not in self.pop_alerts:
-            self.pop_alerts[uid] = []
-
-        existing = next((a for a in self.pop_alerts[uid] if a["server"] == server_number), None)
-        if existing:
-            existing["threshold"] = threshold
-            existing["triggered"] = False
-            msg = f"Updated alert for **{server_number}** — will ping when below **{threshold}** players."
-        else:
-            self.pop_alerts[uid].append({
-                "server": server_number,
-                "threshold": threshold,
-                "channel_id": itxn.channel_id,
-                "triggered": False
-            })
+        is_new = await self.db.set_pop_alert(itxn.user.id, server_number, threshold, itxn.channel_id)
+        self.alerts.set(itxn.user.id, server_number, threshold, itxn.channel_id)
+        if is_new:
             msg = f"Alert set for **{server_number}** — you will be pinged when population drops below **{threshold}** players."
-
-        self._save_json(Config.POP_ALERTS_FILE, self.pop_alerts)
+        else:
+            msg = f"Updated alert for **{server_number}** — will ping when below **{threshold}** players."
         await itxn.response.send_message(msg, ephemeral=True)
 
     @app_commands.command(name="popwatch_remove", description="Remove a population alert")
     @app_commands.describe(server_number="Server to stop watching")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def popwatch_remove(self, itxn: discord.Interaction, server_number: str):
-        uid = str(itxn.user.id)
-        if uid not in self.pop_alerts or not self.pop_alerts[uid]:
-            return await itxn.response.send_message("You have no active population alerts.", ephemeral=True)
-
-        before = len(self.pop_alerts[uid])
-        self.pop_alerts[uid] = [a for a in self.pop_alerts[uid] if a["server"] != server_number]
-        if len(self.pop_alerts[uid]) < before:
-            self._save_json(Config.POP_ALERTS_FILE, self.pop_alerts)
+        if await self.db.remove_pop_alert(itxn.user.id, server_number):
+            self.alerts.remove(itxn.user.id, server_number)
             await itxn.response.send_message(f"Removed pop alert for **{server_number}**.", ephemeral=True)
         else:
             await itxn.response.send_message(f"No alert found for **{server_number}**.", ephemeral=True)
@@ -616,27 +1737,23 @@ class ARKCog(commands.Cog):
     @app_commands.command(name="fav_add", description="Add server to favorites")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def fav_add(self, itxn: discord.Interaction, server_number: str):
-        uid = str(itxn.user.id)
-        if uid not in self.favorites: self.favorites[uid] = []
-        if server_number not in self.favorites[uid]:
-            self.favorites[uid].append(server_number)
-            self._save_json(Config.FAVORITES_FILE, self.favorites)
+        if await self.db.add_favorite(itxn.user.id, server_number):
             await itxn.response.send_message(f"Added **{server_number}** to favorites.")
         else:
             await itxn.response.send_message("Server is already in favorites.", ephemeral=True)
 
     @app_commands.command(name="fav_list", description="View your favorites")
     async def fav_list(self, itxn: discord.Interaction):
-        uid = str(itxn.user.id)
-        if uid not in self.favorites or not self.favorites[uid]:
+        favorites = await self.db.get_favorites(itxn.user.id)
+        if not favorites:
             return await itxn.response.send_message("You have no favorites.", ephemeral=True)
         
         rand_color = discord.Color(random.randint(0, 0xFFFFFF))
         embed = discord.Embed(title=f"{itxn.user.name}'s Favorites", color=rand_color)
         embed.set_footer(text="Designed by pwnedByJT") 
         
-        for srv in self.favorites[uid]:
-            node = next((s for s in self.cache if srv in s['Name']), None)
+        for srv in favorites:
+            node = self.snapshot.get(srv)
             status = f"[ONLINE] {node.get('NumPlayers')}/70" if node else "[OFFLINE]"
             embed.add_field(name=srv, value=status, inline=False)
         await itxn.response.send_message(embed=embed)
@@ -644,19 +1761,18 @@ class ARKCog(commands.Cog):
     @app_commands.command(name="fav_remove", description="Remove a server from favorites")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def fav_remove(self, itxn: discord.Interaction, server_number: str):
-        uid = str(itxn.user.id)
-        if uid not in self.favorites or server_number not in self.favorites[uid]:
+        if not await self.db.remove_favorite(itxn.user.id, server_number):
             return await itxn.response.send_message("Server not in your favorites.", ephemeral=True)
-        self.favorites[uid].remove(server_number)
-        self._save_json(Config.FAVORITES_FILE, self.favorites)
         await itxn.response.send_message(f"Removed **{server_number}** from favorites.")
 
     @app_commands.command(name="serverstats", description="View historical analytics")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def serverstats(self, itxn: discord.Interaction, server_number: str, hours: int = 24):
         await itxn.response.defer()
-        stats = await self.db.get_stats(server_number, hours)
-        if not stats: return await itxn.followup.send("No data recorded yet. Monitor the server first.")
+        # Monitored servers have their own samples; every other server falls back to fleet history.
+        stats = (await self.db.get_stats(server_number, hours)
+                 or await self.history.run(self.history.stats, self._history_name(server_number), hours))
+        if not stats: return await itxn.followup.send("No data recorded yet for this server.")
         
         rand_color = discord.Color(random.randint(0, 0xFFFFFF))
         embed = discord.Embed(title=f"Analytics: {server_number}", color=rand_color)
@@ -668,81 +1784,79 @@ class ARKCog(commands.Cog):
         embed.add_field(name="Samples", value=f"`{stats['samples']}`", inline=True)
         await itxn.followup.send(embed=embed)
 
-    @app_commands.command(name="popgraph", description="Visual population chart for a monitored server")
+    @app_commands.command(name="popgraph", description="Visual population chart for an official server")
     @app_commands.describe(server_number="Server to graph", hours="How many hours back to show (default 24)")
     @app_commands.autocomplete(server_number=server_autocomplete)
     async def popgraph(self, itxn: discord.Interaction, server_number: str, hours: int = 24):
         await itxn.response.defer()
 
-        rows = await self.db.get_timeseries(server_number, hours)
-        if not rows or len(rows) < 2:
-            return await itxn.followup.send(
-                "Not enough data to graph. Run `/monitor` on the server first to start collecting history."
-            )
+        # Served straight from memory while the source that fed the cached chart
+        # (recorded in its version) has no newer sample.
+        series = (server_number, hours)
+        previous = self.chart_cache.version(series)
+        from_db = previous is not None and previous[0] == "db"
+        cached = self.chart_cache.get(series, self._chart_version(server_number, from_db))
+        if cached:
+            png, stats = cached
+        else:
+            # Long windows come back as bucket averages, so the numbers are taken
+            # from the matching stats query, not from the plotted points.
+            rows = await self.db.get_timeseries(server_number, hours)
+            from_db = bool(rows) and len(rows) >= 2
+            if from_db:
+                stats = await self.db.get_stats(server_number, hours)
+            else:
+                name = self._history_name(server_number)
+                rows = await self.history.run(self.history.timeseries, name, hours)
+                stats = await self.history.run(self.history.stats, name, hours) if rows else None
+            if not rows or len(rows) < 2 or not stats:
+                return await itxn.followup.send(
+                    "Not enough data to graph yet. History is recorded for every server; try again in a few minutes."
+                )
 
-        # Parse timestamps — SQLite CURRENT_TIMESTAMP is space-separated, not ISO 'T'
-        timestamps = [datetime.strptime(r[0], '%Y-%m-%d %H:%M:%S') for r in rows]
-        counts = [r[1] for r in rows]
-        avg = sum(counts) / len(counts)
-        peak = max(counts)
-        low = min(counts)
-
-        # Pick line color by average population (mirrors EmbedFactory logic)
-        line_color = '#57f287' if avg < 40 else ('#fee75c' if avg < 65 else '#ed4245')
-
-        # Build chart — OO API only, no pyplot (headless-safe, no figure leak)
-        fig = Figure(figsize=(10, 4), dpi=110)
-        FigureCanvasAgg(fig)
-        ax = fig.add_subplot(111)
-
-        # Discord dark theme
-        fig.patch.set_facecolor('#2b2d31')
-        ax.set_facecolor('#1e1f22')
-
-        # Main line + fill
-        ax.plot(timestamps, counts, color=line_color, linewidth=2.2, zorder=3)
-        ax.fill_between(timestamps, counts, alpha=0.12, color=line_color)
-
-        # Reference lines
-        ax.axhline(avg,  color='#b5bac1', linewidth=0.9, linestyle='--', alpha=0.6, label=f'Avg {avg:.1f}')
-        ax.axhline(peak, color='#ed4245', linewidth=0.9, linestyle=':',  alpha=0.7, label=f'Peak {peak}')
-
-        # Axes styling
-        ax.set_ylim(0, 75)
-        ax.set_ylabel('Players', color='#b5bac1', fontsize=9)
-        ax.set_xlabel('Time (UTC)', color='#b5bac1', fontsize=9)
-        ax.tick_params(colors='#b5bac1', which='both', labelsize=8)
-        for spine in ax.spines.values():
-            spine.set_edgecolor('#3f4148')
-        ax.set_title(f'{server_number}  —  last {hours}h', color='#ffffff', fontsize=11, pad=10)
-        ax.legend(facecolor='#2b2d31', edgecolor='#3f4148', labelcolor='#b5bac1', fontsize=8)
-
-        # X-axis: show HH:MM, auto-rotate labels
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-        fig.autofmt_xdate(rotation=35, ha='right')
-        fig.tight_layout()
-
-        # Render to buffer
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', facecolor=fig.get_facecolor())
-        buf.seek(0)
+            # Rendered in the chart process pool — matplotlib never runs on the event loop.
+            # Identical concurrent requests (same window, same samples) share a render.
+            # Bucket-averaged rows also carry each bucket's low and peak for the band.
+            bucketed = len(rows[0]) > 2
+            try:
+                png = await self.charts.submit(
+                    (server_number, hours, rows[-1][0], stats["samples"]),
+                    render_popgraph,
+                    f'{server_number}  —  last {hours}h', [r[0] for r in rows], [r[1] for r in rows],
+                    stats["avg"], stats["peak"],
+                    [r[2] for r in rows] if bucketed else None,
+                    [r[3] for r in rows] if bucketed else None,
+                )
+            except ChartQueueFull:
+                return await itxn.followup.send("Chart renderer is busy — try again in a few seconds.")
+            except Exception as e:
+                # A crashed worker or a matplotlib error; the deferred response still needs an answer.
+                print(f"[ERROR] Popgraph render for {server_number}: {e!r}")
+                return await itxn.followup.send("Chart rendering failed — try again in a few seconds.")
+            # get_timeseries may have just learned the newest monitored sample.
+            self.chart_cache.put(series, self._chart_version(server_number, from_db), png, stats)
+        buf = io.BytesIO(png)
 
         # Stats embed with chart as image
         rand_color = discord.Color(random.randint(0, 0xFFFFFF))
         embed = discord.Embed(title=f"Population Chart: {server_number}", color=rand_color)
         embed.set_footer(text="Designed by pwnedByJT")
-        embed.add_field(name="Current", value=f"`{counts[-1]}`", inline=True)
-        embed.add_field(name="Average", value=f"`{avg:.1f}`",    inline=True)
-        embed.add_field(name="Peak",    value=f"`{peak}`",        inline=True)
-        embed.add_field(name="Low",     value=f"`{low}`",         inline=True)
-        embed.add_field(name="Samples", value=f"`{len(counts)}`", inline=True)
-        embed.add_field(name="Window",  value=f"`{hours}h`",      inline=True)
+        embed.add_field(name="Current", value=f"`{stats['current']}`", inline=True)
+        embed.add_field(name="Average", value=f"`{stats['avg']:.1f}`", inline=True)
+        embed.add_field(name="Peak",    value=f"`{stats['peak']}`",    inline=True)
+        embed.add_field(name="Low",     value=f"`{stats['low']}`",     inline=True)
+        embed.add_field(name="Samples", value=f"`{stats['samples']}`", inline=True)
+        embed.add_field(name="Window",  value=f"`{hours}h`",           inline=True)
         embed.set_image(url="attachment://pop.png")
 
         await itxn.followup.send(embed=embed, file=discord.File(buf, filename="pop.png"))
 
 class Bot(commands.Bot):
-    def __init__(self): super().__init__(command_prefix="!", intents=discord.Intents.all())
+    def __init__(self):
+        # Lets RestScheduler see the rate-limit headers discord.py keeps to itself.
+        trace = RateLimitTrace()
+        super().__init__(command_prefix="!", intents=discord.Intents.all(), http_trace=trace.config)
+        self.rest_trace = trace
     async def setup_hook(self):
         # Core monitoring cog
         cog = ARKCog(self)
@@ -8,9 +8,9 @@ Command: /targets
   population history to identify each server's lowest-traffic hour of the day
   — the ideal offline raid or scouting window.
 
-Why this is better than /raidwindow:
-  /raidwindow runs against locally-monitored servers only (requires /monitor).
-  /targets uses ArkStatus which tracks thousands of servers independently.
+Compared with /raidwindow:
+  /raidwindow only knows what this bot has recorded since it was deployed.
+  /targets uses ArkStatus, whose history predates the bot.
 
 Data flow:
   1. /servers?search=... — find candidate server IDs and current pop
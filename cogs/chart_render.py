@@ -0,0 +1,285 @@
+"""
+Module: cogs/chart_render.py
+Description: Off-event-loop PNG rendering for /popgraph.
+
+Building a matplotlib Figure, tight_layout() and savefig() take hundreds of
+milliseconds on the Pi. Run on the event loop, that stalls the gateway
+heartbeat and every monitor tick, so rendering happens in a dedicated
+process pool instead:
+
+  render_popgraph()  — pure function, executed inside a worker process.
+                       Takes plain ints/floats (cheap to pickle), returns PNG bytes.
+                       Series longer than the plot is wide are first reduced
+                       with lttb(), so render time is bounded by the figure,
+                       not by the window. Bucket-averaged series also pass
+                       each bucket's low and peak, drawn as a band reduced
+                       with envelope(), so a short drop still shows.
+  ChartRenderer      — owns the pool. Identical concurrent requests share one
+                       render, and at most max_pending renders may be queued or
+                       running; beyond that submit() raises ChartQueueFull so a
+                       burst of /popgraph calls fails fast instead of piling up.
+                       A pool broken by a dead worker (e.g. OOM-killed) is
+                       dropped, so the next render spawns a fresh one.
+  RenderCache        — byte-bounded LRU of finished PNGs. Each series (server,
+                       window) keeps only its newest version (newest sample
+                       timestamp), so a repeated /popgraph with no new data is
+                       served without touching SQLite or matplotlib.
+
+Workers use the 'spawn' start method: the bot process runs aiosqlite and
+aiohttp threads, and forking a multi-threaded process is not safe.
+
+Author: pwnedByJT
+"""
+
+import asyncio
+import io
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor  # BrokenProcessPool's base; no multiprocessing import
+from datetime import datetime, timezone
+from typing import Any, Callable, Hashable
+
+# matplotlib, numpy and multiprocessing are imported on first use, not here:
+# this module is imported by ARK.py at startup, and matplotlib alone was over
+# half of the bot's cold-start import time on the Pi.
+
+FIG_SIZE = (10, 4)
+FIG_DPI  = 110
+# One point per horizontal pixel: anything finer cannot be drawn anyway.
+MAX_POINTS = FIG_SIZE[0] * FIG_DPI
+
+
+# ---------------------------------------------------------------------------
+# WORKER-SIDE RENDERING
+# ---------------------------------------------------------------------------
+
+def lttb(xs: list[float], ys: list[float], n_out: int) -> tuple[list[float], list[float]]:
+    """
+    Largest-Triangle-Three-Buckets: n_out of the (xs, ys) points, chosen to
+    keep the shape of the line. The first and last points are kept; the rest
+    are split into n_out - 2 equal buckets, and each bucket keeps the point
+    forming the largest triangle with the point kept before it and the mean
+    of the next bucket. Unlike averaging or striding, a one-sample drop or
+    spike survives. Series of at most n_out points are returned unchanged.
+    """
+    import numpy as np
+    n = len(xs)
+    if n <= n_out or n_out < 3:
+        return list(xs), list(ys)
+    x = np.asarray(xs, dtype=np.float64)
+    y = np.asarray(ys, dtype=np.float64)
+    x = x - x[0]  # epoch seconds: keep the cross products well inside float64 precision
+
+    # Bucket edges over the interior points 1..n-2, and each bucket's mean.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / sizes
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    # Each choice depends on the previous one, so only the bucket loop stays in Python.
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return [xs[i] for i in keep.tolist()], [ys[i] for i in keep.tolist()]
+
+
+def envelope(xs: list[float], lows: list[float], peaks: list[float],
+             n_out: int) -> tuple[list[float], list[float], list[float]]:
+    """
+    Min/max decimation of a low–peak band: n_out equal chunks, each keeping
+    its first x, lowest low and highest peak. LTTB picks among values it is
+    given, and a bucket average has already flattened a short drop; the band
+    keeps every extreme. Series of at most n_out points are returned unchanged.
+    """
+    import numpy as np
+    n = len(xs)
+    if n <= n_out:
+        return list(xs), list(lows), list(peaks)
+    starts = np.linspace(0, n, n_out, endpoint=False).astype(np.int64)
+    return ([xs[i] for i in starts.tolist()],
+            np.minimum.reduceat(np.asarray(lows, dtype=np.float64), starts).tolist(),
+            np.maximum.reduceat(np.asarray(peaks, dtype=np.float64), starts).tolist())
+
+
+def render_popgraph(title: str, timestamps: list[int], counts: list[float],
+                    avg: float, peak: int, lows: list[float] | None = None,
+                    peaks: list[float] | None = None) -> bytes:
+    """
+    Population line chart in the Discord dark theme. timestamps are epoch
+    seconds (UTC). lows/peaks, when counts are bucket averages, are each
+    bucket's extremes and are shaded around the line.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.dates as mdates
+
+    band = envelope(timestamps, lows, peaks, MAX_POINTS) if lows and peaks else None
+    timestamps, counts = lttb(timestamps, counts, MAX_POINTS)
+    times = [datetime.fromtimestamp(t, timezone.utc) for t in timestamps]
+
+    # Pick line color by average population (mirrors EmbedFactory logic)
+    line_color = '#57f287' if avg < 40 else ('#fee75c' if avg < 65 else '#ed4245')
+
+    # Build chart — OO API only, no pyplot (headless-safe, no figure leak)
+    fig = Figure(figsize=FIG_SIZE, dpi=FIG_DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+
+    # Discord dark theme
+    fig.patch.set_facecolor('#2b2d31')
+    ax.set_facecolor('#1e1f22')
+
+    # Main line + fill
+    ax.plot(times, counts, color=line_color, linewidth=2.2, zorder=3)
+    ax.fill_between(times, counts, alpha=0.12, color=line_color)
+    if band:
+        band_times = [datetime.fromtimestamp(t, timezone.utc) for t in band[0]]
+        ax.fill_between(band_times, band[1], band[2], step='post', alpha=0.3, linewidth=0,
+                        color=line_color, label='Low–peak')
+
+    # Reference lines
+    ax.axhline(avg,  color='#b5bac1', linewidth=0.9, linestyle='--', alpha=0.6, label=f'Avg {avg:.1f}')
+    ax.axhline(peak, color='#ed4245', linewidth=0.9, linestyle=':',  alpha=0.7, label=f'Peak {peak}')
+
+    # Axes styling
+    ax.set_ylim(0, 75)
+    ax.set_ylabel('Players', color='#b5bac1', fontsize=9)
+    ax.set_xlabel('Time (UTC)', color='#b5bac1', fontsize=9)
+    ax.tick_params(colors='#b5bac1', which='both', labelsize=8)
+    for spine in ax.spines.values():
+        spine.set_edgecolor('#3f4148')
+    ax.set_title(title, color='#ffffff', fontsize=11, pad=10)
+    ax.legend(facecolor='#2b2d31', edgecolor='#3f4148', labelcolor='#b5bac1', fontsize=8)
+
+    # X-axis: show HH:MM, auto-rotate labels
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    fig.autofmt_xdate(rotation=35, ha='right')
+    fig.tight_layout()
+
+    # Render to buffer
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', facecolor=fig.get_facecolor())
+    return buf.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# EVENT-LOOP SIDE
+# ---------------------------------------------------------------------------
+
+class ChartQueueFull(Exception):
+    """Raised when max_pending renders are already queued or running."""
+
+
+class ChartRenderer:
+
+    def __init__(self, workers: int = 1, max_pending: int = 4) -> None:
+        self.workers     = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._pool = None  # ProcessPoolExecutor, created by _executor()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.stats = {"rendered": 0, "shared": 0, "rejected": 0, "broken": 0}
+
+    def _executor(self):
+        # Created on first use so cogs that never render never start a worker.
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def submit(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run fn(*args) in the pool. A request whose key matches one already in
+        flight awaits that render instead of starting another.
+        """
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats["shared"] += 1
+            return await asyncio.shield(fut)
+
+        if len(self._inflight) >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise ChartQueueFull(f"{len(self._inflight)} charts already rendering")
+
+        pool = self._executor()
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenExecutor:
+            self._discard(pool)
+            raise
+        self._inflight[key] = fut
+        try:
+            # shield: one caller being cancelled must not cancel the shared render.
+            result = await asyncio.shield(fut)
+            self.stats["rendered"] += 1
+            return result
+        except BrokenExecutor:
+            self._discard(pool)
+            raise
+        finally:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+    def _discard(self, pool) -> None:
+        """Forget a broken pool; a ProcessPoolExecutor never recovers from a dead worker."""
+        self.stats["broken"] += 1
+        if self._pool is pool:
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class RenderCache:
+    """LRU of rendered charts keyed by series, bounded by total PNG bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes    = 0
+        # series → (version, png, meta); most recently used last
+        self._entries: OrderedDict[Hashable, tuple[Hashable, bytes, Any]] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def version(self, series: Hashable) -> Hashable | None:
+        """Version of the cached render of series, if any (not counted as a hit or miss)."""
+        entry = self._entries.get(series)
+        return entry[0] if entry else None
+
+    def get(self, series: Hashable, version: Hashable) -> tuple[bytes, Any] | None:
+        """(png, meta) if the cached render of series is still at version, else None."""
+        entry = self._entries.get(series)
+        if entry is None or entry[0] != version:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(series)
+        self.stats["hits"] += 1
+        return entry[1], entry[2]
+
+    def put(self, series: Hashable, version: Hashable, png: bytes, meta: Any = None) -> None:
+        """Store a render, replacing any older version of the same series."""
+        old = self._entries.pop(series, None)
+        if old is not None:
+            self.nbytes -= len(old[1])
+        if len(png) > self.max_bytes:
+            return
+        self._entries[series] = (version, png, meta)
+        self.nbytes += len(png)
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.nbytes -= len(evicted)
+            self.stats["evicted"] += 1
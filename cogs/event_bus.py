@@ -0,0 +1,134 @@
+"""
+Module: cogs/event_bus.py
+Description: In-process publish/subscribe for ARKCog's snapshot pipeline.
+
+sync_cache, update_monitors and check_pop_alerts used to be separate
+tasks.loops on unrelated timers, so alerts could fire a full period late and
+monitors re-read a snapshot that had not changed. Now sync_cache publishes
+each fresh (snapshot, diff) on the "snapshot" topic and every consumer is a
+subscriber that runs as soon as it arrives:
+
+  - Every subscription has its own worker task and bounded queue, so a slow
+    handler (Discord edits, SQLite writes) never delays the others.
+  - publish() never blocks. When a subscriber's queue is full the oldest
+    event is dropped, or, if the subscription has a merge function, the new
+    event is folded into the newest queued one (snapshot diffs are merged so
+    no change is lost). Either way the handler sees events in publish order.
+  - Per-subscriber metrics: delivered, dropped, handled, errors, queue wait
+    and handler run time (last / max / total). format_metrics() renders
+    them as one log line per subscriber.
+
+Author: pwnedByJT
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+
+class Subscription:
+
+    def __init__(self, topic: str, name: str, handler: Callable[..., Awaitable[Any]], maxsize: int,
+                 merge: Callable[[tuple, tuple], tuple] | None = None) -> None:
+        self.topic   = topic
+        self.name    = name
+        self.handler = handler
+        self.merge   = merge
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.task: asyncio.Task | None = None
+        self.metrics = {
+            "delivered": 0, "dropped": 0, "handled": 0, "errors": 0,
+            "wait_max_s": 0.0,
+            "run_last_s": 0.0, "run_max_s": 0.0, "run_total_s": 0.0,
+        }
+
+    def offer(self, args: tuple) -> None:
+        self.metrics["delivered"] += 1
+        if not self.queue.full():
+            self.queue.put_nowait((time.perf_counter(), args))
+            return
+        self.metrics["dropped"] += 1
+        if self.merge is None:
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait((time.perf_counter(), args))
+            return
+        # Fold into the newest queued event, which keeps its place (and its queue
+        # time). Items are put back before task_done() so join() never sees zero.
+        held = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        queued_at, newest = held.pop()
+        for item in held:
+            self.queue.put_nowait(item)
+        self.queue.put_nowait((queued_at, self.merge(newest, args)))
+        for _ in range(len(held) + 1):
+            self.queue.task_done()
+
+    async def run(self) -> None:
+        m = self.metrics
+        while True:
+            queued_at, args = await self.queue.get()
+            started = time.perf_counter()
+            m["wait_max_s"] = max(m["wait_max_s"], started - queued_at)
+            try:
+                await self.handler(*args)
+            except Exception as e:
+                m["errors"] += 1
+                print(f"[ERROR] {self.topic} subscriber {self.name}: {e}")
+            took = time.perf_counter() - started
+            m["handled"]     += 1
+            m["run_last_s"]   = took
+            m["run_max_s"]    = max(m["run_max_s"], took)
+            m["run_total_s"] += took
+            self.queue.task_done()
+
+
+class EventBus:
+
+    def __init__(self, maxsize: int = 2) -> None:
+        self.maxsize = maxsize
+        self._subs: dict[str, list[Subscription]] = {}
+
+    def subscribe(self, topic: str, handler: Callable[..., Awaitable[Any]], name: str | None = None,
+                  maxsize: int | None = None, merge: Callable[[tuple, tuple], tuple] | None = None) -> Subscription:
+        """
+        Run handler(*args) for every event published on topic, in its own task.
+        merge(older_args, newer_args) combines an event that would be dropped
+        with the one displacing it.
+        """
+        sub = Subscription(topic, name or handler.__name__, handler, maxsize or self.maxsize, merge)
+        sub.task = asyncio.get_running_loop().create_task(sub.run())
+        self._subs.setdefault(topic, []).append(sub)
+        return sub
+
+    def publish(self, topic: str, *args: Any) -> int:
+        """Queue args for every subscriber of topic. Returns how many were notified."""
+        subs = self._subs.get(topic, ())
+        for sub in subs:
+            sub.offer(args)
+        return len(subs)
+
+    def metrics(self) -> dict[str, dict]:
+        return {f"{s.topic}:{s.name}": dict(s.metrics) for subs in self._subs.values() for s in subs}
+
+    def format_metrics(self) -> list[str]:
+        """One line per subscriber, times in milliseconds."""
+        lines = []
+        for key, m in self.metrics().items():
+            avg_ms = m["run_total_s"] / m["handled"] * 1000 if m["handled"] else 0.0
+            lines.append(
+                f"{key} delivered={m['delivered']} handled={m['handled']} dropped={m['dropped']} "
+                f"errors={m['errors']} wait_max={m['wait_max_s'] * 1000:.0f}ms "
+                f"run_avg={avg_ms:.0f}ms run_max={m['run_max_s'] * 1000:.0f}ms"
+            )
+        return lines
+
+    async def drain(self) -> None:
+        """Wait until every queued event has been handled."""
+        await asyncio.gather(*(s.queue.join() for subs in self._subs.values() for s in subs))
+
+    async def close(self) -> None:
+        tasks = [s.task for subs in self._subs.values() for s in subs if s.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._subs.clear()
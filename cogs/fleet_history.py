@@ -0,0 +1,397 @@
+"""
+Module: cogs/fleet_history.py
+Description: Population history for every official server, stored columnar.
+
+record_stats only ever saw servers someone had run /monitor on, although
+sync_cache downloads NumPlayers for the whole fleet on every refresh.
+FleetHistory keeps all of it, cheaply enough to never need pruning by server:
+
+  <root>/slots.txt        one server Name per line; line number = slot.
+                          Append-only, so a slot never changes meaning.
+  <root>/YYYY-MM-DD.u8    one UTC day of rows, append-only. Each row is a
+                          header (uint32 ts, uint32 width) followed by width
+                          uint8 player counts indexed by slot. 255 = server
+                          not in that snapshot (including slots created after
+                          the row was written).
+
+A row for ~2000 servers is ~2 KB, so a day is a few MB and a month of the
+whole fleet fits where one monitored server's SQLite history used to grow.
+
+Reads never parse more than they need:
+
+  series(name)         — one byte per row, gathered from a memory-mapped day
+                         file at offsets from an in-memory row index.
+  timeseries()         — series() averaged into 15-minute, hourly or daily
+                         buckets (with each bucket's low and peak) when the
+                         window is long enough, so a month is graphed from
+                         ~700 points rather than ~40000.
+  scout_targets()      — per-day (hour-of-day × slot) sums and counts, cached
+                         for finished days, so /raidwindow over the whole fleet
+                         re-reduces only today and the partial first day.
+
+Averages are time-weighted like DatabaseEngine's: a row stands until the next
+row, at most MAX_GAP, so adaptive polling (rows 60-180 s apart) does not
+over-weight the busy stretches it polls faster through.
+
+Counts are clamped to 0..254. Every call touches files or memory maps, so the
+cog goes through run(), which serialises appends and reads on one worker
+thread off the event loop; nothing here blocks on the network.
+
+Author: pwnedByJT
+"""
+
+import asyncio
+import calendar
+import functools
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterable
+
+# numpy is imported on first use, like matplotlib in cogs/chart_render.py: this
+# module is imported by ARK.py at startup.
+if TYPE_CHECKING:
+    import numpy as np
+
+
+ABSENT    = 255
+MAX_COUNT = 254
+_ROW      = struct.Struct("<II")   # ts, width
+_DAY      = 86400
+# Bucket widths timeseries() may average into, coarsest first (as DatabaseEngine.ROLLUPS).
+LEVELS    = (_DAY, 3600, 900)
+# Longest a row is taken to stand for (DatabaseEngine.RUN_MAX_GAP); a longer silence is downtime.
+MAX_GAP   = 600
+
+
+def _day_file(root: str, day: int) -> str:
+    return os.path.join(root, time.strftime("%Y-%m-%d.u8", time.gmtime(day * _DAY)))
+
+
+def _held(ts, following: int | None = None):
+    """Seconds each row stood: until the next row (or following), at most MAX_GAP. Else 0."""
+    import numpy as np
+    after = np.append(ts[1:], ts[-1] if following is None else following)
+    return np.minimum(after - ts, MAX_GAP)
+
+
+def _mean(weighted, seconds, sums, counts):
+    """Time-weighted mean, or the plain mean where nothing has stood yet (as DatabaseEngine._avg_sql)."""
+    import numpy as np
+    return np.where(seconds > 0, weighted / np.maximum(seconds, 1), sums / np.maximum(counts, 1))
+
+
+class FleetHistory:
+
+    def __init__(self, root: str, keep_days: int = 30) -> None:
+        self.root      = root
+        self.keep_days = keep_days
+        self.last_ts: int | None = None
+        self._slots: dict[str, int] = {}
+        self._names: list[str]      = []
+        # day → (ts, offsets, widths); the current day is kept as lists and appended to.
+        self._index:  dict[int, tuple] = {}
+        # finished day → (sums, counts, weighted, seconds), each (24, slots at the time)
+        self._hourly: dict[int, tuple] = {}
+        self._day: int | None = None
+        self._file = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Await fn(*args, **kwargs) — a method of this object — on the history thread."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fleet-history")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    # ------------------------------------------------------------------
+    # WRITE
+    # ------------------------------------------------------------------
+
+    def open(self) -> None:
+        """Create the directory if needed and load the slot table."""
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, "slots.txt")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                raw = f.read()
+            # A name cut off by a crash was never referenced by a row; drop it.
+            complete = raw[:raw.rfind(b"\n") + 1]
+            if len(complete) != len(raw):
+                with open(path, "r+b") as f:
+                    f.truncate(len(complete))
+            for name in complete.decode("utf-8").splitlines():
+                self._slots[name] = len(self._names)
+                self._names.append(name)
+        latest = max(self._days_on_disk(), default=None)
+        if latest is not None:
+            ts = self._day_index(latest)[0]
+            if len(ts):
+                self.last_ts = int(ts[-1])
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def shutdown(self) -> None:
+        """Wait out queued run() calls, then close the day file."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def append(self, ts: int, counts: Iterable[tuple[str, int]]) -> None:
+        """Record one snapshot: (server Name, NumPlayers) for every server in it."""
+        import numpy as np
+        ts = int(ts)
+        if self.last_ts is not None and ts <= self.last_ts:
+            return
+        counts = list(counts)
+        new = [name for name, _ in counts if name not in self._slots]
+        if new:
+            with open(os.path.join(self.root, "slots.txt"), "a", encoding="utf-8") as f:
+                for name in dict.fromkeys(new):
+                    f.write(name + "\n")
+                    self._slots[name] = len(self._names)
+                    self._names.append(name)
+
+        row = np.full(len(self._names), ABSENT, dtype=np.uint8)
+        if counts:
+            slots = np.fromiter((self._slots[n] for n, _ in counts), dtype=np.int64, count=len(counts))
+            pops  = np.fromiter((p or 0 for _, p in counts), dtype=np.int64, count=len(counts))
+            row[slots] = np.clip(pops, 0, MAX_COUNT)
+
+        day = ts // _DAY
+        if day != self._day:
+            self._roll(day)
+        offset = self._file.tell()
+        self._file.write(_ROW.pack(ts, len(row)) + row.tobytes())
+        self._file.flush()
+        index = self._index[day]
+        index[0].append(ts)
+        index[1].append(offset)
+        index[2].append(len(row))
+        self.last_ts = ts
+
+    def _roll(self, day: int) -> None:
+        """Switch appends to day's file, freezing the previous day and enforcing retention."""
+        import numpy as np
+        self.close()
+        if self._day is not None and self._day in self._index:
+            self._index[self._day] = tuple(np.asarray(col, dtype=np.int64) for col in self._index[self._day])
+        self._day = day
+        ts, offsets, widths = self._day_index(day)
+        path = _day_file(self.root, day)
+        end = int(offsets[-1] + _ROW.size + widths[-1]) if len(ts) else 0
+        self._file = open(path, "ab")
+        # Drop a row half-written before a crash so new rows stay aligned.
+        if self._file.tell() != end:
+            self._file.truncate(end)
+            self._file.seek(end)
+        self._index[day] = ([int(t) for t in ts], [int(o) for o in offsets], [int(w) for w in widths])
+
+        for old in self._days_on_disk():
+            if old <= day - self.keep_days:
+                os.remove(_day_file(self.root, old))
+                self._index.pop(old, None)
+                self._hourly.pop(old, None)
+
+    # ------------------------------------------------------------------
+    # READ
+    # ------------------------------------------------------------------
+
+    def _days_on_disk(self) -> list[int]:
+        days = []
+        for entry in os.listdir(self.root):
+            if entry.endswith(".u8"):
+                try:
+                    days.append(calendar.timegm(time.strptime(entry[:-3], "%Y-%m-%d")) // _DAY)
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def _day_index(self, day: int) -> "tuple[np.ndarray, np.ndarray, np.ndarray]":
+        """(ts, offsets, widths) of every complete row in day's file."""
+        import numpy as np
+        cached = self._index.get(day)
+        if cached is not None:
+            return tuple(np.asarray(col, dtype=np.int64) for col in cached)
+        ts, offsets, widths = [], [], []
+        path = _day_file(self.root, day)
+        if os.path.exists(path):
+            # Headers only: seek over each row's counts.
+            with open(path, "rb") as f:
+                size, pos = os.fstat(f.fileno()).st_size, 0
+                while pos + _ROW.size <= size:
+                    t, w = _ROW.unpack(f.read(_ROW.size))
+                    if pos + _ROW.size + w > size:
+                        break
+                    ts.append(t)
+                    offsets.append(pos)
+                    widths.append(w)
+                    pos += _ROW.size + w
+                    f.seek(pos)
+        index = tuple(np.asarray(col, dtype=np.int64) for col in (ts, offsets, widths))
+        if day != self._day:
+            self._index[day] = index
+        return index
+
+    def _window(self, since: int, until: int):
+        """Yield (day, ts, offsets, widths, data) for days overlapping (since, until]."""
+        import numpy as np
+        for day in range(since // _DAY, until // _DAY + 1):
+            ts, offsets, widths = self._day_index(day)
+            if not len(ts):
+                continue
+            data = np.memmap(_day_file(self.root, day), dtype=np.uint8, mode="r",
+                             shape=(int(offsets[-1] + _ROW.size + widths[-1]),))
+            yield day, ts, offsets, widths, data
+
+    def series(self, name: str, hours: int = 24, now: int | None = None) -> "tuple[np.ndarray, np.ndarray]":
+        """(ts, counts) for name over the last hours, oldest first, absent rows removed."""
+        import numpy as np
+        slot = self._slots.get(name)
+        now = int(time.time()) if now is None else int(now)
+        since = now - hours * 3600
+        out_ts, out_counts = [], []
+        if slot is not None:
+            for _, ts, offsets, widths, data in self._window(since, now):
+                keep = (ts > since) & (ts <= now) & (widths > slot)
+                vals = data[offsets[keep] + _ROW.size + slot]
+                present = vals != ABSENT
+                out_ts.append(ts[keep][present])
+                out_counts.append(vals[present])
+        if not out_ts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        return np.concatenate(out_ts), np.concatenate(out_counts)
+
+    def timeseries(self, name: str, hours: int = 24, now: int | None = None,
+                   points: int = 500) -> list[tuple[int, float]] | None:
+        """
+        Same shape and resolution rule as DatabaseEngine.get_timeseries:
+        [(epoch_seconds, player_count), ...] or None, or, averaged into the
+        coarsest of LEVELS buckets that still gives points of them,
+        [(bucket_start, avg, low, peak), ...].
+        """
+        import numpy as np
+        ts, counts = self.series(name, hours, now)
+        if not len(ts):
+            return None
+        width = next((w for w in LEVELS if hours * 3600 // w >= points), None)
+        if width is None:
+            return list(zip(ts.tolist(), counts.tolist()))
+        buckets = ts // width
+        starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+        counts = counts.astype(np.int64)
+        held = _held(ts)
+        weighted = np.add.reduceat(counts * held, starts)
+        seconds = np.add.reduceat(held, starts)
+        sums = np.add.reduceat(counts, starts)
+        avgs = np.round(_mean(weighted, seconds, sums, np.diff(starts, append=len(ts))), 1)
+        return list(zip((buckets[starts] * width).tolist(), avgs.tolist(),
+                        np.minimum.reduceat(counts, starts).tolist(), np.maximum.reduceat(counts, starts).tolist()))
+
+    def stats(self, name: str, hours: int = 24, now: int | None = None) -> dict | None:
+        """Same shape as DatabaseEngine.get_stats; avg is time-weighted."""
+        import numpy as np
+        ts, counts = self.series(name, hours, now)
+        if not len(ts):
+            return None
+        counts = counts.astype(np.int64)
+        held = _held(ts)
+        avg = _mean(held @ counts, held.sum(), counts.sum(), len(counts))
+        return {
+            "current": int(counts[-1]), "avg": round(float(avg), 1),
+            "peak": int(counts.max()), "low": int(counts.min()), "samples": int(len(counts)),
+        }
+
+    def _reduce_hourly(self, ts, offsets, widths, data, keep, held) -> tuple:
+        """
+        (24, slots) sums, sample counts, player-seconds and seconds of the
+        kept rows, by UTC hour of day. held is each row's standing time.
+        """
+        import numpy as np
+        from numpy.lib.stride_tricks import as_strided
+        n = len(self._names)
+        # A day's player-seconds per hour fit in 32 bits (254 × ~4200 s), and
+        # finished days stay cached, so keep them at half the size.
+        sums, counts, weighted, seconds = (np.zeros((24, n), dtype=np.int32) for _ in range(4))
+        hours  = (ts // 3600) % 24
+        rows   = np.flatnonzero(keep)
+        # Consecutive rows of equal width sit at a fixed stride: view them as one
+        # (rows × width) matrix straight over the file, without copying the day.
+        breaks = np.flatnonzero((np.diff(widths[rows]) != 0) | (np.diff(rows) != 1)) + 1
+        for run in np.split(rows, breaks):
+            if not len(run):
+                continue
+            w = int(widths[run[0]])
+            start = int(offsets[run[0]]) + _ROW.size
+            matrix = as_strided(data[start:], shape=(len(run), w), strides=(_ROW.size + w, 1))
+            run_hours = hours[run]
+            run_held = held[run]
+            for h in np.unique(run_hours):
+                rows_h = run_hours == h
+                block = matrix[rows_h]
+                present = block != ABSENT
+                row_held = run_held[rows_h][:, None]
+                sums[h, :w]     += np.sum(block, axis=0, dtype=np.int64, where=present).astype(np.int32)
+                counts[h, :w]   += present.sum(axis=0, dtype=np.int32)
+                weighted[h, :w] += np.sum(block * row_held, axis=0, where=present).astype(np.int32)
+                seconds[h, :w]  += np.sum(present * row_held, axis=0).astype(np.int32)
+        return sums, counts, weighted, seconds
+
+    def hourly(self, since: int, until: int) -> "tuple[np.ndarray, ...]":
+        """(24, slots) sums, counts, player-seconds and seconds over rows with since < ts <= until."""
+        import numpy as np
+        n = len(self._names)
+        totals = tuple(np.zeros((24, n), dtype=np.int64) for _ in range(4))
+        for day, ts, offsets, widths, data in self._window(since, until):
+            whole = since < day * _DAY and (day + 1) * _DAY <= until and day != self._day
+            if whole and day in self._hourly:
+                parts = self._hourly[day]
+            else:
+                # A day's last row stands until the next day's first, if there is one yet.
+                following = self._day_index(day + 1)[0] if day != self._day else ()
+                held = _held(ts, int(following[0]) if len(following) else None)
+                keep = (ts > since) & (ts <= until)
+                parts = self._reduce_hourly(ts, offsets, widths, data, keep, held)
+                if whole:
+                    self._hourly[day] = parts
+            for total, part in zip(totals, parts):
+                total[:, :part.shape[1]] += part
+        return totals
+
+    def scout_targets(self, min_avg: float = 3.0, min_samples: int = 24, days: int = 7,
+                      min_hour_samples: int = 3, limit: int = 10, now: int | None = None) -> list[dict]:
+        """Same shape and ranking as DatabaseEngine.get_scout_targets_with_windows, over every server."""
+        import numpy as np
+        now = int(time.time()) if now is None else int(now)
+        sums, counts, weighted, seconds = self.hourly(now - days * _DAY, now)
+        total_c = counts.sum(axis=0)
+        weekly = np.round(_mean(weighted.sum(axis=0), seconds.sum(axis=0), sums.sum(axis=0), total_c), 1)
+        qualify = np.flatnonzero((weekly > min_avg) & (total_c >= min_samples))
+        ranked = qualify[np.argsort(-weekly[qualify], kind="stable")][:limit]
+
+        results = []
+        for slot in ranked:
+            window = None
+            hour_c = counts[:, slot]
+            ok = np.flatnonzero(hour_c >= min_hour_samples)
+            if len(ok):
+                # Quietest hour; ties go to the hour with more samples.
+                hour_avg = np.round(_mean(weighted[ok, slot], seconds[ok, slot], sums[ok, slot], hour_c[ok]), 1)
+                best = np.lexsort((-hour_c[ok], hour_avg))[0]
+                window = {"hour_utc": int(ok[best]), "avg_pop": float(hour_avg[best]),
+                          "samples": int(hour_c[ok[best]])}
+            results.append({
+                "server_name": self._names[slot],
+                "weekly_avg": float(weekly[slot]),
+                "total_samples": int(total_c[slot]),
+                "window": window,
+            })
+        return results
@@ -0,0 +1,219 @@
+"""
+Module: cogs/official_feed.py
+Description: Conditional, adaptive polling of officialserverlist.json.
+
+sync_cache used to download and parse the whole list every 60 s whether or
+not the CDN content had changed. OfficialFeed.fetch() instead:
+
+  - Sends If-None-Match / If-Modified-Since from the previous response; a 304
+    costs a few hundred bytes and skips parsing entirely.
+  - Negotiates gzip/deflate and reuses one keep-alive session, so the TLS
+    handshake is not repeated every poll. The body is inflated here rather
+    than by aiohttp, so bytes_wire counts what actually crossed the network.
+  - Falls back to a body digest when the CDN sends no validators, so an
+    identical payload is still not published.
+  - Parses the body as it streams in (ServerListParser): each array element is
+    decoded on its own and immediately reduced to a slotted ServerRecord, so
+    the full body text and thousands of full-width dicts never coexist in
+    memory. Peak memory per refresh is roughly one chunk plus the records.
+  - Adapts the poll interval: grown by half (up to max_interval) after an
+    unchanged payload, and stepped back toward base_interval after a changed
+    one. The live list changes on most polls, so it settles at the base
+    cadence rather than below it. ARKCog.sync_cache applies it with
+    tasks.Loop.change_interval().
+  - confirmed_at records when the list was last known current (a 200 or a
+    304), so sync_cache can republish an unchanged snapshot as a heartbeat.
+
+metrics exposes requests, 304s, changed/unchanged bodies, bytes on the wire
+(compressed body bytes), decoded bytes and JSON parse time (CPU time spent
+decoding, not waiting on the network); format_metrics() is the log line
+ARKCog.report_metrics prints.
+
+Author: pwnedByJT
+"""
+
+import codecs
+import hashlib
+import json
+import time
+import zlib
+
+import aiohttp
+
+from cogs.server_snapshot import ServerRecord
+
+
+CHUNK_BYTES = 64 * 1024
+
+
+class ServerListParser:
+    """
+    Incremental parser for a top-level JSON array of objects. feed() takes raw
+    bytes in arbitrary pieces and returns the ServerRecords completed so far.
+    """
+
+    _WS = " \t\r\n"
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._text    = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buf     = ""
+        self._started = False
+        self._done    = False
+
+    def feed(self, chunk: bytes, final: bool = False) -> list[ServerRecord]:
+        buf = self._buf + self._text.decode(chunk, final)
+        pos, end, out = 0, len(buf), []
+        while not self._done:
+            while pos < end and buf[pos] in self._WS:
+                pos += 1
+            if pos >= end:
+                break
+            c = buf[pos]
+            if not self._started:
+                if c != "[":
+                    raise ValueError("server list is not a JSON array")
+                self._started = True
+                pos += 1
+            elif c == ",":
+                pos += 1
+            elif c == "]":
+                self._done = True
+                pos += 1
+            elif c == "{":
+                try:
+                    obj, pos = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break  # object continues in the next chunk
+                if obj.get("Name"):
+                    out.append(ServerRecord.from_dict(obj))
+            else:
+                raise ValueError(f"unexpected {c!r} in server list")
+        self._buf = buf[pos:]
+        if final and not self._done:
+            raise ValueError("server list truncated")
+        return out
+
+
+class OfficialFeed:
+
+    def __init__(self, url: str, base_interval: float = 60.0, max_interval: float = 180.0,
+                 timeout: float = 10.0) -> None:
+        self.url           = url
+        self.base_interval = base_interval
+        self.max_interval  = max_interval
+        self.interval      = base_interval
+        self.timeout       = aiohttp.ClientTimeout(total=timeout)
+        self.confirmed_at  = 0.0   # time.time() of the newest 200 or 304
+        self._session: aiohttp.ClientSession | None = None
+        self._etag: str | None          = None
+        self._last_modified: str | None = None
+        self._digest: bytes | None      = None
+        self.metrics = {
+            "requests": 0, "not_modified": 0, "changed": 0, "unchanged": 0, "errors": 0,
+            "bytes_wire": 0, "bytes_decoded": 0,
+            "parse_s_last": 0.0, "parse_s_total": 0.0,
+        }
+
+    def _relax(self) -> None:
+        self.interval = min(self.max_interval, self.interval * 1.5)
+
+    def _settle(self) -> None:
+        self.interval = max(self.base_interval, self.interval / 1.5)
+
+    def format_metrics(self) -> str:
+        m = self.metrics
+        parsed = m["changed"] + m["unchanged"]
+        parse_ms = m["parse_s_total"] / parsed * 1000 if parsed else 0.0
+        return (f"requests={m['requests']} not_modified={m['not_modified']} changed={m['changed']} "
+                f"unchanged={m['unchanged']} errors={m['errors']} "
+                f"wire={m['bytes_wire'] / 1024:.0f}KiB decoded={m['bytes_decoded'] / 1024:.0f}KiB "
+                f"parse_avg={parse_ms:.1f}ms interval={self.interval:.0f}s")
+
+    async def fetch(self) -> list[ServerRecord] | None:
+        """The parsed list if it changed since the last call, else None (304, identical body, or error)."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout, auto_decompress=False)
+
+        headers = {"Accept-Encoding": "gzip, deflate"}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        m = self.metrics
+        m["requests"] += 1
+        try:
+            async with self._session.get(self.url, headers=headers) as r:
+                if r.status == 304:
+                    m["not_modified"] += 1
+                    self.confirmed_at = time.time()
+                    self._relax()
+                    return None
+                if r.status != 200:
+                    m["errors"] += 1
+                    return None
+                validators = (r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                encoding = r.headers.get("Content-Encoding", "").lower()
+                # wbits=47 accepts both gzip and zlib framing. Servers also send
+                # "deflate" as a bare stream (no zlib header); that is only
+                # detectable from its first bytes, so the first chunk may retry raw.
+                inflater = zlib.decompressobj(47) if encoding in ("gzip", "deflate") else None
+                may_be_raw = encoding == "deflate"
+
+                hasher, parser = hashlib.blake2b(digest_size=16), ServerListParser()
+                records: list[ServerRecord] = []
+                wire, decoded, parse_s = 0, 0, 0.0
+                async for chunk in r.content.iter_chunked(CHUNK_BYTES):
+                    wire += len(chunk)
+                    if inflater:
+                        try:
+                            inflated = inflater.decompress(chunk)
+                        except zlib.error:
+                            if not may_be_raw:
+                                raise
+                            inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+                            inflated = inflater.decompress(chunk)
+                        chunk, may_be_raw = inflated, False
+                    hasher.update(chunk)
+                    decoded += len(chunk)
+                    started = time.perf_counter()
+                    records.extend(parser.feed(chunk))
+                    parse_s += time.perf_counter() - started
+                tail = inflater.flush() if inflater else b""
+                hasher.update(tail)
+                decoded += len(tail)
+                started = time.perf_counter()
+                records.extend(parser.feed(tail, final=True))
+                parse_s += time.perf_counter() - started
+
+                m["bytes_wire"]    += wire
+                m["bytes_decoded"] += decoded
+        except (aiohttp.ClientError, TimeoutError, ValueError, zlib.error):
+            m["errors"] += 1
+            return None
+
+        m["parse_s_last"]   = parse_s
+        m["parse_s_total"] += parse_s
+
+        self.confirmed_at = time.time()
+        digest = hasher.digest()
+        if digest == self._digest:
+            self._etag, self._last_modified = validators
+            m["unchanged"] += 1
+            self._relax()
+            return None
+
+        # Validators are only kept for a body that parsed, so a bad payload is re-fetched in full.
+        self._etag, self._last_modified = validators
+        self._digest = digest
+        m["changed"] += 1
+        self._settle()
+        return records
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
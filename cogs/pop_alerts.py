@@ -0,0 +1,223 @@
+"""
+Module: cogs/pop_alerts.py
+Description: In-memory index of /popwatch alerts for check_pop_alerts.
+
+Alerts are grouped by server and kept sorted by threshold. The index remembers
+the population each server was last evaluated at, so a tick only does work
+for servers whose population moved. When it does, the alerts that changed
+state are exactly those with thresholds between the old and new population:
+
+  drop  old → new   thresholds in (new, old]  fall below → trigger
+  rise  old → new   thresholds in (old, new]  recover    → re-arm
+
+Both ranges are found by bisecting the sorted thresholds, so a tick costs
+O(changed servers · log alerts + alerts that actually flip).
+
+check_pop_alerts is driven by the snapshot diff: an alert key is evaluated in
+full once (unevaluated()), at which point it is bound to the server Name it
+resolved to; after that only keys bound to Names in the diff are visited.
+
+The pop_alerts table remains the source of truth. The index is loaded from it
+in cog_load and kept in step by /popwatch, /popwatch_remove and by the
+triggered flags check_pop_alerts writes back.
+
+pack_alert_messages() turns one channel's triggered alerts into as few
+messages as Discord's 2000-character limit allows, one mention per user.
+
+Author: pwnedByJT
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Mapping
+
+
+class Alert:
+    __slots__ = ("user_id", "server", "threshold", "channel_id", "triggered")
+
+    def __init__(self, user_id: int, server: str, threshold: int, channel_id: int, triggered: bool = False) -> None:
+        self.user_id    = user_id
+        self.server     = server
+        self.threshold  = threshold
+        self.channel_id = channel_id
+        self.triggered  = bool(triggered)
+
+    def _key(self) -> tuple[int, int]:
+        return (self.threshold, self.user_id)
+
+
+class _ServerAlerts:
+    """One server's alerts, sorted by (threshold, user_id), with a parallel threshold list for bisect."""
+
+    __slots__ = ("alerts", "thresholds")
+
+    def __init__(self) -> None:
+        self.alerts:     list[Alert] = []
+        self.thresholds: list[int]   = []
+
+    def add(self, alert: Alert) -> None:
+        i = bisect_right(self.alerts, alert._key(), key=Alert._key)
+        self.alerts.insert(i, alert)
+        self.thresholds.insert(i, alert.threshold)
+
+    def remove(self, alert: Alert) -> None:
+        i = bisect_left(self.alerts, alert._key(), key=Alert._key)
+        del self.alerts[i]
+        del self.thresholds[i]
+
+
+class PopAlertIndex:
+
+    def __init__(self, rows: Iterable[Mapping] = ()) -> None:
+        self._servers: dict[str, _ServerAlerts] = {}
+        self._by_owner: dict[tuple[int, str], Alert] = {}
+        # Population each server was last evaluated at; absent = evaluate in full.
+        self._last_pop: dict[str, int] = {}
+        self._pending: set[str] = set()
+        # Alert key ("2154", full Name, ...) ↔ the snapshot Name it resolves to.
+        self._name_of: dict[str, str] = {}
+        self._keys_of: dict[str, set[str]] = {}
+        for r in rows:
+            self._insert(Alert(r["user_id"], r["server_name"], r["threshold"], r["channel_id"], r["triggered"]))
+
+    def __len__(self) -> int:
+        return len(self._by_owner)
+
+    def servers(self) -> list[str]:
+        return list(self._servers)
+
+    def unevaluated(self) -> list[str]:
+        """Keys with no evaluated population yet (new, re-armed, or never resolved)."""
+        return list(self._pending)
+
+    def bind(self, name: str, server: str) -> None:
+        """Record that alert key server resolves to snapshot Name name."""
+        old = self._name_of.get(server)
+        if old == name:
+            return
+        if old is not None:
+            self._keys_of[old].discard(server)
+        self._name_of[server] = name
+        self._keys_of.setdefault(name, set()).add(server)
+
+    def keys_for(self, name: str) -> tuple[str, ...]:
+        return tuple(self._keys_of.get(name, ()))
+
+    def _insert(self, alert: Alert) -> None:
+        self._by_owner[(alert.user_id, alert.server)] = alert
+        self._servers.setdefault(alert.server, _ServerAlerts()).add(alert)
+        self._pending.add(alert.server)
+
+    def set(self, user_id: int, server: str, threshold: int, channel_id: int) -> Alert:
+        """Mirror of DatabaseEngine.set_pop_alert: an existing alert keeps its channel and is re-armed."""
+        alert = self._by_owner.get((user_id, server))
+        if alert is not None:
+            self._servers[server].remove(alert)
+            alert.threshold = threshold
+            alert.triggered = False
+            self._servers[server].add(alert)
+        else:
+            alert = Alert(user_id, server, threshold, channel_id)
+            self._insert(alert)
+        # A new threshold may already be crossed; evaluate this server in full next tick.
+        self._last_pop.pop(server, None)
+        self._pending.add(server)
+        return alert
+
+    def remove(self, user_id: int, server: str) -> bool:
+        alert = self._by_owner.pop((user_id, server), None)
+        if alert is None:
+            return False
+        group = self._servers[server]
+        group.remove(alert)
+        if not group.alerts:
+            del self._servers[server]
+            self._last_pop.pop(server, None)
+            self._pending.discard(server)
+            name = self._name_of.pop(server, None)
+            if name is not None:
+                self._keys_of[name].discard(server)
+        return True
+
+    def for_server(self, server: str) -> list[Alert]:
+        group = self._servers.get(server)
+        return list(group.alerts) if group else []
+
+    def update(self, server: str, pop: int) -> list[Alert]:
+        """
+        Apply server's current population. Returns the alerts whose triggered
+        flag flipped (alert.triggered holds the new state); unchanged
+        populations return [] without touching the alerts.
+        """
+        group = self._servers.get(server)
+        if group is None:
+            return []
+        self._pending.discard(server)
+        old = self._last_pop.get(server)
+        if old == pop:
+            return []
+        self._last_pop[server] = pop
+
+        ths = group.thresholds
+        if old is None:
+            # Full pass: below = pop < threshold.
+            below = range(bisect_right(ths, pop), len(ths))
+            above = range(0, bisect_right(ths, pop))
+        elif pop < old:
+            below, above = range(bisect_right(ths, pop), bisect_right(ths, old)), range(0)
+        else:
+            below, above = range(0), range(bisect_right(ths, old), bisect_right(ths, pop))
+
+        flipped = []
+        for i in below:
+            alert = group.alerts[i]
+            if not alert.triggered:
+                alert.triggered = True
+                flipped.append(alert)
+        for i in above:
+            alert = group.alerts[i]
+            if alert.triggered:
+                alert.triggered = False
+                flipped.append(alert)
+        return flipped
+
+
+# ---------------------------------------------------------------------------
+# FAN-OUT
+# ---------------------------------------------------------------------------
+
+MESSAGE_LIMIT = 2000
+
+
+def pack_alert_messages(triggered: Iterable[tuple[Alert, int]], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    One channel's (alert, population) pairs as message bodies: a line per
+    server listing every user who crossed their threshold. A message is only
+    split when the next piece would pass limit; a server continued into the
+    next message repeats its header.
+    """
+    by_server: dict[str, tuple[int, list[Alert]]] = {}
+    for alert, pop in triggered:
+        by_server.setdefault(alert.server, (pop, []))[1].append(alert)
+
+    messages: list[str] = []
+    buf = ""
+    for server, (pop, alerts) in by_server.items():
+        header = f"**[POP ALERT]** **{server}** -- currently **{pop}** online:"
+        line   = header
+        for alert in alerts:
+            token = f" <@{alert.user_id}> (below **{alert.threshold}**)"
+            if len(buf) + 1 + len(line) + len(token) > limit:
+                if buf:
+                    messages.append(buf)
+                    buf = ""
+                if len(line) + len(token) > limit:
+                    messages.append(line)
+                    line = header
+            line += token
+        if buf and len(buf) + 1 + len(line) > limit:
+            messages.append(buf)
+            buf = ""
+        buf = f"{buf}\n{line}" if buf else line
+    if buf:
+        messages.append(buf)
+    return messages
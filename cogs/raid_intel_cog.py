@@ -2,7 +2,7 @@
 Cog: cogs/raid_intel_cog.py
 Description: /raidwindow — population analytics and offline-raid target scouting.
 
-Scans historical population data (collected by /monitor) to surface servers
+Scans historical population data to surface servers
 with healthy weekly activity but predictable low-population windows — the
 optimal windows for offline raids or server transfers.
 
@@ -14,9 +14,12 @@ Logic:
   3. Return a ranked embed (highest weekly avg first — more active servers
      have more to raid).
 
-Important caveat: population history only exists for servers that were
-previously tracked via /monitor. This command operates on that monitored
-subset, not the entire official server list.
+Data source: ARKCog.history (cogs/fleet_history.py), which records every
+official server on every refresh, so no /monitor is needed. Until it holds
+enough data (e.g. right after first deploy) the command falls back to the
+monitored servers in SQLite (DatabaseEngine.get_scout_targets_with_windows).
+Both answer steps 1 and 2 from per-hour aggregates in one pass, so latency
+does not grow with the number of servers listed.
 
 Author: pwnedByJT
 """
@@ -50,13 +53,13 @@ def _fmt_approx_pt(hour: int) -> str:
 # EMBED BUILDERS
 # ---------------------------------------------------------------------------
 
-def _build_raidwindow_embed(results: list[dict]) -> discord.Embed:
+def _build_raidwindow_embed(results: list[dict], source: str) -> discord.Embed:
     embed = discord.Embed(
         title="Raid Intel — Low-Pop Windows",
         description=(
             "Servers ranked by weekly average population. "
             "Quiet window = the UTC hour with the lowest average player count over the past 7 days.\n"
-            "**Data source:** servers actively tracked via `/monitor` only."
+            f"**Data source:** {source}."
         ),
         color=discord.Color(0xED4245),
         timestamp=datetime.now(timezone.utc),
@@ -73,7 +76,7 @@ def _build_raidwindow_embed(results: list[dict]) -> discord.Embed:
             pop = window["avg_pop"]
             window_str = f"`{_fmt_utc(h)}`  /  `{_fmt_approx_pt(h)}`\nAvg pop during window: `{pop}`"
         else:
-            window_str = "`Insufficient hourly data — monitor longer for a reliable window`"
+            window_str = "`Insufficient hourly data — check back once more history is collected`"
 
         embed.add_field(
             name=f"{srv}",
@@ -88,10 +91,10 @@ def _build_no_data_embed(min_avg: float) -> discord.Embed:
     embed = discord.Embed(
         title="Raid Intel — No Qualifying Servers",
         description=(
-            f"No monitored servers have a weekly average population above **{min_avg}** "
+            f"No servers have a weekly average population above **{min_avg}** "
             f"with enough data to analyze.\n\n"
-            f"Start tracking servers with `/monitor` and run this command again after "
-            f"accumulating at least a day of data."
+            f"Population history is recorded for every official server; run this "
+            f"command again after at least a day of data has accumulated."
         ),
         color=discord.Color(0xFEE75C),
         timestamp=datetime.now(timezone.utc),
@@ -115,14 +118,24 @@ class RaidIntelCog(commands.Cog):
         cog = self.bot.get_cog("ARKCog")
         return cog.db if cog else None
 
+    @property
+    def _history(self):
+        """ARKCog's FleetHistory (every official server), fetched at call-time."""
+        cog = self.bot.get_cog("ARKCog")
+        return cog.history if cog else None
+
     @app_commands.command(
         name="raidwindow",
         description="Identify prime offline-raid targets by weekly avg pop and low-pop windows.",
     )
     @app_commands.describe(
         min_avg="Minimum weekly average population to qualify a server (default 3)",
+        limit="How many servers to list (default 10, max 25)",
     )
-    async def raidwindow(self, itxn: discord.Interaction, min_avg: int = 3) -> None:
+    async def raidwindow(
+        self, itxn: discord.Interaction, min_avg: int = 3,
+        limit: app_commands.Range[int, 1, 25] = 10,
+    ) -> None:
         await itxn.response.defer()
 
         db = self._db
@@ -132,16 +145,19 @@ class RaidIntelCog(commands.Cog):
                 ephemeral=True,
             )
 
-        # Step 1: qualifying servers
-        targets = await db.get_scout_targets(min_avg=float(min_avg))
+        # Qualifying servers and their quiet windows: the whole fleet when its
+        # history has data, else the monitored servers in one grouped query.
+        history = self._history
+        targets = (await history.run(history.scout_targets, min_avg=float(min_avg), limit=limit)
+                   if history else [])
+        source  = "every official server"
+        if not targets:
+            targets = await db.get_scout_targets_with_windows(min_avg=float(min_avg), limit=limit)
+            source  = "servers tracked via `/monitor`"
         if not targets:
             return await itxn.followup.send(embed=_build_no_data_embed(min_avg))
 
-        # Step 2: enrich each server with its quiet window
-        for entry in targets:
-            entry["window"] = await db.get_quiet_window(entry["server_name"])
-
-        await itxn.followup.send(embed=_build_raidwindow_embed(targets))
+        await itxn.followup.send(embed=_build_raidwindow_embed(targets, source))
 
     @raidwindow.error
     async def raidwindow_error(self, itxn: discord.Interaction, error: app_commands.AppCommandError) -> None:
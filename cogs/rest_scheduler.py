@@ -0,0 +1,273 @@
+"""
+Module: cogs/rest_scheduler.py
+Description: Central pacing for Discord REST edits (monitor embeds, voice
+             channel renames).
+
+update_monitors used to PATCH one server at a time and only reacted to 429s
+after the fact. Every edit now goes through a RestScheduler instead:
+
+  - Each route (method + path, e.g. "PATCH /channels/<id>/messages", see
+    channel_route()) has its own TokenBucket, as Discord limits message
+    sends, message edits and channel edits separately; every request also
+    draws from one global bucket (Discord allows ~50 req/s).
+  - Buckets start from Discord's documented defaults and are corrected from
+    the X-RateLimit-* headers of every response on their route. discord.py
+    sleeps through 429s itself and never hands response headers to callers,
+    so RateLimitTrace reads them off its aiohttp session instead (passed to
+    the client as http_trace).
+  - Jobs are keyed (e.g. "msg:<id>"). Submitting a key that is still queued
+    replaces its payload in place, so only the latest embed is ever sent.
+  - Each route drains in its own task, so independent channels run
+    concurrently while each stays inside its own bucket.
+  - A 429 drains the offending bucket and puts the job back at the front of
+    its route, unless a newer payload for the same key has arrived meanwhile.
+
+Author: pwnedByJT
+"""
+
+import asyncio
+import inspect
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+import aiohttp
+import discord
+
+
+class TokenBucket:
+    """capacity tokens, refilled continuously over per seconds."""
+
+    __slots__ = ("capacity", "per", "tokens", "updated", "blocked_until")
+
+    def __init__(self, capacity: int, per: float) -> None:
+        self.capacity      = capacity
+        self.per           = per
+        self.tokens        = float(capacity)
+        self.updated       = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+        self.updated = now
+
+    def wait_time(self, now: float | None = None) -> float:
+        """Seconds until a token is available (0.0 when one is available now)."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.capacity
+
+    def take(self, now: float | None = None) -> None:
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+
+    def block(self, seconds: float, now: float | None = None) -> None:
+        """Spend every token and refuse new ones for seconds."""
+        now = time.monotonic() if now is None else now
+        self.tokens        = 0.0
+        self.updated       = now
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def learn(self, headers, now: float | None = None) -> None:
+        """
+        Adopt the limit / remaining / reset-after Discord reported for this
+        bucket. Reset-After is the time left in the current window, so it is
+        taken as the window length (per) only from the first request of a
+        window; an exhausted bucket is blocked until its reset instead.
+        """
+        now = time.monotonic() if now is None else now
+        try:
+            if "X-RateLimit-Limit" in headers:
+                self.capacity = max(1, int(headers["X-RateLimit-Limit"]))
+            remaining = None
+            if "X-RateLimit-Remaining" in headers:
+                remaining = int(headers["X-RateLimit-Remaining"])
+                self._refill(now)
+                self.tokens = min(self.tokens, float(remaining))
+            if "X-RateLimit-Reset-After" in headers:
+                reset_after = float(headers["X-RateLimit-Reset-After"])
+                if remaining == self.capacity - 1 and reset_after > 0:
+                    self.per = reset_after
+                if remaining == 0:
+                    self.block(reset_after, now)
+        except (TypeError, ValueError):
+            pass
+
+
+def channel_route(method: str, channel_id: int | str, messages: bool = False) -> str:
+    """Route key of a channel request: "<METHOD> /channels/<id>[/messages]"."""
+    return f"{method} /channels/{channel_id}" + ("/messages" if messages else "")
+
+
+def _retry_after(exc: Exception, headers) -> float:
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is None:
+        try:
+            retry_after = float(headers.get("Retry-After", 5.0))
+        except (TypeError, ValueError):
+            retry_after = 5.0
+    return max(0.0, float(retry_after))
+
+
+class _Job:
+    __slots__ = ("call", "on_success", "on_error", "on_rate_limited")
+
+    def __init__(self, call, on_success, on_error, on_rate_limited) -> None:
+        self.call            = call
+        self.on_success      = on_success
+        self.on_error        = on_error
+        self.on_rate_limited = on_rate_limited
+
+
+class RestScheduler:
+
+    # Discord's documented defaults; corrected by observe() as response headers arrive.
+    ROUTE_LIMIT  = (5, 5.0)     # 5 requests / 5 s per channel
+    GLOBAL_LIMIT = (50, 1.0)    # 50 requests / s per bot
+
+    def __init__(self, route_limit: tuple[int, float] = ROUTE_LIMIT,
+                 global_limit: tuple[int, float] = GLOBAL_LIMIT) -> None:
+        self.route_limit = route_limit
+        self._global  = TokenBucket(*global_limit)
+        self._buckets: dict[str, TokenBucket] = {}
+        self._queues:  dict[str, OrderedDict[Hashable, _Job]] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self.stats = {"sent": 0, "coalesced": 0, "rate_limited": 0, "failed": 0}
+
+    def pending(self, route: str | None = None) -> int:
+        if route is not None:
+            return len(self._queues.get(route, ()))
+        return sum(len(q) for q in self._queues.values())
+
+    def submit(
+        self, route: str, key: Hashable,
+        call: Callable[[], Awaitable[Any]],
+        on_success: Callable[[Any], None] | None = None,
+        on_error: Callable[[Exception], Any] | None = None,    # may return an awaitable
+        on_rate_limited: Callable[[float], Any] | None = None,
+    ) -> None:
+        """
+        Queue call() on route. A queued job with the same key is superseded in
+        place. on_rate_limited(retry_after) is told about each 429 before the
+        job is retried.
+        """
+        if route not in self._buckets:
+            self._buckets[route] = TokenBucket(*self.route_limit)
+        queue = self._queues.setdefault(route, OrderedDict())
+        if key in queue:
+            self.stats["coalesced"] += 1
+        queue[key] = _Job(call, on_success, on_error, on_rate_limited)
+
+        worker = self._workers.get(route)
+        if worker is None or worker.done():
+            self._workers[route] = asyncio.get_running_loop().create_task(self._drain_route(route))
+
+    async def _acquire(self, bucket: TokenBucket) -> None:
+        while True:
+            wait = max(bucket.wait_time(), self._global.wait_time())
+            if wait <= 0:
+                bucket.take()
+                self._global.take()
+                return
+            await asyncio.sleep(wait)
+
+    async def _drain_route(self, route: str) -> None:
+        bucket = self._buckets[route]
+        queue  = self._queues[route]
+        while queue:
+            await self._acquire(bucket)
+            if not queue:
+                break
+            key, job = queue.popitem(last=False)
+            try:
+                result = await job.call()
+            except (discord.RateLimited, discord.HTTPException) as e:
+                status  = getattr(e, "status", 429)
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                if status == 429:
+                    self.stats["rate_limited"] += 1
+                    delay = _retry_after(e, headers)
+                    scope = headers.get("X-RateLimit-Scope")
+                    if headers.get("X-RateLimit-Global") or scope == "global":
+                        self._global.block(delay)
+                    else:
+                        bucket.learn(headers)
+                        bucket.block(delay)
+                    if job.on_rate_limited:
+                        job.on_rate_limited(delay)
+                    # Retry first, unless a newer payload for this key already queued.
+                    if key not in queue:
+                        queue[key] = job
+                        queue.move_to_end(key, last=False)
+                    continue
+                await self._fail(job, e)
+            except Exception as e:
+                await self._fail(job, e)
+            else:
+                self.stats["sent"] += 1
+                if job.on_success:
+                    job.on_success(result)
+        self._queues.pop(route, None)
+        self._workers.pop(route, None)
+
+    async def _fail(self, job: _Job, exc: Exception) -> None:
+        self.stats["failed"] += 1
+        if job.on_error:
+            # May be a coroutine function (e.g. cleanup that writes to the database).
+            if inspect.isawaitable(outcome := job.on_error(exc)):
+                await outcome
+        else:
+            print(f"[REST] {type(exc).__name__}: {exc}")
+
+    def observe(self, route: str, headers) -> None:
+        """Correct route's bucket from a response's headers (routes never submitted are ignored)."""
+        bucket = self._buckets.get(route)
+        if bucket is not None:
+            bucket.learn(headers)
+
+    async def drain(self) -> None:
+        """Wait until every queued job has been sent (or has failed)."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    def close(self) -> None:
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers.clear()
+        self._queues.clear()
+
+
+class RateLimitTrace:
+    """
+    aiohttp trace for discord.py's HTTP session: every response to a channel
+    or channel-messages request is shown to the attached schedulers under
+    its channel_route(), the route keys update_monitors and the pop alerts
+    submit under. A message id in the path is not part of the route.
+    """
+
+    _CHANNEL = re.compile(r"/channels/(\d+)(/messages)?(?:/\d+)?/?$")
+
+    def __init__(self) -> None:
+        self.schedulers: list[RestScheduler] = []
+        self.config = aiohttp.TraceConfig()
+        self.config.on_request_end.append(self._on_request_end)
+
+    def attach(self, scheduler: RestScheduler) -> None:
+        self.schedulers.append(scheduler)
+
+    def detach(self, scheduler: RestScheduler) -> None:
+        if scheduler in self.schedulers:
+            self.schedulers.remove(scheduler)
+
+    async def _on_request_end(self, session, ctx, params) -> None:
+        m = self._CHANNEL.search(params.url.path)
+        if m is None or "X-RateLimit-Remaining" not in params.response.headers:
+            return
+        route = channel_route(params.method, m.group(1), messages=bool(m.group(2)))
+        for scheduler in self.schedulers:
+            scheduler.observe(route, params.response.headers)
@@ -0,0 +1,241 @@
+"""
+Module: cogs/server_snapshot.py
+Description: Immutable, indexed view of the official server list.
+
+ARKCog.sync_cache builds one ServerSnapshot per refresh from ServerRecords
+(compact, slotted, only the fields the bot reads; see cogs/official_feed.py). Every consumer
+(monitors, pop alerts, /serverpop, /fav_list, autocomplete) resolves servers
+through it instead of scanning the raw list:
+
+  get(query)     — exact lookup by full server Name or by server number,
+                   parsed from the trailing digits of Name. O(1).
+  search(query)  — autocomplete matches. Digit queries walk a server-number
+                   prefix index; text queries walk a trigram index of the
+                   lower-cased names. O(k) in the number of candidates.
+
+  diff(prev)     — what changed since the previous snapshot (SnapshotDiff),
+                   published by sync_cache so consumers only act on changes.
+
+Exact number matching also fixes the old substring behaviour where "21"
+resolved to whichever of 21 / 210 / 2154 happened to come first in the list.
+
+Author: pwnedByJT
+"""
+
+import re
+import sys
+from types import MappingProxyType
+from typing import Iterable
+
+
+_NUMBER_RE = re.compile(r"(\d+)\D*$")
+
+
+def server_number(name: str) -> str | None:
+    """'NA-PVP-TheIsland2154' → '2154'. None when the name carries no digits."""
+    m = _NUMBER_RE.search(name or "")
+    return m.group(1) if m else None
+
+
+class ServerRecord:
+    """
+    One server from the official list. Holds only the fields the bot reads, and
+    answers rec["Name"] / rec.get("NumPlayers", 0) like the dict it replaces.
+    """
+
+    FIELDS = ("Name", "NumPlayers", "MaxPlayers", "MapName", "DayTime", "IP", "Port")
+    __slots__ = FIELDS
+
+    def __init__(self, Name, NumPlayers=None, MaxPlayers=None, MapName=None, DayTime=None, IP=None, Port=None) -> None:
+        self.Name       = Name
+        self.NumPlayers = NumPlayers
+        self.MaxPlayers = MaxPlayers
+        # A few dozen maps shared by thousands of servers: keep one copy of each name.
+        self.MapName    = sys.intern(MapName) if isinstance(MapName, str) else MapName
+        self.DayTime    = DayTime
+        self.IP         = IP
+        self.Port       = Port
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ServerRecord":
+        return cls(*map(d.get, cls.FIELDS))
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ServerRecord):
+            return all(getattr(self, f) == getattr(other, f) for f in self.FIELDS)
+        return NotImplemented
+
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"ServerRecord({self.Name!r}, {self.NumPlayers}/{self.MaxPlayers})"
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Fields whose change means the server moved: the monitor embed shows them.
+_LOCATION_FIELDS = ("MapName", "IP", "Port")
+
+
+class SnapshotDiff:
+    """
+    Changes between two snapshots, keyed by server Name.
+
+      population   Name → (old NumPlayers, new NumPlayers), for servers in both
+      appeared     Names only in the new snapshot
+      disappeared  Names only in the old snapshot
+      relocated    Names whose MapName / IP / Port changed
+    """
+
+    __slots__ = ("population", "appeared", "disappeared", "relocated")
+
+    def __init__(self, population=None, appeared=(), disappeared=(), relocated=()) -> None:
+        self.population:  dict[str, tuple[int, int]] = population or {}
+        self.appeared:    frozenset[str] = frozenset(appeared)
+        self.disappeared: frozenset[str] = frozenset(disappeared)
+        self.relocated:   frozenset[str] = frozenset(relocated)
+
+    def __bool__(self) -> bool:
+        return bool(self.population or self.appeared or self.disappeared or self.relocated)
+
+    def __repr__(self) -> str:
+        return (f"SnapshotDiff(population={len(self.population)}, appeared={len(self.appeared)}, "
+                f"disappeared={len(self.disappeared)}, relocated={len(self.relocated)})")
+
+    def merge(self, later: "SnapshotDiff") -> "SnapshotDiff":
+        """
+        One diff covering self followed by later. Conservative: every Name either
+        diff touched stays touched, with population spanning first old → last new.
+        """
+        population = dict(self.population)
+        for name, (before, after) in later.population.items():
+            population[name] = (population.get(name, (before,))[0], after)
+        return SnapshotDiff(
+            population,
+            self.appeared | later.appeared,
+            self.disappeared | later.disappeared,
+            self.relocated | later.relocated,
+        )
+
+    def touched(self) -> frozenset[str]:
+        """Every Name whose population or presence changed (what population consumers re-check)."""
+        return frozenset(self.population).union(self.appeared, self.disappeared)
+
+
+def merge_snapshot_events(older: tuple, newer: tuple) -> tuple:
+    """EventBus merge for ("snapshot", snapshot, diff) events: newest snapshot, combined diff."""
+    (_, older_diff), (snapshot, newer_diff) = older, newer
+    return snapshot, older_diff.merge(newer_diff)
+
+
+class ServerSnapshot:
+    """Read-only server list plus lookup indexes. Build a new one per refresh."""
+
+    __slots__ = ("records", "_by_name", "_by_number", "_by_prefix", "_lower", "_grams")
+
+    def __init__(self, records: Iterable[dict] = ()) -> None:
+        recs = tuple(r for r in records if r.get("Name"))
+        lower = tuple(r["Name"].lower() for r in recs)
+
+        by_name: dict[str, dict]          = {}
+        by_number: dict[str, dict]        = {}
+        by_prefix: dict[str, list[dict]]  = {}
+        grams: dict[str, list[int]]       = {}
+
+        for i, rec in enumerate(recs):
+            by_name.setdefault(lower[i], rec)
+            num = server_number(rec["Name"])
+            if num and num not in by_number:
+                by_number[num] = rec
+                for end in range(1, len(num) + 1):
+                    by_prefix.setdefault(num[:end], []).append(rec)
+            for g in _trigrams(lower[i]):
+                grams.setdefault(g, []).append(i)
+
+        self.records    = recs
+        self._lower     = lower
+        self._by_name   = MappingProxyType(by_name)
+        self._by_number = MappingProxyType(by_number)
+        self._by_prefix = MappingProxyType({k: tuple(v) for k, v in by_prefix.items()})
+        self._grams     = MappingProxyType({k: tuple(v) for k, v in grams.items()})
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __bool__(self) -> bool:
+        return bool(self.records)
+
+    def diff(self, prev: "ServerSnapshot") -> SnapshotDiff:
+        """Changes from prev to this snapshot. O(servers) dict lookups."""
+        population: dict[str, tuple[int, int]] = {}
+        appeared, relocated = [], []
+        for lower, rec in self._by_name.items():
+            old = prev._by_name.get(lower)
+            if old is None:
+                appeared.append(rec["Name"])
+                continue
+            before, after = old.get("NumPlayers") or 0, rec.get("NumPlayers") or 0
+            if before != after:
+                population[rec["Name"]] = (before, after)
+            if any(old.get(f) != rec.get(f) for f in _LOCATION_FIELDS):
+                relocated.append(rec["Name"])
+        disappeared = [old["Name"] for lower, old in prev._by_name.items() if lower not in self._by_name]
+        return SnapshotDiff(population, appeared, disappeared, relocated)
+
+    def get(self, query: str) -> dict | None:
+        """
+        Resolve a server by full Name (autocomplete value) or by server number.
+        'TheIsland2154' also resolves, as long as it is part of the record's Name.
+        """
+        q = (query or "").strip().lower()
+        if not q:
+            return None
+        rec = self._by_name.get(q)
+        if rec is not None:
+            return rec
+        num = server_number(q)
+        rec = self._by_number.get(num) if num else None
+        if rec is None:
+            return None
+        if q.isdigit() or q in rec["Name"].lower():
+            return rec
+        return None
+
+    def search(self, query: str, limit: int = 25) -> list[dict]:
+        """Autocomplete candidates for a partial server number or name."""
+        q = (query or "").strip().lower()
+        if not q:
+            return list(self.records[:limit])
+
+        out: list[dict] = []
+        if q.isdigit():
+            out.extend(self._by_prefix.get(q, ())[:limit])
+            if len(out) >= limit:
+                return out
+
+        seen = {id(r) for r in out}
+        if len(q) >= 3:
+            # Shortest posting list bounds the work; every candidate is verified.
+            postings = [self._grams.get(g, ()) for g in _trigrams(q)]
+            candidates = min(postings, key=len)
+        else:
+            candidates = range(len(self.records))
+
+        for i in candidates:
+            rec = self.records[i]
+            if id(rec) not in seen and q in self._lower[i]:
+                out.append(rec)
+                if len(out) >= limit:
+                    break
+        return out
@@ -0,0 +1,93 @@
+"""
+Module: cogs/vc_renamer.py
+Description: Budgeted voice-channel counter renames.
+
+Discord allows roughly 2 name changes per channel per 10 minutes. Renaming on
+every population change burns that budget in one tick and the rest come back
+as 429s. VoiceRenameManager sits between update_monitors and the REST
+scheduler:
+
+  - request() records only the latest desired name per channel; a name that
+    already matches the channel (the count came back) cancels the pending rename.
+  - take_due() hands out renames only for channels with budget left, oldest
+    stale counter first, and charges the budget as it does so.
+  - A 429 blocks the channel until Discord's retry_after has passed.
+
+Author: pwnedByJT
+"""
+
+import time
+from collections import deque
+
+
+class VoiceRenameManager:
+
+    def __init__(self, budget: int = 2, window: float = 600.0) -> None:
+        self.budget = budget
+        self.window = window
+        self._desired:       dict[int, str]          = {}
+        self._stale_since:   dict[int, float]        = {}
+        self._sent:          dict[int, deque[float]] = {}
+        self._blocked_until: dict[int, float]        = {}
+        self._inflight:      set[int]                = set()
+
+    def __len__(self) -> int:
+        return len(self._desired)
+
+    def request(self, channel_id: int, desired: str, current: str, now: float | None = None) -> None:
+        """Record the name channel_id should show. Latest call wins."""
+        if desired == current:
+            self._desired.pop(channel_id, None)
+            self._stale_since.pop(channel_id, None)
+            return
+        self._desired[channel_id] = desired
+        self._stale_since.setdefault(channel_id, time.monotonic() if now is None else now)
+
+    def _has_budget(self, channel_id: int, now: float) -> bool:
+        if now < self._blocked_until.get(channel_id, 0.0):
+            return False
+        sent = self._sent.get(channel_id)
+        if not sent:
+            return True
+        while sent and now - sent[0] >= self.window:
+            sent.popleft()
+        return len(sent) < self.budget
+
+    def take_due(self, now: float | None = None) -> list[tuple[int, str]]:
+        """
+        (channel_id, name) pairs to rename now, most stale first. Each one is
+        charged against its channel's budget and counted as in flight until
+        done() or forget().
+        """
+        now = time.monotonic() if now is None else now
+        due = sorted(
+            (ch for ch in self._desired if ch not in self._inflight and self._has_budget(ch, now)),
+            key=self._stale_since.__getitem__,
+        )
+        for ch in due:
+            self._sent.setdefault(ch, deque()).append(now)
+            self._inflight.add(ch)
+        return [(ch, self._desired[ch]) for ch in due]
+
+    def done(self, channel_id: int, name: str) -> None:
+        """The rename to name went through."""
+        self._inflight.discard(channel_id)
+        if self._desired.get(channel_id) == name:
+            del self._desired[channel_id]
+            self._stale_since.pop(channel_id, None)
+
+    def failed(self, channel_id: int) -> None:
+        """The rename failed; keep the desired name and retry once budget allows."""
+        self._inflight.discard(channel_id)
+
+    def rate_limited(self, channel_id: int, retry_after: float, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._blocked_until[channel_id] = max(self._blocked_until.get(channel_id, 0.0), now + retry_after)
+
+    def forget(self, channel_id: int) -> None:
+        """Drop all state for a deleted or inaccessible channel."""
+        self._desired.pop(channel_id, None)
+        self._stale_since.pop(channel_id, None)
+        self._sent.pop(channel_id, None)
+        self._blocked_until.pop(channel_id, None)
+        self._inflight.discard(channel_id)
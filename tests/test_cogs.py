@@ -46,6 +46,15 @@ def make_bot() -> commands.Bot:
     return commands.Bot(command_prefix="!", intents=discord.Intents.none())
 
 
+def make_interaction():
+    """Interaction stand-in for calling slash-command callbacks directly."""
+    from unittest.mock import AsyncMock, MagicMock
+    itxn = MagicMock()
+    itxn.response.defer = AsyncMock()
+    itxn.followup.send = AsyncMock()
+    return itxn
+
+
 # ===========================================================================
 # CONFIG
 # ===========================================================================
@@ -68,6 +77,45 @@ class TestConfig:
         assert Config.ALERT_THRESHOLD > 0
 
 
+# ===========================================================================
+# STARTUP — `python -X importtime -c "import ARK"` in a clean interpreter
+# ===========================================================================
+
+@pytest.fixture(scope="module")
+def importtime():
+    """{module: cumulative import µs} parsed from -X importtime output."""
+    import subprocess
+    import sys
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import ARK"],
+        cwd=repo_root, capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class TestImportTime:
+    # Heavy modules that must only load on first use (chart rendering).
+    LAZY_MODULES = ("matplotlib", "numpy", "PIL", "multiprocessing")
+    # Generous ceiling for CI runners; ARK imports in ~0.35 s on a laptop.
+    IMPORT_BUDGET_US = 1_500_000
+
+    def test_heavy_modules_are_not_imported_at_startup(self, importtime):
+        loaded = [m for m in importtime if m.split(".")[0] in self.LAZY_MODULES]
+        assert loaded == [], f"imported at startup: {loaded[:5]}"
+
+    def test_ark_import_within_budget(self, importtime):
+        assert importtime["ARK"] < self.IMPORT_BUDGET_US
+
+
 # ===========================================================================
 # DATA LAYER — synchronous, zero Discord, zero network
 # ===========================================================================
@@ -241,8 +289,861 @@ class TestBossData:
 
 
 # ===========================================================================
-# DATABASE ENGINE — async, temp file (NOT :memory: — each method opens its
-# own connection, so an in-memory DB would lose the schema between calls)
+# SERVER SNAPSHOT — indexed official-server-list lookups
+# ===========================================================================
+
+class TestServerSnapshot:
+
+    @pytest.fixture
+    def snapshot(self):
+        from cogs.server_snapshot import ServerSnapshot
+        return ServerSnapshot([
+            {"Name": "NA-PVP-TheIsland21",   "NumPlayers": 5},
+            {"Name": "NA-PVP-TheIsland2154", "NumPlayers": 40},
+            {"Name": "EU-PVE-Ragnarok2155",  "NumPlayers": 12},
+            {"Name": "NA-PVP-TheIsland210",  "NumPlayers": 0},
+        ])
+
+    def test_server_number_parses_trailing_digits(self):
+        from cogs.server_snapshot import server_number
+        assert server_number("NA-PVP-TheIsland2154") == "2154"
+        assert server_number("2154") == "2154"
+        assert server_number("NoDigitsHere") is None
+
+    def test_get_by_number_is_exact(self, snapshot):
+        assert snapshot.get("21")["Name"] == "NA-PVP-TheIsland21"
+        assert snapshot.get("2154")["Name"] == "NA-PVP-TheIsland2154"
+        assert snapshot.get("215") is None
+
+    def test_get_by_full_name_and_partial_name(self, snapshot):
+        assert snapshot.get("NA-PVP-TheIsland2154")["NumPlayers"] == 40
+        assert snapshot.get("ragnarok2155")["NumPlayers"] == 12
+        assert snapshot.get("Scorched2155") is None
+
+    def test_search_number_prefix(self, snapshot):
+        names = [r["Name"] for r in snapshot.search("215")]
+        assert names == ["NA-PVP-TheIsland2154", "EU-PVE-Ragnarok2155"]
+
+    def test_search_substring_and_limit(self, snapshot):
+        assert len(snapshot.search("island")) == 3
+        assert len(snapshot.search("island", limit=2)) == 2
+        assert snapshot.search("scorched") == []
+
+    def test_empty_snapshot_is_falsy(self):
+        from cogs.server_snapshot import ServerSnapshot
+        assert not ServerSnapshot()
+        assert ServerSnapshot().get("2154") is None
+
+    def test_diff_reports_each_kind_of_change(self, snapshot):
+        from cogs.server_snapshot import ServerSnapshot
+        nxt = ServerSnapshot([
+            {"Name": "NA-PVP-TheIsland21",   "NumPlayers": 5},
+            {"Name": "NA-PVP-TheIsland2154", "NumPlayers": 38},
+            {"Name": "EU-PVE-Ragnarok2155",  "NumPlayers": 12, "IP": "10.0.0.2"},
+            {"Name": "NA-PVP-Fjordur3001",   "NumPlayers": 7},
+        ])
+        diff = nxt.diff(snapshot)
+        assert diff.population == {"NA-PVP-TheIsland2154": (40, 38)}
+        assert diff.appeared == {"NA-PVP-Fjordur3001"}
+        assert diff.disappeared == {"NA-PVP-TheIsland210"}
+        assert diff.relocated == {"EU-PVE-Ragnarok2155"}
+        assert diff.touched() == {"NA-PVP-TheIsland2154", "NA-PVP-Fjordur3001", "NA-PVP-TheIsland210"}
+        assert not nxt.diff(nxt)
+
+    def test_merged_diff_keeps_every_change(self, snapshot):
+        from cogs.server_snapshot import SnapshotDiff, merge_snapshot_events
+        a = SnapshotDiff({"X": (10, 12), "Y": (3, 4)}, appeared=["Z"])
+        b = SnapshotDiff({"X": (12, 9)}, disappeared=["W"], relocated=["Y"])
+        latest, merged = merge_snapshot_events(("old", a), ("new", b))
+        assert latest == "new"
+        assert merged.population == {"X": (10, 9), "Y": (3, 4)}
+        assert merged.touched() == {"X", "Y", "Z", "W"}
+        assert merged.relocated == {"Y"}
+
+    def test_diff_from_empty_is_all_appeared(self, snapshot):
+        from cogs.server_snapshot import ServerSnapshot
+        diff = snapshot.diff(ServerSnapshot())
+        assert len(diff.appeared) == 4 and not diff.population
+
+
+# ===========================================================================
+# CHART RENDERER — process pool, spawned workers
+# ===========================================================================
+
+class TestChartRenderer:
+
+    ARGS = ("2154  —  last 24h", [1_700_000_000, 1_700_000_090, 1_700_000_180], [10, 20, 15], 15.0, 20)
+
+    @pytest.fixture
+    def renderer(self):
+        from cogs.chart_render import ChartRenderer
+        r = ChartRenderer(workers=1, max_pending=2)
+        yield r
+        r.close()
+
+    async def test_render_returns_png(self, renderer):
+        from cogs.chart_render import render_popgraph
+        png = await renderer.submit("k", render_popgraph, *self.ARGS)
+        assert png.startswith(b"\x89PNG")
+
+    def test_lttb_caps_points_and_keeps_drops(self):
+        from cogs.chart_render import lttb
+        xs = [1_700_000_000 + i * 60 for i in range(43_200)]          # a month, one sample a minute
+        ys = [40 + (i // 500) % 3 for i in range(len(xs))]
+        ys[20_000] = 0                                               # one wiped-server sample
+        ys[30_000] = 70
+        out_x, out_y = lttb(xs, ys, 1100)
+        assert len(out_x) == len(out_y) == 1100
+        assert (out_x[0], out_x[-1]) == (xs[0], xs[-1])
+        assert out_x == sorted(out_x)
+        assert (xs[20_000], 0) in zip(out_x, out_y)
+        assert (xs[30_000], 70) in zip(out_x, out_y)
+        assert lttb(xs[:5], ys[:5], 1100) == (xs[:5], ys[:5])
+
+    def test_envelope_keeps_drops_averages_hide(self):
+        from cogs.chart_render import envelope
+        xs = [1_700_000_000 + i * 900 for i in range(2880)]          # a month of 15-minute buckets
+        lows, peaks = [38] * len(xs), [45] * len(xs)
+        lows[1234], peaks[2345] = 0, 70                              # averaged away, kept here
+        out_x, out_lo, out_hi = envelope(xs, lows, peaks, 1100)
+        assert len(out_x) == len(out_lo) == len(out_hi) == 1100
+        assert out_x[0] == xs[0] and out_x == sorted(out_x)
+        assert min(out_lo) == 0 and max(out_hi) == 70
+        assert out_lo.count(0) == 1 and out_hi.count(70) == 1
+        assert envelope(xs[:5], lows[:5], peaks[:5], 1100) == (xs[:5], lows[:5], peaks[:5])
+
+    async def test_render_with_envelope_returns_png(self, renderer):
+        from cogs.chart_render import render_popgraph
+        title, xs, ys, avg, peak = self.ARGS
+        png = await renderer.submit("band", render_popgraph, title, xs, ys, avg, peak, [5, 12, 0], [14, 30, 22])
+        assert png.startswith(b"\x89PNG")
+
+    async def test_identical_requests_share_one_render(self, renderer):
+        import asyncio
+        from cogs.chart_render import render_popgraph
+        a, b = await asyncio.gather(
+            renderer.submit("same", render_popgraph, *self.ARGS),
+            renderer.submit("same", render_popgraph, *self.ARGS),
+        )
+        assert a == b
+        assert renderer.stats["rendered"] == 1
+        assert renderer.stats["shared"] == 1
+
+    async def test_dead_worker_pool_is_replaced(self, renderer):
+        import os
+        from concurrent.futures import BrokenExecutor
+        from cogs.chart_render import render_popgraph
+        with pytest.raises(BrokenExecutor):
+            await renderer.submit("die", os._exit, 1)      # the worker process dies mid-task
+        assert renderer.stats["broken"] == 1 and renderer._pool is None
+        png = await renderer.submit("k", render_popgraph, *self.ARGS)
+        assert png.startswith(b"\x89PNG")
+
+    async def test_queue_full_rejects(self, renderer):
+        import asyncio
+        from cogs.chart_render import ChartQueueFull, render_popgraph
+        results = await asyncio.gather(
+            *(renderer.submit(i, render_popgraph, *self.ARGS) for i in range(3)),
+            return_exceptions=True,
+        )
+        assert isinstance(results[2], ChartQueueFull)
+        assert renderer.stats["rejected"] == 1
+
+
+class TestRenderCache:
+
+    def test_hit_requires_matching_version(self):
+        from cogs.chart_render import RenderCache
+        cache = RenderCache(max_bytes=1000)
+        cache.put(("2154", 24), 100, b"png-a", {"avg": 1})
+        assert cache.get(("2154", 24), 100) == (b"png-a", {"avg": 1})
+        assert cache.get(("2154", 24), 190) is None
+        assert cache.get(("2154", 48), 100) is None
+
+    def test_newer_version_replaces_series(self):
+        from cogs.chart_render import RenderCache
+        cache = RenderCache(max_bytes=1000)
+        cache.put("s", 1, b"x" * 100)
+        cache.put("s", 2, b"y" * 50)
+        assert len(cache) == 1
+        assert cache.nbytes == 50
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        from cogs.chart_render import RenderCache
+        cache = RenderCache(max_bytes=250)
+        cache.put("a", 1, b"a" * 100)
+        cache.put("b", 1, b"b" * 100)
+        cache.get("a", 1)
+        cache.put("c", 1, b"c" * 100)
+        assert cache.get("b", 1) is None
+        assert cache.get("a", 1) is not None
+        assert cache.nbytes <= 250
+
+
+# ===========================================================================
+# OFFICIAL FEED — conditional GET, compression, adaptive interval (local server)
+# ===========================================================================
+
+class TestOfficialFeed:
+
+    @pytest.fixture
+    async def server(self):
+        import json
+        from aiohttp import web
+
+        state = {"body": json.dumps([{"Name": "NA-PVP-TheIsland2154", "NumPlayers": 40}] * 200),
+                 "etag": '"v1"', "validators": True}
+
+        async def handler(request):
+            if state["validators"] and request.headers.get("If-None-Match") == state["etag"]:
+                return web.Response(status=304)
+            resp = web.Response(text=state["body"], content_type="application/json")
+            if state["validators"]:
+                resp.headers["ETag"] = state["etag"]
+            resp.enable_compression()
+            return resp
+
+        app = web.Application()
+        app.router.add_get("/list.json", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        yield f"http://127.0.0.1:{port}/list.json", state
+        await runner.cleanup()
+
+    async def test_not_modified_skips_parse_and_relaxes(self, server):
+        from cogs.official_feed import OfficialFeed
+        url, state = server
+        feed = OfficialFeed(url, base_interval=60, max_interval=180)
+        try:
+            assert len(await feed.fetch()) == 200
+            assert feed.interval == 60
+            assert await feed.fetch() is None
+            assert feed.metrics["not_modified"] == 1 and feed.metrics["changed"] == 1
+            assert feed.interval == 90
+            # gzip on the wire: far fewer bytes than the decoded body
+            assert feed.metrics["bytes_wire"] < feed.metrics["bytes_decoded"] / 5
+            assert "not_modified=1 changed=1" in feed.format_metrics()
+
+            state["body"], state["etag"] = '[{"Name": "X", "NumPlayers": 1}]', '"v2"'
+            [rec] = await feed.fetch()
+            assert (rec["Name"], rec.get("NumPlayers"), rec.get("MaxPlayers", 70)) == ("X", 1, 70)
+        finally:
+            await feed.close()
+
+    async def test_identical_body_without_validators_is_not_reparsed(self, server):
+        from cogs.official_feed import OfficialFeed
+        url, state = server
+        state["validators"] = False
+        feed = OfficialFeed(url, base_interval=60)
+        try:
+            assert await feed.fetch() is not None
+            assert await feed.fetch() is None
+            assert await feed.fetch() is None
+            assert feed.metrics["unchanged"] == 2
+            assert feed.interval == 135                 # ×1.5 twice
+            assert feed.confirmed_at > 0
+
+            # Changes step back toward the base cadence, never below it.
+            for n in range(3):
+                state["body"] = f'[{{"Name": "X", "NumPlayers": {n}}}]'
+                assert await feed.fetch() is not None
+            assert feed.interval == 60
+        finally:
+            await feed.close()
+
+    def test_parser_handles_any_chunk_boundary(self):
+        import json
+        from cogs.official_feed import ServerListParser
+        from cogs.server_snapshot import ServerRecord
+        rows = [{"Name": f"EU-PVP-Ragnarök{n}", "NumPlayers": n, "MaxPlayers": 70, "MapName": "Ragnarok_WP",
+                 "IP": "1.2.3.4", "Port": 7777 + n, "ClusterId": "x" * 40, "SessionIsPve": 0} for n in range(50)]
+        raw = ("\ufeff[\n" + ",\n".join(json.dumps(r, ensure_ascii=False) for r in rows) + "\n]").encode()
+        for size in (1, 7, 4096):
+            parser, out = ServerListParser(), []
+            for i in range(0, len(raw), size):
+                out.extend(parser.feed(raw[i:i + size]))
+            out.extend(parser.feed(b"", final=True))
+            assert out == [ServerRecord.from_dict(r) for r in rows]
+        assert out[3]["Name"] == "EU-PVP-Ragnarök3" and out[3].get("Port") == 7780
+        assert not hasattr(out[0], "ClusterId")
+
+    def test_parser_rejects_truncated_body(self):
+        from cogs.official_feed import ServerListParser
+        parser = ServerListParser()
+        parser.feed(b'[{"Name": "A", "NumPlayers": 1}, {"Name": "B", ')
+        with pytest.raises(ValueError):
+            parser.feed(b"", final=True)
+
+    def test_records_use_less_memory_than_full_dicts(self):
+        import json
+        import tracemalloc
+        from cogs.official_feed import ServerListParser
+        extra = {f"Field{i}": "value" * 4 for i in range(25)}
+        raw = json.dumps([{"Name": f"NA-PVP-TheIsland{n}", "NumPlayers": n % 70, "MaxPlayers": 70,
+                           "MapName": "TheIsland_WP", **extra} for n in range(3000)]).encode()
+
+        tracemalloc.start()
+        full = json.loads(raw.decode())
+        _, peak_full = tracemalloc.get_traced_memory()
+        del full
+        tracemalloc.reset_peak()
+        parser, records = ServerListParser(), []
+        for i in range(0, len(raw), 64 * 1024):
+            records.extend(parser.feed(raw[i:i + 64 * 1024]))
+        records.extend(parser.feed(b"", final=True))
+        _, peak_stream = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(records) == 3000
+        assert peak_stream * 3 < peak_full
+
+    @pytest.mark.parametrize("encoding, wbits", [
+        ("gzip", 31),
+        ("deflate", 15),                 # zlib-framed, per the RFC
+        ("deflate", -15),                # bare deflate stream, as some servers send it
+    ])
+    async def test_chunked_compressed_body_counts_wire_bytes(self, encoding, wbits):
+        import json
+        import zlib
+        from aiohttp import web
+        from cogs.official_feed import OfficialFeed
+        body = json.dumps([{"Name": f"NA-PVP-TheIsland{n}", "NumPlayers": n % 70} for n in range(3000)]).encode()
+        packer = zlib.compressobj(wbits=wbits)
+        packed = packer.compress(body) + packer.flush()
+
+        async def handler(request):
+            # Streamed without Content-Length, as the CDN does for chunked gzip.
+            resp = web.StreamResponse(headers={"Content-Encoding": encoding, "Content-Type": "application/json"})
+            await resp.prepare(request)
+            for i in range(0, len(packed), 4096):
+                await resp.write(packed[i:i + 4096])
+            await resp.write_eof()
+            return resp
+
+        app = web.Application()
+        app.router.add_get("/list.json", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        feed = OfficialFeed(f"http://127.0.0.1:{runner.addresses[0][1]}/list.json")
+        try:
+            assert len(await feed.fetch()) == 3000
+            assert feed.metrics["errors"] == 0
+            assert feed.metrics["bytes_wire"] == len(packed)
+            assert feed.metrics["bytes_decoded"] == len(body)
+        finally:
+            await feed.close()
+            await runner.cleanup()
+
+    async def test_errors_return_none(self):
+        from cogs.official_feed import OfficialFeed
+        feed = OfficialFeed("http://127.0.0.1:9/unreachable", timeout=2)
+        try:
+            assert await feed.fetch() is None
+            assert feed.metrics["errors"] == 1
+        finally:
+            await feed.close()
+
+
+# ===========================================================================
+# EVENT BUS — per-subscriber tasks, bounded queues, metrics
+# ===========================================================================
+
+class TestEventBus:
+
+    @pytest.fixture
+    async def bus(self):
+        from cogs.event_bus import EventBus
+        b = EventBus(maxsize=1)
+        yield b
+        await b.close()
+
+    async def test_publish_reaches_every_subscriber(self, bus):
+        seen = []
+
+        async def a(x): seen.append(("a", x))
+        async def b(x): seen.append(("b", x))
+
+        bus.subscribe("snapshot", a)
+        bus.subscribe("snapshot", b)
+        assert bus.publish("snapshot", 1) == 2
+        assert bus.publish("other", 1) == 0
+        await bus.drain()
+        assert sorted(seen) == [("a", 1), ("b", 1)]
+        assert bus.metrics()["snapshot:a"]["handled"] == 1
+
+    async def test_slow_subscriber_does_not_delay_others(self, bus):
+        import asyncio
+        gate, fast_done = asyncio.Event(), asyncio.Event()
+
+        async def slow(x): await gate.wait()
+        async def fast(x): fast_done.set()
+
+        bus.subscribe("snapshot", slow)
+        bus.subscribe("snapshot", fast)
+        bus.publish("snapshot", 1)
+        await asyncio.wait_for(fast_done.wait(), timeout=1)
+        gate.set()
+        await bus.drain()
+
+    async def test_full_queue_drops_or_merges_oldest(self, bus):
+        import asyncio
+        gate, plain, merged = asyncio.Event(), [], []
+
+        async def blocked(x): await gate.wait(); plain.append(x)
+        async def summing(x): await gate.wait(); merged.append(x)
+
+        bus.subscribe("t", blocked)
+        bus.subscribe("t", summing, merge=lambda old, new: (old[0] + new[0],))
+        for x in (1, 2, 3, 4):
+            bus.publish("t", x)
+            await asyncio.sleep(0)          # let the first event start and block
+        gate.set()
+        await bus.drain()
+        assert plain == [1, 4]
+        assert merged == [1, 2 + 3 + 4]
+        assert bus.metrics()["t:blocked"]["dropped"] == 2
+
+    async def test_merged_events_stay_in_publish_order(self):
+        import asyncio
+        from cogs.event_bus import EventBus
+        bus, gate, seen = EventBus(maxsize=2), asyncio.Event(), []
+
+        async def handler(xs): await gate.wait(); seen.append(xs)
+
+        bus.subscribe("t", handler, merge=lambda old, new: (old[0] + new[0],))
+        for x in (1, 2, 3, 4, 5):
+            bus.publish("t", [x])
+            await asyncio.sleep(0)
+        gate.set()
+        await bus.drain()
+        assert seen == [[1], [2], [3, 4, 5]]
+        assert bus.metrics()["t:handler"]["dropped"] == 2
+        assert bus.format_metrics()[0].startswith("t:handler delivered=5 handled=3 dropped=2")
+        await bus.close()
+
+    async def test_handler_errors_are_counted_not_fatal(self, bus):
+        async def boom(x): raise ValueError(x)
+
+        bus.subscribe("t", boom)
+        bus.publish("t", 1)
+        bus.publish("t", 2)
+        await bus.drain()
+        m = bus.metrics()["t:boom"]
+        assert m["errors"] == m["handled"] == 2 - m["dropped"]
+
+
+# ===========================================================================
+# REST PACING — token buckets, coalescing, 429 retry, VC rename budget
+# ===========================================================================
+
+class TestRestScheduler:
+
+    @staticmethod
+    def _http_429(retry_after: float):
+        from types import SimpleNamespace
+        response = SimpleNamespace(status=429, reason="Too Many Requests",
+                                   headers={"Retry-After": str(retry_after)})
+        return discord.HTTPException(response, {"message": "rate limited", "retry_after": retry_after})
+
+    def test_bucket_paces_after_capacity(self):
+        from cogs.rest_scheduler import TokenBucket
+        b = TokenBucket(2, 10.0)
+        now = b.updated
+        b.take(now); b.take(now)
+        assert b.wait_time(now) == pytest.approx(5.0)
+        assert b.wait_time(now + 5.0) == 0.0
+
+    def test_bucket_learns_exhausted_headers(self):
+        from cogs.rest_scheduler import TokenBucket
+        b = TokenBucket(5, 5.0)
+        now = b.updated
+        b.learn({"X-RateLimit-Limit": "3", "X-RateLimit-Remaining": "0",
+                 "X-RateLimit-Reset-After": "7.5"}, now)
+        assert b.capacity == 3
+        assert b.wait_time(now) == pytest.approx(7.5)
+
+    def test_bucket_window_comes_from_a_fresh_bucket_only(self):
+        from cogs.rest_scheduler import TokenBucket
+        b = TokenBucket(5, 5.0)
+        now = b.updated
+        # Later in a window, Reset-After is only the time left in it.
+        b.learn({"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "2", "X-RateLimit-Reset-After": "30"}, now)
+        assert b.per == 5.0
+        # The first request of a window reports the whole window, both ways.
+        b.learn({"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "8"}, now)
+        assert b.per == 8.0
+        b.learn({"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "4"}, now)
+        assert b.per == 4.0
+
+    async def test_trace_feeds_response_headers_to_route_buckets(self):
+        import aiohttp
+        from aiohttp import web
+        from cogs.rest_scheduler import RateLimitTrace, RestScheduler
+
+        from cogs.rest_scheduler import channel_route
+
+        async def edit(request):
+            return web.json_response({}, headers={
+                "X-RateLimit-Limit": "2", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "4.0"})
+
+        async def send(request):
+            return web.json_response({}, headers={
+                "X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "5.0"})
+        app = web.Application()
+        app.router.add_patch("/api/v10/channels/{cid}/messages/{mid}", edit)
+        app.router.add_post("/api/v10/channels/{cid}/messages", send)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        rest, trace = RestScheduler(), RateLimitTrace()
+        trace.attach(rest)
+        try:
+            # A successful response — discord.py would never show it to the caller.
+            async with aiohttp.ClientSession(trace_configs=[trace.config]) as session:
+                async def patch():
+                    async with session.patch(f"http://127.0.0.1:{port}/api/v10/channels/123/messages/9") as r:
+                        return r.status
+
+                async def post():
+                    async with session.post(f"http://127.0.0.1:{port}/api/v10/channels/123/messages") as r:
+                        return r.status
+                rest.submit(channel_route("PATCH", 123, messages=True), "msg:9", patch)
+                rest.submit(channel_route("POST", 123, messages=True), "alert", post)
+                await rest.drain()
+            # Edits and sends to one channel are limited separately.
+            edits = rest._buckets["PATCH /channels/123/messages"]
+            assert edits.capacity == 2
+            assert edits.wait_time() == pytest.approx(4.0, abs=0.5)
+            sends = rest._buckets["POST /channels/123/messages"]
+            assert sends.capacity == 5 and sends.wait_time() == 0.0
+            assert len(rest._buckets) == 2
+        finally:
+            rest.close()
+            await runner.cleanup()
+
+    async def test_superseded_edits_coalesce(self):
+        from cogs.rest_scheduler import RestScheduler
+        rest, sent = RestScheduler(), []
+
+        def edit(payload):
+            async def call():
+                sent.append(payload)
+            return call
+
+        for payload in ("a", "b", "c"):
+            rest.submit("channel:1", "msg:1", edit(payload))
+        rest.submit("channel:1", "msg:2", edit("other"))
+        await rest.drain()
+        assert sent == ["c", "other"]
+        assert rest.stats["coalesced"] == 2
+
+    async def test_routes_run_concurrently(self):
+        import asyncio
+        from cogs.rest_scheduler import RestScheduler
+        rest, started = RestScheduler(), asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.2)
+
+        async def fast():
+            await started.wait()
+
+        rest.submit("channel:1", "msg:1", slow)
+        rest.submit("channel:2", "msg:2", fast)
+        await asyncio.wait_for(rest.drain(), timeout=0.15 + 0.2)
+        assert rest.stats["sent"] == 2
+
+    async def test_rate_limited_job_is_retried(self):
+        from cogs.rest_scheduler import RestScheduler
+        rest, attempts = RestScheduler(), []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise self._http_429(0.05)
+            return "ok"
+
+        results = []
+        rest.submit("channel:1", "msg:1", call, on_success=results.append)
+        await rest.drain()
+        assert results == ["ok"]
+        assert rest.stats["rate_limited"] == 1
+
+    async def test_errors_go_to_on_error(self):
+        from types import SimpleNamespace
+        from cogs.rest_scheduler import RestScheduler
+        rest, errors = RestScheduler(), []
+
+        async def call():
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "gone")
+
+        rest.submit("channel:1", "msg:1", call, on_error=errors.append)
+        await rest.drain()
+        assert isinstance(errors[0], discord.NotFound)
+        assert rest.stats["failed"] == 1
+
+
+class TestVoiceRenameManager:
+
+    def test_latest_name_wins_and_match_cancels(self):
+        from cogs.vc_renamer import VoiceRenameManager
+        m = VoiceRenameManager()
+        m.request(1, "10/70 | 2154", "9/70 | 2154", now=0)
+        m.request(1, "11/70 | 2154", "9/70 | 2154", now=1)
+        m.request(2, "5/70 | 2155", "5/70 | 2155", now=1)
+        assert m.take_due(now=2) == [(1, "11/70 | 2154")]
+
+    def test_budget_limits_renames_per_window(self):
+        from cogs.vc_renamer import VoiceRenameManager
+        m = VoiceRenameManager(budget=2, window=600)
+        for i, t in enumerate((0, 10, 20)):
+            m.request(1, f"{i}/70", "x", now=t)
+            due = m.take_due(now=t)
+            if due:
+                m.done(*due[0])
+        assert len(m) == 1                       # third rename held back
+        assert m.take_due(now=300) == []
+        assert m.take_due(now=600) == [(1, "2/70")]
+
+    def test_stalest_counter_first(self):
+        from cogs.vc_renamer import VoiceRenameManager
+        m = VoiceRenameManager()
+        m.request(2, "b", "x", now=5)
+        m.request(1, "a", "x", now=1)
+        m.request(2, "b2", "x", now=6)           # newer name keeps its original staleness
+        assert [ch for ch, _ in m.take_due(now=10)] == [1, 2]
+
+    def test_rate_limit_blocks_channel(self):
+        from cogs.vc_renamer import VoiceRenameManager
+        m = VoiceRenameManager(budget=5)
+        m.request(1, "a", "x", now=0)
+        m.take_due(now=0)
+        m.rate_limited(1, 120, now=0)
+        m.failed(1)
+        assert m.take_due(now=60) == []
+        assert m.take_due(now=121) == [(1, "a")]
+
+
+# ===========================================================================
+# POP ALERTS — sorted-threshold index, per-channel message packing
+# ===========================================================================
+
+class TestPopAlertIndex:
+
+    @staticmethod
+    def _index(*alerts):
+        from cogs.pop_alerts import PopAlertIndex
+        return PopAlertIndex(
+            {"user_id": uid, "server_name": srv, "threshold": t, "channel_id": 0, "triggered": trig}
+            for uid, srv, t, trig in alerts
+        )
+
+    def test_first_pass_evaluates_everything(self):
+        idx = self._index((1, "2154", 10, False), (2, "2154", 20, True), (3, "2154", 5, True))
+        flipped = idx.update("2154", 8)
+        assert {(a.user_id, a.triggered) for a in flipped} == {(1, True), (3, False)}
+
+    def test_only_crossed_thresholds_flip(self):
+        idx = self._index(*((uid, "2154", uid, False) for uid in range(1, 71)))
+        idx.update("2154", 70)
+        assert [a.user_id for a in idx.update("2154", 40)] == list(range(41, 71))
+        assert idx.update("2154", 40) == []                      # unchanged population
+        assert [a.user_id for a in idx.update("2154", 38)] == [39, 40]
+        rearmed = idx.update("2154", 45)
+        assert [a.user_id for a in rearmed] == [39, 40, 41, 42, 43, 44, 45]
+        assert not any(a.triggered for a in rearmed)
+
+    def test_set_rearms_and_reevaluates(self):
+        idx = self._index((1, "2154", 10, False))
+        idx.update("2154", 30)
+        alert = idx.set(1, "2154", 50, channel_id=9)
+        assert alert.channel_id == 0                             # original channel kept
+        assert idx.update("2154", 30) == [alert] and alert.triggered
+
+    def test_unevaluated_until_first_update_then_bound_by_name(self):
+        idx = self._index((1, "2154", 10, False), (2, "NA-PVP-TheIsland2154", 20, False))
+        assert sorted(idx.unevaluated()) == ["2154", "NA-PVP-TheIsland2154"]
+        for key in idx.unevaluated():
+            idx.bind("NA-PVP-TheIsland2154", key)
+            idx.update(key, 30)
+        assert idx.unevaluated() == []
+        assert sorted(idx.keys_for("NA-PVP-TheIsland2154")) == ["2154", "NA-PVP-TheIsland2154"]
+        idx.set(1, "2154", 40, channel_id=0)
+        assert idx.unevaluated() == ["2154"]
+
+    def test_remove_drops_empty_server(self):
+        idx = self._index((1, "2154", 10, False), (2, "2018", 10, False))
+        assert idx.remove(1, "2154")
+        assert not idx.remove(1, "2154")
+        assert idx.servers() == ["2018"] and len(idx) == 1
+
+    def test_pack_groups_one_channel_into_one_message(self):
+        from cogs.pop_alerts import Alert, pack_alert_messages
+        triggered = [(Alert(1, "2154", 10, 7), 8), (Alert(2, "2154", 20, 7), 8), (Alert(3, "2018", 5, 7), 2)]
+        [msg] = pack_alert_messages(triggered)
+        assert msg.count("[POP ALERT]") == 2
+        assert all(f"<@{uid}>" in msg for uid in (1, 2, 3))
+
+    def test_pack_splits_only_at_limit(self):
+        from cogs.pop_alerts import Alert, pack_alert_messages
+        triggered = [(Alert(10**17 + uid, "2154", 50, 7), 8) for uid in range(200)]
+        messages = pack_alert_messages(triggered)
+        assert len(messages) > 1
+        assert all(len(m) <= 2000 for m in messages)
+        assert all(m.startswith("**[POP ALERT]** **2154**") for m in messages)
+        assert sum(m.count("<@") for m in messages) == 200
+        assert len(messages) == -(-sum(len(m) for m in messages) // 2000)   # no needless splits
+
+
+# ===========================================================================
+# FLEET HISTORY — append-only per-day uint8 columns for every server
+# ===========================================================================
+
+class TestFleetHistory:
+
+    DAY = 86400
+
+    @pytest.fixture
+    def history(self, tmp_path):
+        from cogs.fleet_history import FleetHistory
+        h = FleetHistory(str(tmp_path / "fleet"), keep_days=3)
+        h.open()
+        yield h
+        h.close()
+
+    def test_series_skips_absent_rows_and_clamps(self, history):
+        t0 = 10 * self.DAY + 3600
+        history.append(t0,      [("A", 10), ("B", 300)])
+        history.append(t0 + 60, [("B", 4)])
+        history.append(t0 + 120, [("A", 12), ("B", None), ("C", 7)])
+        now = t0 + 120
+        assert history.timeseries("A", 1, now) == [(t0, 10), (t0 + 120, 12)]
+        assert history.timeseries("B", 1, now) == [(t0, 254), (t0 + 60, 4), (t0 + 120, 0)]
+        assert history.timeseries("C", 1, now) == [(t0 + 120, 7)]
+        assert history.timeseries("Nope", 1, now) is None
+        # Time-weighted: the newest row has not stood yet (as in SQLite).
+        assert history.stats("A", 1, now) == {"current": 12, "avg": 10.0, "peak": 12, "low": 10, "samples": 2}
+        # Stale or repeated timestamps are ignored rather than breaking ordering.
+        history.append(t0, [("A", 70)])
+        assert history.stats("A", 1, now)["samples"] == 2
+
+    def test_long_windows_are_averaged_into_buckets(self, history):
+        t0 = 10 * self.DAY
+        for i in range(12):                       # 3 hours, one row every 15 minutes
+            history.append(t0 + i * 900, [("A", i)])
+        now = t0 + 11 * 900
+        assert len(history.timeseries("A", 3, now)) == 12
+        # Each row stands for at most MAX_GAP of its 900 s; the newest for none.
+        assert history.timeseries("A", 3, now, points=3) == [
+            (t0, 1.5, 0, 3), (t0 + 3600, 5.5, 4, 7), (t0 + 7200, 9.0, 8, 11)]
+
+    def test_averages_are_time_weighted(self, history):
+        t0 = 10 * self.DAY + 3600
+        # A fast poll through a busy minute, then a slow one through a quiet stretch.
+        for ts, pop in ((t0, 40), (t0 + 30, 40), (t0 + 60, 0), (t0 + 240, 0), (t0 + 420, 0), (t0 + 2000, 9)):
+            history.append(ts, [("A", pop)])
+        now = t0 + 2000
+        # 40 for 60 s, 0 for 360 s plus a gap capped at MAX_GAP (600 s), 9 not yet stood.
+        assert history.stats("A", 1, now)["avg"] == round(40 * 60 / 1020, 1)
+        targets = history.scout_targets(min_avg=0, min_samples=1, min_hour_samples=1, now=now)
+        assert targets[0]["weekly_avg"] == round(40 * 60 / 1020, 1)
+        assert targets[0]["window"] == {"hour_utc": 1, "avg_pop": 2.4, "samples": 6}
+
+    async def test_run_keeps_file_work_off_the_event_loop(self, history):
+        import threading
+        loop_thread = threading.get_ident()
+        seen = []
+
+        def append(ts, counts):
+            seen.append(threading.get_ident())
+            type(history).append(history, ts, counts)
+
+        await history.run(append, 10 * self.DAY, [("A", 3)])
+        assert seen and seen[0] != loop_thread
+        assert await history.run(history.stats, "A", 1, 10 * self.DAY) == {
+            "current": 3, "avg": 3.0, "peak": 3, "low": 3, "samples": 1}
+        history.shutdown()
+        assert history._executor is None and history._file is None
+
+    def test_reopen_recovers_from_torn_writes(self, tmp_path, history):
+        from cogs.fleet_history import FleetHistory, _day_file
+        t0 = 20 * self.DAY
+        for i in range(5):
+            history.append(t0 + i * 60, [("A", i), ("B", 50)])
+        history.close()
+        with open(_day_file(history.root, 20), "ab") as f:
+            f.write(b"\x00\x01\x02")             # half a row header
+        with open(tmp_path / "fleet" / "slots.txt", "a") as f:
+            f.write("Half-written-na")             # name without its newline
+
+        reopened = FleetHistory(history.root, keep_days=3)
+        reopened.open()
+        assert reopened.last_ts == t0 + 240 and len(reopened) == 2
+        reopened.append(t0 + 300, [("C", 9), ("A", 5)])
+        reopened.close()
+
+        fresh = FleetHistory(history.root, keep_days=3)
+        fresh.open()
+        assert [c for _, c in fresh.timeseries("A", 1, t0 + 300)] == [0, 1, 2, 3, 4, 5]
+        assert fresh.timeseries("C", 1, t0 + 300) == [(t0 + 300, 9)]
+        assert fresh.timeseries("Half-written-na", 1, t0 + 300) is None
+        fresh.close()
+
+    def test_rolling_over_enforces_retention(self, history):
+        import os
+        for day in range(30, 36):
+            history.append(day * self.DAY + 60, [("A", day)])
+        files = sorted(f for f in os.listdir(history.root) if f.endswith(".u8"))
+        assert len(files) == 3
+        assert [r[1] for r in history.timeseries("A", 24 * 10, 35 * self.DAY + 60)] == [33, 34, 35]
+
+    async def test_scout_targets_match_sqlite(self, tmp_path, history):
+        import time
+        import random
+        from ARK import DatabaseEngine
+        db = DatabaseEngine(str(tmp_path / "stats.db"))
+        await db.initialize()
+        history.keep_days = 30
+        try:
+            rng = random.Random(7)
+            now = int(time.time())
+            # 3 days every 20 minutes, quiet at 09 UTC for every server.
+            for ts in range(now - 3 * self.DAY + 1, now + 1, 1200):
+                rows = [(f"Srv{n}", 1 if (ts // 3600) % 24 == 9 else rng.randint(0, 10 + 4 * n), 70)
+                        for n in range(8)]
+                await db.record_stats_many(rows, ts=ts)
+                history.append(ts, [(name, pop) for name, pop, _ in rows])
+
+            # Both sides time-weight the same rows: same servers, samples,
+            # windows and averages.
+            def shape(results):
+                return [(r["server_name"], r["total_samples"], r["window"]["hour_utc"], r["window"]["samples"])
+                        for r in results]
+
+            expected = await db.get_scout_targets_with_windows(min_avg=3.0, limit=5)
+            fleet = history.scout_targets(min_avg=3.0, limit=5, now=now)
+            assert shape(fleet) == shape(expected)
+            assert [f["weekly_avg"] for f in fleet] == [e["weekly_avg"] for e in expected]
+            assert [f["window"]["avg_pop"] for f in fleet] == [e["window"]["avg_pop"] for e in expected]
+            # Finished days are reduced once, then served from the hourly cache.
+            assert history._hourly
+            assert history.scout_targets(min_avg=3.0, limit=5, now=now) == fleet
+            assert all(r["window"]["hour_utc"] == 9 for r in expected)
+        finally:
+            await db.close()
+
+
+# ===========================================================================
+# DATABASE ENGINE — async, temp file (NOT :memory: — the engine pools
+# several connections, and each :memory: connection is a separate database)
 # ===========================================================================
 
 class TestDatabaseEngine:
@@ -251,10 +1152,15 @@ class TestDatabaseEngine:
     def db_path(self, tmp_path):
         return str(tmp_path / "test_stats.db")
 
-    async def test_initialize_creates_server_stats_table(self, db_path):
+    @pytest.fixture
+    async def db(self, db_path):
+        engine = DatabaseEngine(db_path)
+        await engine.initialize()
+        yield engine
+        await engine.close()
+
+    async def test_initialize_creates_server_stats_table(self, db_path, db):
         import aiosqlite
-        db = DatabaseEngine(db_path)
-        await db.initialize()
         async with aiosqlite.connect(db_path) as conn:
             async with conn.execute(
                 "SELECT name FROM sqlite_master WHERE type='table' AND name='server_stats'"
@@ -262,20 +1168,19 @@ class TestDatabaseEngine:
                 row = await cur.fetchone()
         assert row is not None, "server_stats table was not created"
 
-    async def test_initialize_creates_index(self, db_path):
+    async def test_initialize_creates_clustered_v2_table(self, db_path, db):
         import aiosqlite
-        db = DatabaseEngine(db_path)
-        await db.initialize()
         async with aiosqlite.connect(db_path) as conn:
             async with conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='index' AND name='idx_server_time'"
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name='server_stats'"
             ) as cur:
                 row = await cur.fetchone()
-        assert row is not None, "idx_server_time index was not created"
+            async with conn.execute("PRAGMA user_version") as cur:
+                version = (await cur.fetchone())[0]
+        assert "WITHOUT ROWID" in row[0], "server_stats should be clustered on (server_id, ts)"
+        assert version == DatabaseEngine.STATS_SCHEMA_VERSION
 
-    async def test_record_and_retrieve_stats(self, db_path):
-        db = DatabaseEngine(db_path)
-        await db.initialize()
+    async def test_record_and_retrieve_stats(self, db_path, db):
         await db.record_stats("TestServer", 42, 70)
         stats = await db.get_stats("TestServer", hours=24)
         assert stats is not None
@@ -284,65 +1189,679 @@ class TestDatabaseEngine:
         assert stats["low"] == 42
         assert stats["samples"] == 1
 
-    async def test_get_stats_aggregates_multiple_samples(self, db_path):
-        db = DatabaseEngine(db_path)
-        await db.initialize()
-        for count in [10, 30, 50]:
-            await db.record_stats("AggServer", count, 70)
+    async def test_get_stats_aggregates_multiple_samples(self, db_path, db):
+        import time
+        now = int(time.time())
+        for i, count in enumerate([10, 30, 50]):
+            await db.record_stats("AggServer", count, 70, ts=now - 300 + i * 90)
         stats = await db.get_stats("AggServer", hours=24)
         assert stats["peak"] == 50
         assert stats["low"] == 10
         assert stats["current"] == 50
         assert stats["samples"] == 3
-        assert stats["avg"] == round((10 + 30 + 50) / 3, 1)
-
-    async def test_get_stats_returns_none_for_unknown_server(self, db_path):
-        db = DatabaseEngine(db_path)
-        await db.initialize()
+        # Time-weighted: 10 and 30 each stood 90 s; the newest 50 has not stood yet.
+        assert stats["avg"] == round((10 * 90 + 30 * 90) / 180, 1)
+
+    async def test_record_stats_many_writes_one_tick(self, db):
+        await db.record_stats_many([("BatchA", 11, 70), ("BatchB", 22, 70)])
+        await db.record_stats_many([])
+        assert (await db.get_stats("BatchA"))["current"] == 11
+        assert (await db.get_stats("BatchB"))["current"] == 22
+
+    async def test_latest_sample_tracks_writes_in_memory(self, db):
+        assert db.latest_sample("FreshServer") is None
+        await db.record_stats("FreshServer", 5, 70, ts=1_700_000_000)
+        await db.record_stats("FreshServer", 6, 70, ts=1_700_000_090)
+        assert db.latest_sample("FreshServer") == 1_700_000_090
+
+    async def test_get_stats_returns_none_for_unknown_server(self, db_path, db):
         result = await db.get_stats("DoesNotExist", hours=24)
         assert result is None
 
-    async def test_get_timeseries_returns_none_for_empty_server(self, db_path):
-        db = DatabaseEngine(db_path)
-        await db.initialize()
+    async def test_get_timeseries_returns_none_for_empty_server(self, db_path, db):
         result = await db.get_timeseries("EmptyServer", hours=24)
         assert result is None
 
-    async def test_get_timeseries_returns_ordered_rows(self, db_path):
-        db = DatabaseEngine(db_path)
-        await db.initialize()
-        await db.record_stats("PopServer", 10, 70)
-        await db.record_stats("PopServer", 20, 70)
+    async def test_get_timeseries_returns_ordered_rows(self, db_path, db):
+        import time
+        now = int(time.time())
+        await db.record_stats("PopServer", 10, 70, ts=now - 90)
+        await db.record_stats("PopServer", 20, 70, ts=now)
         rows = await db.get_timeseries("PopServer", hours=24)
         assert rows is not None
         assert len(rows) == 2
         counts = [r[1] for r in rows]
         assert counts == [10, 20], "Timeseries should be ordered oldest-first"
 
-    async def test_get_timeseries_excludes_old_data(self, db_path):
+    async def test_get_timeseries_excludes_old_data(self, db_path, db):
         """Rows older than the requested window should not appear."""
-        import aiosqlite
-        db = DatabaseEngine(db_path)
-        await db.initialize()
-        # Insert a row timestamped 48 hours ago manually
-        async with aiosqlite.connect(db_path) as conn:
-            await conn.execute(
-                "INSERT INTO server_stats (server_name, player_count, max_players, timestamp) "
-                "VALUES (?, ?, ?, datetime('now', '-48 hours'))",
-                ("StaleServer", 99, 70),
-            )
-            await conn.commit()
+        import time
+        await db.record_stats("StaleServer", 99, 70, ts=int(time.time()) - 48 * 3600)
         result = await db.get_timeseries("StaleServer", hours=24)
         assert result is None, "Old rows outside the window should be excluded"
 
+    async def test_initialize_migrates_v1_table(self, db_path, monkeypatch):
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE server_stats (id INTEGER PRIMARY KEY AUTOINCREMENT, server_name TEXT, "
+                     "player_count INTEGER, max_players INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        conn.executemany(
+            "INSERT INTO server_stats (server_name, player_count, max_players, timestamp) "
+            "VALUES (?, ?, ?, datetime('now', ?))",
+            [("LegacyServer", 12, 70, "-2 hours"), ("LegacyServer", 18, 70, "-1 hours"),
+             ("OtherServer", 3, 70, "-30 minutes")],
+        )
+        conn.commit()
+        conn.close()
+
+        # v1 → v5 frees pages twice and changes auto_vacuum, but rewrites the file once.
+        statements = []
+        open_ = DatabaseEngine._open
+        async def traced_open(self):
+            conn = await open_(self)
+            await conn.set_trace_callback(statements.append)
+            return conn
+        monkeypatch.setattr(DatabaseEngine, "_open", traced_open)
+
+        engine = DatabaseEngine(db_path)
+        await engine.initialize()
+        try:
+            assert statements.count("VACUUM") == 1
+            rows = await engine.get_timeseries("LegacyServer", hours=24)
+            assert [r[1] for r in rows] == [12, 18]
+            assert rows[0][0] < rows[1][0]
+            assert (await engine.get_stats("OtherServer"))["current"] == 3
+        finally:
+            await engine.close()
+
+        conn = sqlite3.connect(db_path)
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        conn.close()
+        assert "server_stats_v1" not in tables
+        assert auto_vacuum == 2
+
+    async def test_rollups_match_raw_aggregates(self, db):
+        import random
+        import time
+        rng = random.Random(5)
+        now = int(time.time())
+        samples = [(now - i * 900, rng.randint(0, 70)) for i in reversed(range(3 * 96))]  # 3 days @ 15 min
+        for ts, count in samples:
+            await db.record_stats("RollServer", count, 70, ts=ts)
+
+        cutoff = now - 50 * 3600
+        stats = await db.get_stats("RollServer", hours=50)
+        window = [c for ts, c in samples if ts > cutoff]
+        # Each sample stands until the next, capped at RUN_MAX_GAP, and only counts after cutoff.
+        held = [(c, max(0, min(nxt - ts, db.RUN_MAX_GAP) - max(0, cutoff - ts)))
+                for (ts, c), (nxt, _) in zip(samples, samples[1:])]
+        assert stats["samples"] == len(window)
+        assert stats["avg"] == round(sum(c * h for c, h in held) / sum(h for _, h in held), 1)
+        assert stats["peak"] == max(window) and stats["low"] == min(window)
+        assert stats["current"] == samples[-1][1]
+
+    @staticmethod
+    async def _runs(db, name):
+        async with db._read() as conn:
+            async with conn.execute(
+                "SELECT p.ts, p.last_ts, p.player_count, p.samples, p.seconds FROM server_stats p "
+                "JOIN servers s ON s.server_id = p.server_id WHERE s.name = ? ORDER BY p.ts", (name,)
+            ) as cur:
+                return [tuple(r) for r in await cur.fetchall()]
+
+    async def test_unchanged_samples_extend_one_run(self, db):
+        import time
+        t0 = int(time.time()) // 3600 * 3600 - 3 * 3600
+        for i in range(40):
+            await db.record_stats("FlatServer", 5, 70, ts=t0 + i * 90)
+        await db.record_stats("FlatServer", 5, 70, ts=t0 + 3600)        # next hour: new run
+        await db.record_stats("FlatServer", 7, 70, ts=t0 + 3690)        # count changed
+        await db.record_stats("FlatServer", 7, 70, ts=t0 + 3690 + 3600)  # after a long silence
+        await db.record_stats("FlatServer", 9, 70, ts=t0 + 3600)        # stale: ignored
+
+        assert await self._runs(db, "FlatServer") == [
+            (t0,        t0 + 3510, 5, 40, 40 * 90),
+            (t0 + 3600, t0 + 3600, 5, 1, 90),
+            (t0 + 3690, t0 + 3690, 7, 1, db.RUN_MAX_GAP),
+            (t0 + 7290, t0 + 7290, 7, 1, 0),
+        ]
+        assert await db.get_timeseries("FlatServer") == [
+            (t0, 5), (t0 + 3510, 5), (t0 + 3600, 5), (t0 + 3690, 7), (t0 + 7290, 7),
+        ]
+        assert (await db.get_stats("FlatServer"))["samples"] == 43
+        assert db.latest_sample("FlatServer") == t0 + 7290
+
+    async def test_averages_are_time_weighted(self, db):
+        import time
+        t0 = int(time.time()) // 3600 * 3600 - 3 * 3600
+        # Empty for 50 minutes, full for the last 10: 10 players on average,
+        # although 3 of the 13 samples read 60.
+        counts = [0] * 10 + [60] * 3
+        for i, count in enumerate(counts):
+            await db.record_stats("SpikeServer", count, 70, ts=t0 + i * 300)
+        stats = await db.get_stats("SpikeServer")
+        assert stats["samples"] == 13
+        assert stats["avg"] == 10.0
+
+    async def test_initialize_folds_v3_samples_into_runs(self, db_path):
+        import sqlite3
+        import time
+        t0 = int(time.time()) // 3600 * 3600 - 3 * 3600
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE servers (server_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+        conn.execute("CREATE TABLE server_stats (server_id INTEGER NOT NULL, ts INTEGER NOT NULL, "
+                     "player_count INTEGER NOT NULL, max_players INTEGER NOT NULL, "
+                     "PRIMARY KEY (server_id, ts)) WITHOUT ROWID")
+        for table in ("server_stats_1h", "server_stats_1d"):
+            conn.execute(f"CREATE TABLE {table} (server_id INTEGER NOT NULL, bucket INTEGER NOT NULL, "
+                         "samples INTEGER NOT NULL, total INTEGER NOT NULL, low INTEGER NOT NULL, "
+                         "peak INTEGER NOT NULL, PRIMARY KEY (server_id, bucket)) WITHOUT ROWID")
+        conn.execute("INSERT INTO servers (server_id, name) VALUES (1, 'OldServer')")
+        counts = [4] * 30 + [6] * 10
+        conn.executemany("INSERT INTO server_stats VALUES (1, ?, ?, 70)",
+                         [(t0 + i * 90, c) for i, c in enumerate(counts)])
+        conn.execute("PRAGMA user_version=3")
+        conn.commit()
+        conn.close()
+
+        engine = DatabaseEngine(db_path)
+        await engine.initialize()
+        try:
+            assert await self._runs(engine, "OldServer") == [
+                (t0,        t0 + 29 * 90, 4, 30, 30 * 90),
+                (t0 + 2700, t0 + 39 * 90, 6, 10, 9 * 90),
+            ]
+            stats = await engine.get_stats("OldServer")
+            assert stats["samples"] == 40 and stats["current"] == 6
+            assert stats["avg"] == round((4 * 30 * 90 + 6 * 9 * 90) / (39 * 90), 1)
+            # Samples keep extending the converted run.
+            await engine.record_stats("OldServer", 6, 70, ts=t0 + 3570)
+            assert (await self._runs(engine, "OldServer"))[-1][:4] == (t0 + 2700, t0 + 3570, 6, 11)
+        finally:
+            await engine.close()
+
+        conn = sqlite3.connect(db_path)
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        conn.close()
+        assert "server_stats_v3" not in tables and "server_stats_15m" in tables
+        assert auto_vacuum == 2, "an existing file should be converted to incremental auto-vacuum"
+        assert version == DatabaseEngine.STATS_SCHEMA_VERSION == 5
+
+    async def test_quarter_hour_rollup_matches_samples(self, db):
+        import time
+        t0 = int(time.time()) // 3600 * 3600 - 3 * 3600
+        for i, count in enumerate([2] * 10 + [8] * 10):
+            await db.record_stats("QuarterServer", count, 70, ts=t0 + i * 90)
+        async with db._read() as conn:
+            async with conn.execute(
+                "SELECT bucket, samples, total, low, peak, seconds, weighted FROM server_stats_15m ORDER BY bucket"
+            ) as cur:
+                rows = [tuple(r) for r in await cur.fetchall()]
+        # Samples at 0..810 s fall in the first quarter, 900..1710 s in the second;
+        # the 2→8 boundary run is credited to the quarter its last sample fell in.
+        assert rows == [
+            (t0,       10, 20, 2, 2, 10 * 90, 2 * 10 * 90),
+            (t0 + 900, 10, 80, 8, 8, 9 * 90,  8 * 9 * 90),
+        ]
+
+    async def test_maintenance_expires_tiers_in_batches(self, db, monkeypatch):
+        import time
+        now = int(time.time()) // 3600 * 3600
+        old = now - 40 * 86400
+        # Alternating counts, so every sample is its own run.
+        for i in range(60):
+            await db.record_stats("OldTier", 10 + i % 2, 70, ts=old + i * 90)
+        await db.record_stats("OldTier", 20, 70, ts=now - 3600)
+        before = await db.get_stats("OldTier", hours=41 * 24)
+
+        monkeypatch.setattr(DatabaseEngine, "MAINTENANCE_BATCH", 7)
+        done = await db.maintain_stats(raw_days=14, quarter_days=30, now=now)
+        assert done["runs"] == 60
+        assert done["quarters"] == 6
+
+        assert [r[0] for r in await self._runs(db, "OldTier")] == [now - 3600]
+        async with db._read() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM server_stats_15m") as cur:
+                assert (await cur.fetchone())[0] == 1
+            async with conn.execute("SELECT COUNT(*) FROM server_stats_1h") as cur:
+                assert (await cur.fetchone())[0] == 3
+            async with conn.execute("PRAGMA auto_vacuum") as cur:
+                assert (await cur.fetchone())[0] == 2
+
+        # Hourly and daily rollups outlive the runs, so long windows still count them.
+        after = await db.get_stats("OldTier", hours=41 * 24)
+        assert after["samples"] == before["samples"] == 61
+        assert after["avg"] == before["avg"]
+        assert after["current"] == 20
+        # The open run survived and keeps extending.
+        await db.record_stats("OldTier", 20, 70, ts=now - 3510)
+        assert (await self._runs(db, "OldTier"))[0][:2] == (now - 3600, now - 3510)
+
+    async def test_maintenance_vacuums_whole_batches_of_pages(self, db, monkeypatch):
+        import time
+        now = int(time.time()) // 3600 * 3600
+        old = now - 40 * 86400
+        await db.record_stats("BulkTier", 5, 70, ts=now - 3600)
+        async with db._write() as conn:
+            sid = (await db._server_ids(conn, ["BulkTier"]))["BulkTier"]
+            await conn.executemany(
+                "INSERT INTO server_stats (server_id, ts, last_ts, player_count, max_players, samples, seconds) "
+                "VALUES (?, ?, ?, ?, 70, 1, 0)",
+                [(sid, old + i, old + i, i % 50) for i in range(20_000)],
+            )
+            await conn.commit()
+
+        steps = []
+        await db._writer.set_trace_callback(
+            lambda sql: steps.append(sql) if "incremental_vacuum" in sql else None)
+        monkeypatch.setattr(DatabaseEngine, "VACUUM_PAGES", 16)
+        done = await db.maintain_stats(raw_days=14, quarter_days=30, now=now)
+        await db._writer.set_trace_callback(None)
+
+        assert done["runs"] == 20_000
+        # Each step frees a whole batch, not one page per write transaction.
+        assert done["pages"] > 3 * 16
+        assert len(steps) <= -(-done["pages"] // 16)
+        async with db._read() as conn:
+            async with conn.execute("PRAGMA freelist_count") as cur:
+                assert (await cur.fetchone())[0] == 0
+
+    async def test_long_windows_read_the_coarsest_rollup(self, db):
+        import time
+        t0 = int(time.time()) // 3600 * 3600 - 3 * 3600
+        # Two hours: 10 players for the first 45 minutes of each, then 30.
+        for i in range(24):
+            await db.record_stats("PyramidServer", 10 if i % 12 < 9 else 30, 70, ts=t0 + i * 300)
+        await db.record_stats("PyramidServer", 30, 70, ts=t0 + 7200)
+
+        assert DatabaseEngine._series_level(24, 500) is None
+        assert DatabaseEngine._series_level(24 * 7, 500) == ("server_stats_15m", 900)
+        assert DatabaseEngine._series_level(24 * 30, 500) == ("server_stats_1h", 3600)
+
+        assert len(await db.get_timeseries("PyramidServer", hours=4)) > 4
+        # Buckets carry their low and peak, so the jump to 30 survives the average.
+        assert await db.get_timeseries("PyramidServer", hours=4, points=4) == [
+            (t0, 15.0, 10, 30), (t0 + 3600, 15.0, 10, 30), (t0 + 7200, 30.0, 30, 30),
+        ]
+        quarters = await db.get_timeseries("PyramidServer", hours=4, points=16)
+        assert [r[1] for r in quarters[:4]] == [10.0, 10.0, 10.0, 30.0]
+        assert await db.get_timeseries("Nobody", hours=4, points=4) is None
+        assert db.latest_sample("PyramidServer") == t0 + 7200
+
+    async def test_quiet_window_uses_hour_of_day(self, db):
+        import time
+        now = int(time.time())
+        day0 = now - now % 86400 - 2 * 86400
+        for day in range(2):
+            for hour in range(24):
+                for minute in (0, 20, 40):
+                    pop = 1 if hour == 9 else 30
+                    await db.record_stats("QuietServer", pop, 70, ts=day0 + day * 86400 + hour * 3600 + minute * 60)
+        window = await db.get_quiet_window("QuietServer")
+        assert window["hour_utc"] == 9
+        assert window["avg_pop"] == 1.0
+        assert window["samples"] == 6
+
+        targets = await db.get_scout_targets(min_avg=3.0)
+        assert targets[0]["server_name"] == "QuietServer"
+        assert targets[0]["total_samples"] == 144
+
+        combined = await db.get_scout_targets_with_windows(min_avg=3.0)
+        assert combined[0]["server_name"] == "QuietServer"
+        assert combined[0]["weekly_avg"] == targets[0]["weekly_avg"]
+        assert combined[0]["window"] == window
+
+    async def test_scout_targets_with_windows_respects_limit(self, db):
+        import time
+        now = int(time.time())
+        for i in reversed(range(30)):
+            await db.record_stats_many([(f"Srv{n}", 10 + n, 70) for n in range(12)], ts=now - i * 600)
+        ranked = await db.get_scout_targets_with_windows(min_avg=3.0, min_samples=24, limit=5)
+        assert [r["server_name"] for r in ranked] == [f"Srv{n}" for n in range(11, 6, -1)]
+        assert all(r["window"] is not None for r in ranked)
+
+    async def test_initialize_enables_wal(self, db):
+        async with db._read() as conn:
+            async with conn.execute("PRAGMA journal_mode") as cur:
+                row = await cur.fetchone()
+        assert row[0] == "wal"
+
+    async def test_concurrent_reads_share_pool(self, db):
+        import asyncio
+        await db.record_stats("PoolServer", 7, 70)
+        results = await asyncio.gather(*(db.get_stats("PoolServer") for _ in range(10)))
+        assert all(r["current"] == 7 for r in results)
+        assert db._idle.qsize() == Config.DB_READ_POOL_SIZE
+
+    async def test_close_is_idempotent(self, db_path):
+        engine = DatabaseEngine(db_path)
+        await engine.initialize()
+        await engine.close()
+        await engine.close()
+
+    async def test_favorites_are_single_row_writes(self, db):
+        assert await db.add_favorite(1, "2154")
+        assert await db.add_favorite(1, "2018")
+        assert not await db.add_favorite(1, "2154")
+        assert await db.get_favorites(1) == ["2154", "2018"]
+        assert await db.remove_favorite(1, "2154")
+        assert not await db.remove_favorite(1, "2154")
+        assert await db.get_favorites(1) == ["2018"]
+        assert await db.get_favorites(2) == []
+
+    async def test_pop_alerts_are_single_row_writes(self, db):
+        assert await db.set_pop_alert(1, "2154", 10, channel_id=100)
+        assert await db.set_pop_alert(2, "2154", 20, channel_id=200)
+        assert await db.set_pop_alert(3, "2018", 10, channel_id=300)
+        assert [a["user_id"] for a in await db.get_pop_alerts("2154")] == [1, 2]
+
+        await db.set_pop_alerts_triggered([(True, 2, "2154")])
+        assert [a["triggered"] for a in await db.get_pop_alerts("2154")] == [0, 1]
+
+        # Re-setting keeps the original channel and re-arms the alert.
+        assert not await db.set_pop_alert(2, "2154", 3, channel_id=999)
+        alert = next(a for a in await db.get_pop_alerts("2154") if a["user_id"] == 2)
+        assert (alert["threshold"], alert["channel_id"], alert["triggered"]) == (3, 200, 0)
+        assert await db.remove_pop_alert(2, "2154")
+        assert not await db.remove_pop_alert(2, "2154")
+        assert len(await db.get_all_pop_alerts()) == 2
+
+    async def test_triggered_flags_are_written_behind(self, db_path, db):
+        import asyncio
+        await db.set_pop_alert(1, "2154", 10, channel_id=100)
+        await db.set_pop_alert(2, "2154", 20, channel_id=200)
+        await db.set_pop_alert(3, "2018", 10, channel_id=300)
+        triggered = lambda name: db.get_pop_alerts(name)
+
+        db.queue_pop_alerts_triggered([(True, 1, "2154"), (True, 2, "2154")], delay=0.05)
+        db.queue_pop_alerts_triggered([(False, 1, "2154"), (True, 3, "2018")], delay=0.05)
+        assert [a["triggered"] for a in await triggered("2154")] == [0, 0]   # nothing written yet
+        await asyncio.sleep(0.2)
+        assert [a["triggered"] for a in await triggered("2154")] == [0, 1]   # newest state per alert
+        assert [a["triggered"] for a in await triggered("2018")] == [1]
+
+        # Re-arming drops a queued flip; close() writes the rest.
+        db.queue_pop_alerts_triggered([(True, 1, "2154"), (False, 3, "2018")])
+        await db.set_pop_alert(1, "2154", 5, channel_id=100)
+        await db.close()
+        reopened = DatabaseEngine(db_path)
+        await reopened.initialize()
+        try:
+            assert [a["triggered"] for a in await reopened.get_pop_alerts("2154")] == [0, 1]
+            assert [a["triggered"] for a in await reopened.get_pop_alerts("2018")] == [0]
+        finally:
+            await reopened.close()
+
+    async def test_monitors_roundtrip(self, db):
+        await db.set_monitor("2154", channel_id=1, message_id=2, vc_id=None)
+        await db.set_monitor("2154", channel_id=1, message_id=3, vc_id=4)
+        assert await db.get_monitors() == {"2154": {"message_id": 3, "channel_id": 1, "vc_id": 4}}
+        await db.remove_monitor("2154")
+        assert await db.get_monitors() == {}
+
+    async def test_import_json_state_runs_once(self, db, tmp_path):
+        import json
+        paths = {name: tmp_path / f"{name}.json" for name in ("monitors", "favorites", "pop_alerts")}
+        paths["monitors"].write_text(json.dumps({"2154": {"message_id": 2, "channel_id": 1, "vc_id": None}}))
+        paths["favorites"].write_text(json.dumps({"42": ["2473", "2680"]}))
+        paths["pop_alerts"].write_text(json.dumps({"42": [
+            {"server": "2154", "threshold": 8, "channel_id": 5, "triggered": True}]}))
+        args = [str(paths[n]) for n in ("monitors", "favorites", "pop_alerts")]
+
+        await db.import_json_state(*args)
+        await db.import_json_state(*args)
+        assert await db.get_monitors() == {"2154": {"message_id": 2, "channel_id": 1, "vc_id": None}}
+        assert await db.get_favorites(42) == ["2473", "2680"]
+        assert (await db.get_pop_alerts("2154"))[0]["triggered"] == 1
+        for path in paths.values():
+            assert not path.exists()
+            assert path.with_name(path.name + ".imported").exists()
+
 
 # ===========================================================================
-# COG INSTANTIATION — only cogs that don't call tasks.start() in __init__
-# ARKCog is excluded: its __init__ fires network task loops immediately
+# ARK COG — mocked Discord objects, temp database and fleet history
+# ===========================================================================
+
+class TestARKCog:
+
+    @pytest.fixture
+    async def cog(self, tmp_path):
+        from ARK import ARKCog
+        from cogs.fleet_history import FleetHistory
+        cog = ARKCog(make_bot())
+        cog.db = DatabaseEngine(str(tmp_path / "cog.db"))
+        await cog.db.initialize()
+        cog.history = FleetHistory(str(tmp_path / "fleet"))
+        cog.history.open()
+        yield cog
+        await cog.bus.close()
+        cog.rest.close()
+        cog.history.shutdown()
+        await cog.db.close()
+
+    @staticmethod
+    def _not_found():
+        from types import SimpleNamespace
+        return discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), {"message": "Unknown Message"})
+
+    async def _monitor_tick(self, cog, handle_edit, fetch_message):
+        """One update_monitors tick for a monitor on 2154, with the message handle and channel mocked."""
+        from unittest.mock import MagicMock
+        from cogs.server_snapshot import ServerSnapshot
+        await cog.db.set_monitor("2154", 10, 20, None)
+        cog.monitors = await cog.db.get_monitors()
+        handle = MagicMock(id=20, edit=handle_edit)
+        cog.bot.get_partial_messageable = MagicMock(
+            return_value=MagicMock(get_partial_message=MagicMock(return_value=handle)))
+        cog.bot.get_channel = MagicMock(return_value=MagicMock(fetch_message=fetch_message))
+        snapshot = ServerSnapshot([{"Name": "NA-PVP-TheIsland2154", "NumPlayers": 40, "MaxPlayers": 70}])
+        await cog.update_monitors(snapshot, snapshot.diff(ServerSnapshot()))
+        await cog.rest.drain()
+
+    async def test_monitor_edit_goes_straight_to_the_handle(self, cog):
+        from unittest.mock import AsyncMock
+        edit, fetch = AsyncMock(), AsyncMock()
+        await self._monitor_tick(cog, edit, fetch)
+        edit.assert_awaited_once()
+        fetch.assert_not_awaited()
+        assert "2154" in cog._monitor_state
+
+    async def test_monitor_404_is_reconciled_by_fetch(self, cog):
+        from unittest.mock import AsyncMock, MagicMock
+        message = MagicMock(edit=AsyncMock())
+        fetch = AsyncMock(return_value=message)
+        await self._monitor_tick(cog, AsyncMock(side_effect=self._not_found()), fetch)
+        fetch.assert_awaited_once_with(20)
+        message.edit.assert_awaited_once()
+        # A transient 404 on the unverified handle keeps the monitor, now on the fetched message.
+        assert "2154" in cog.monitors and "2154" in await cog.db.get_monitors()
+        assert cog._message_handles["2154"] is message
+
+    async def test_monitor_404_twice_removes_it(self, cog):
+        from unittest.mock import AsyncMock
+        fetch = AsyncMock(side_effect=self._not_found())
+        await self._monitor_tick(cog, AsyncMock(side_effect=self._not_found()), fetch)
+        fetch.assert_awaited_once_with(20)
+        assert "2154" not in cog.monitors
+        assert "2154" not in await cog.db.get_monitors()
+        assert "2154" not in cog._message_handles
+
+    @staticmethod
+    def _channels(*ids, send=None):
+        from unittest.mock import AsyncMock, MagicMock
+        return {cid: MagicMock(id=cid, send=send or AsyncMock()) for cid in ids}
+
+    async def test_pop_alerts_send_one_packed_message_per_channel(self, cog):
+        from unittest.mock import MagicMock
+        from cogs.pop_alerts import PopAlertIndex
+        from cogs.server_snapshot import ServerSnapshot
+        for uid, server, threshold, channel in ((1, "2154", 10, 100), (2, "2154", 20, 100),
+                                                (3, "2018", 10, 100), (4, "2154", 30, 200),
+                                                (5, "2018", 2, 100)):
+            await cog.db.set_pop_alert(uid, server, threshold, channel)
+        cog.alerts = PopAlertIndex(await cog.db.get_all_pop_alerts())
+        chans = self._channels(100, 200)
+        cog.bot.get_channel = MagicMock(side_effect=chans.get)
+
+        snapshot = ServerSnapshot([{"Name": "NA-PVP-TheIsland2154", "NumPlayers": 5},
+                                   {"Name": "NA-PVP-Ragnarok2018", "NumPlayers": 4}])
+        await cog.check_pop_alerts(snapshot, snapshot.diff(ServerSnapshot()))
+        await cog.rest.drain()
+
+        chans[100].send.assert_awaited_once()
+        content = chans[100].send.await_args.args[0]
+        assert "**2154**" in content and "**2018**" in content
+        assert all(f"<@{uid}>" in content for uid in (1, 2, 3)) and "<@5>" not in content
+        chans[200].send.assert_awaited_once()
+
+        # Flags are written behind; flushing persists exactly the triggered ones.
+        await cog.db.flush_state()
+        flags = {a["user_id"]: a["triggered"] for a in await cog.db.get_all_pop_alerts()}
+        assert flags == {1: 1, 2: 1, 3: 1, 4: 1, 5: 0}
+
+        # An unchanged population sends nothing more.
+        await cog.check_pop_alerts(snapshot, snapshot.diff(snapshot))
+        await cog.rest.drain()
+        assert chans[100].send.await_count == 1
+
+    async def test_alert_send_retries_transient_failures(self, cog, monkeypatch):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        server_error = lambda: discord.DiscordServerError(SimpleNamespace(status=503, reason="Unavailable"), "")
+        monkeypatch.setattr(Config, "ALERT_SEND_ATTEMPTS", 3)
+
+        flaky = self._channels(1, send=AsyncMock(side_effect=[server_error(), None]))[1]
+        cog._send_alert(flaky, "alert")
+        await cog.rest.drain()
+        assert flaky.send.await_count == 2
+
+        down = self._channels(2, send=AsyncMock(side_effect=server_error()))[2]
+        cog._send_alert(down, "alert")
+        await cog.rest.drain()
+        assert down.send.await_count == 3                       # gives up after ALERT_SEND_ATTEMPTS
+
+        forbidden = discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Access")
+        denied = self._channels(3, send=AsyncMock(side_effect=forbidden))[3]
+        cog._send_alert(denied, "alert")
+        await cog.rest.drain()
+        assert denied.send.await_count == 1                     # a 4xx is not retried
+
+    async def test_unchanged_feed_republishes_a_heartbeat(self, cog):
+        from unittest.mock import AsyncMock
+        from cogs.server_snapshot import ServerSnapshot
+        seen = []
+        async def handler(snapshot, diff): seen.append((snapshot, diff))
+        cog.bus.subscribe("snapshot", handler)
+        cog.snapshot = ServerSnapshot([{"Name": "NA-PVP-TheIsland2154", "NumPlayers": 40}])
+        cog.feed.fetch = AsyncMock(return_value=None)      # 304 / identical body
+        cog._published_at = 1000.0
+
+        cog.feed.confirmed_at = 1000.0 + Config.SNAPSHOT_HEARTBEAT - 1
+        await cog.sync_cache()
+        await cog.bus.drain()
+        assert seen == []
+
+        cog.feed.confirmed_at = 1000.0 + Config.SNAPSHOT_HEARTBEAT
+        await cog.sync_cache()
+        await cog.bus.drain()
+        assert len(seen) == 1 and seen[0][0] is cog.snapshot and not seen[0][1]
+
+        # An unreachable feed confirms nothing, so stale data is not republished.
+        await cog.sync_cache()
+        await cog.bus.drain()
+        assert len(seen) == 1
+        assert Config.SNAPSHOT_HEARTBEAT + Config.OFFICIAL_POLL_MAX < DatabaseEngine.RUN_MAX_GAP
+
+    async def test_popgraph_cache_follows_the_source_that_fed_it(self, cog):
+        import time
+        from unittest.mock import AsyncMock
+        cog.charts.submit = AsyncMock(return_value=b"\x89PNG")
+        graph = lambda server: cog.popgraph.callback(cog, make_interaction(), server, 24)
+        now = int(time.time())
+        for i, pop in enumerate((10, 12, 15)):
+            await cog.db.record_stats("2154", pop, 70, ts=now - 600 + i * 90)
+            cog.history.append(now - 600 + i * 90, [("FleetOnly", pop)])
+
+        # Monitored: a new fleet row does not invalidate a chart drawn from SQLite.
+        await graph("2154")
+        cog.history.append(now - 300, [("FleetOnly", 20)])
+        await graph("2154")
+        assert cog.charts.submit.await_count == 1
+        await cog.db.record_stats("2154", 16, 70, ts=now - 300)
+        await graph("2154")
+        assert cog.charts.submit.await_count == 2
+
+        # Fleet fallback: invalidated by new fleet rows only.
+        await graph("FleetOnly")
+        await graph("FleetOnly")
+        assert cog.charts.submit.await_count == 3
+        cog.history.append(now - 200, [("FleetOnly", 21)])
+        await graph("FleetOnly")
+        assert cog.charts.submit.await_count == 4
+
+    async def test_popgraph_cache_hits_for_a_single_db_sample(self, cog):
+        import time
+        from unittest.mock import AsyncMock
+        cog.charts.submit = AsyncMock(return_value=b"\x89PNG")
+        graph = lambda server: cog.popgraph.callback(cog, make_interaction(), server, 24)
+        now = int(time.time())
+        for i, pop in enumerate((10, 12, 15)):
+            cog.history.append(now - 600 + i * 90, [("OneSample", pop)])
+        await cog.db.record_stats("OneSample", 30, 70, ts=now - 600)
+
+        # One SQLite sample is too little to graph, so fleet history feeds the chart.
+        await graph("OneSample")
+        await graph("OneSample")
+        assert cog.charts.submit.await_count == 1
+        assert cog.charts.submit.await_args.args[4] == [10, 12, 15]
+        cog.history.append(now - 300, [("OneSample", 16)])
+        await graph("OneSample")
+        assert cog.charts.submit.await_count == 2
+
+        # A second sample makes SQLite the source; fleet rows stop mattering.
+        await cog.db.record_stats("OneSample", 31, 70, ts=now - 200)
+        await graph("OneSample")
+        assert cog.charts.submit.await_count == 3
+        assert cog.charts.submit.await_args.args[4] == [30, 31]
+        cog.history.append(now - 100, [("OneSample", 17)])
+        await graph("OneSample")
+        assert cog.charts.submit.await_count == 3
+
+    async def test_popgraph_answers_when_the_render_fails(self, cog):
+        import time
+        from unittest.mock import AsyncMock
+        from concurrent.futures import BrokenExecutor
+        cog.charts.submit = AsyncMock(side_effect=BrokenExecutor("worker died"))
+        now = int(time.time())
+        for i, pop in enumerate((10, 12)):
+            cog.history.append(now - 300 + i * 90, [("FleetOnly", pop)])
+        itxn = make_interaction()
+        await cog.popgraph.callback(cog, itxn, "FleetOnly", 24)
+        assert "failed" in itxn.followup.send.await_args.args[0]
+        assert cog.chart_cache.version(("FleetOnly", 24)) is None
+
+
+# ===========================================================================
+# COG INSTANTIATION — constructors must not touch the network or the database
 # ===========================================================================
 
 class TestCogInstantiation:
 
+    def test_ark_cog_defers_loops_to_cog_load(self):
+        from ARK import ARKCog
+        bot = make_bot()
+        cog = ARKCog(bot)
+        assert cog.bot is bot
+        assert cog.monitors == {}
+        assert not cog.sync_cache.is_running()
+        assert not cog.check_evo.is_running()
+        assert not cog.maintain_stats.is_running()
+        assert not cog.report_metrics.is_running()
+        assert cog.bus.metrics() == {}
+
     def test_tame_stats_cog_instantiates(self):
         from cogs.tame_stats_cog import TameStatsCog
         bot = make_bot()